@@ -13,6 +13,9 @@ class AccommodationForm(forms.Form):
     beds = forms.IntegerField(min_value=1)
     bedrooms = forms.IntegerField(min_value=0)
     address = forms.CharField(widget=forms.Textarea)
+    flat_number = forms.CharField(max_length=10, required=False)
+    floor_number = forms.CharField(max_length=10, required=False)
+    room_number = forms.CharField(max_length=10, required=False)
     latitude = forms.DecimalField(max_digits=9, decimal_places=6)
     longitude = forms.DecimalField(max_digits=9, decimal_places=6)
     available_from = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}))
@@ -1,6 +1,5 @@
 from rest_framework import serializers
 from api.models import Accommodation, Reservation, Rating
-from django.db.models import Avg
 
 class AccommodationSerializer(serializers.ModelSerializer):
     average_rating = serializers.SerializerMethodField()
@@ -10,8 +9,7 @@ class AccommodationSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
     def get_average_rating(self, obj):
-        avg = obj.ratings.aggregate(avg=Avg('value'))['avg'] or 0
-        return round(avg, 2)
+        return obj.average_rating()
 
 
 class ReservationSerializer(serializers.ModelSerializer):
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from api.models import Accommodation, Reservation, Rating
+from api.models import Accommodation, Reservation, Rating, GeocodeJob, EmailOutbox, DuplicateCandidate
 
 @admin.register(Accommodation)
 class AccommodationAdmin(admin.ModelAdmin):
@@ -8,6 +8,7 @@ class AccommodationAdmin(admin.ModelAdmin):
 @admin.register(Reservation)
 class ReservationAdmin(admin.ModelAdmin):
     list_display = ('accommodation', 'student_name', 'start_date', 'end_date', 'status', 'created_at')
+    list_select_related = ('accommodation',)
     list_filter = ('status', 'start_date', 'end_date')
     search_fields = ('accommodation__title', 'student_name')
     ordering = ('-created_at',)
@@ -15,6 +16,28 @@ class ReservationAdmin(admin.ModelAdmin):
 @admin.register(Rating)
 class RatingAdmin(admin.ModelAdmin):
     list_display = ('accommodation', 'student_name', 'value', 'created_at')
+    list_select_related = ('accommodation',)
     list_filter = ('value',)
     search_fields = ('accommodation__title', 'student_name')
     ordering = ('-created_at',)
+
+@admin.register(GeocodeJob)
+class GeocodeJobAdmin(admin.ModelAdmin):
+    list_display = ('accommodation', 'status', 'attempts', 'next_attempt_at', 'created_at')
+    list_select_related = ('accommodation',)
+    list_filter = ('status',)
+    ordering = ('next_attempt_at',)
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'recipient', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    ordering = ('next_attempt_at',)
+
+@admin.register(DuplicateCandidate)
+class DuplicateCandidateAdmin(admin.ModelAdmin):
+    list_display = ('accommodation', 'duplicate_of', 'similarity', 'status', 'created_at')
+    list_select_related = ('accommodation', 'duplicate_of')
+    list_filter = ('status',)
+    list_editable = ('status',)
+    ordering = ('-similarity',)
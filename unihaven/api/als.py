@@ -0,0 +1,157 @@
+"""HTTP client for the ALS address lookup (https://www.als.gov.hk/lookup).
+
+Keeps one keep-alive session for the process, coalesces concurrent lookups of
+the same address and stops calling ALS for a while once it keeps failing.
+The lookup counters and the circuit breaker are kept in the shared cache, so
+`process_geocode_queue --stats` sees what the web and worker processes did.
+"""
+import re
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.core.cache import cache
+from api.counters import SharedCounters
+
+ALS_URL = "https://www.als.gov.hk/lookup"
+TIMEOUT = getattr(settings, 'ALS_TIMEOUT', 10)
+
+SESSION = requests.Session()
+SESSION.headers.update({"Accept": "application/json"})
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """Closed -> open after `failure_threshold` consecutive failures, half-open after `reset_timeout`.
+
+    The failure count and the time the breaker opened live in the shared cache,
+    so every worker process trips, reports and recovers together. Once the
+    timeout has passed, a single caller wins the probe token (cache.add) and
+    tries ALS; everyone else is still rejected until that probe settles.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30, prefix='als:breaker'):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures_key = f"{prefix}:failures"
+        self.opened_key = f"{prefix}:opened_at"
+        self.probe_key = f"{prefix}:probe"
+
+    @property
+    def state(self):
+        opened_at = cache.get(self.opened_key)
+        if opened_at is None:
+            return 'closed'
+        if time.time() - opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def call(self, func, *args):
+        state = self.state
+        if state == 'open':
+            raise CircuitOpen("ALS circuit breaker is open.")
+        if state == 'half_open' and not cache.add(self.probe_key, 1, timeout=self.reset_timeout):
+            raise CircuitOpen("ALS circuit breaker is half-open and another caller is probing.")
+        try:
+            result = func(*args)
+        except Exception:
+            self.record_failure(probing=state == 'half_open')
+            raise
+        if state == 'half_open' or cache.get(self.failures_key):
+            self.reset()
+        return result
+
+    def record_failure(self, probing):
+        try:
+            failures = cache.incr(self.failures_key)
+        except ValueError:
+            cache.add(self.failures_key, 1, timeout=None)
+            failures = 1
+        if probing or failures >= self.failure_threshold:
+            # A failed half-open probe re-opens the breaker for another full timeout
+            cache.set(self.opened_key, time.time(), timeout=None)
+        if probing:
+            cache.delete(self.probe_key)
+
+    def reset(self):
+        cache.delete_many([self.failures_key, self.opened_key, self.probe_key])
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; concurrent callers share its result."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, func, *args):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = {'done': threading.Event(), 'result': None, 'error': None}
+        if not leader:
+            increment('coalesced')
+            call['done'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+        try:
+            call['result'] = func(*args)
+            return call['result']
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call['done'].set()
+
+
+breaker = CircuitBreaker(
+    failure_threshold=getattr(settings, 'ALS_BREAKER_THRESHOLD', 5),
+    reset_timeout=getattr(settings, 'ALS_BREAKER_RESET_SECONDS', 30),
+)
+single_flight = SingleFlight()
+
+counters = SharedCounters(
+    'als:count', ('cache_hits', 'cache_misses', 'coalesced', 'requests', 'errors', 'breaker_rejections'),
+)
+
+
+def increment(name):
+    counters.increment(name)
+
+
+def stats():
+    snapshot = counters.snapshot()
+    snapshot['breaker_state'] = breaker.state
+    return snapshot
+
+
+def reset_stats():
+    counters.reset()
+    breaker.reset()
+
+
+def normalize_address(address):
+    """Lower-case, strip punctuation and collapse whitespace so trivially different spellings share a key."""
+    return " ".join(re.sub(r"[^\w\s]", " ", (address or "").lower()).split())
+
+
+def fetch(address):
+    """Query ALS for one address. Returns (lat, lon, geo_address) or None when nothing matches."""
+    increment('requests')
+    res = SESSION.get(ALS_URL, params={"q": address, "output": "JSON"}, timeout=TIMEOUT)
+    res.raise_for_status()
+    suggestions = res.json().get("SuggestedAddress")
+    if not suggestions:
+        return None
+    premises = suggestions[0]['Address']['PremisesAddress']
+    geo_info = premises['GeospatialInformation']
+    return float(geo_info['Latitude']), float(geo_info['Longitude']), premises.get("GeoAddress", "")
@@ -0,0 +1,57 @@
+"""Per-night bed availability.
+
+Every pending or confirmed Reservation holds one bed in NightOccupancy for each
+night of its stay, [start_date, end_date). Reservation.save() and a pre_delete
+receiver keep the table in step, so "how many beds are free each night" is one
+indexed range scan instead of counting reservations.
+"""
+from datetime import timedelta
+from django.db.models import Max
+
+ACTIVE_STATUSES = ('pending', 'confirmed')
+
+
+def stay_bounds(start, end):
+    """[start, stop) of the nights a stay occupies; a same-day stay still takes one night."""
+    return start, max(end, start + timedelta(days=1))
+
+
+def stay_nights(start, end):
+    start, stop = stay_bounds(start, end)
+    return [start + timedelta(days=i) for i in range((stop - start).days)]
+
+
+def nightly_free_beds(accommodation, start, end):
+    """[(night, free beds)] for every night in [start, end)."""
+    return nightly_free_beds_many({accommodation.pk: accommodation.beds}, start, end)[accommodation.pk]
+
+
+def nightly_free_beds_many(beds_by_id, start, end):
+    """{id: [(night, free beds)]} for many listings with one range query."""
+    from api.models import NightOccupancy
+    start, stop = stay_bounds(start, end)
+    booked = {}
+    rows = NightOccupancy.objects.filter(accommodation_id__in=list(beds_by_id), night__gte=start, night__lt=stop)
+    for pk, night, count in rows.values_list('accommodation_id', 'night', 'booked'):
+        booked[pk, night] = count
+    nights = stay_nights(start, end)
+    return {
+        pk: [(night, max(beds - booked.get((pk, night), 0), 0)) for night in nights]
+        for pk, beds in beds_by_id.items()
+    }
+
+
+def free_beds(accommodation, start, end):
+    """Beds free on every night of [start, end), i.e. how many more stays of those dates fit."""
+    return free_beds_many({accommodation.pk: accommodation.beds}, start, end)[accommodation.pk]
+
+
+def free_beds_many(beds_by_id, start, end):
+    """{id: free beds over [start, end)} for many listings with one grouped query."""
+    from api.models import NightOccupancy
+    start, stop = stay_bounds(start, end)
+    peaks = dict(
+        NightOccupancy.objects.filter(accommodation_id__in=list(beds_by_id), night__gte=start, night__lt=stop)
+        .values('accommodation_id').annotate(peak=Max('booked')).values_list('accommodation_id', 'peak')
+    )
+    return {pk: max(beds - peaks.get(pk, 0), 0) for pk, beds in beds_by_id.items()}
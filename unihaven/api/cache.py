@@ -0,0 +1,147 @@
+"""Versioned response cache for the accommodation filter endpoint.
+
+Entries are keyed on the university, its current generation number and a
+canonical form of the query string. Any Accommodation, Reservation or Rating
+write bumps the generation of every university it touches (see
+api/signals.py), so older entries are never read again and simply expire.
+Nothing is ever scanned or deleted by pattern.
+
+Concurrent misses for the same key are collapsed with a short cache.add()
+lock: one request builds the response, the others wait briefly for it.
+
+Bumps happen after commit and must reach every process, so nothing is cached
+when the default backend is process-local (see settings.CACHES).
+"""
+import hashlib
+import time
+from urllib.parse import urlencode
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from api.counters import SharedCounters
+from api.registry import REGISTRY
+
+FILTER_CACHE_TTL = getattr(settings, 'FILTER_CACHE_TTL', 300)
+LOCK_TTL = 10
+LOCK_WAIT_SECONDS = 2.0
+LOCK_POLL_SECONDS = 0.05
+
+FILTER_PARAMS = (
+    'property_type', 'available_from', 'available_to', 'min_beds', 'min_bedrooms',
+    'min_price', 'max_price', 'campus_label', 'max_distance', 'lat', 'lon', 'limit',
+    'cursor', 'page_size', 'ordering',
+)
+
+_MISSING = object()
+
+counters = SharedCounters('filter:count', ('hits', 'misses', 'waits'))
+
+
+def increment(name):
+    counters.increment(name)
+
+
+def stats():
+    """Hits, misses and lock waits across every process, as printed by `manage.py filter_cache_stats`."""
+    snapshot = counters.snapshot()
+    lookups = snapshot['hits'] + snapshot['misses']
+    snapshot['hit_ratio'] = round(snapshot['hits'] / lookups, 3) if lookups else 0.0
+    return snapshot
+
+
+def reset_stats():
+    counters.reset()
+
+
+def is_shared():
+    """False for backends that live in one process, where other workers would never see a bump."""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def generation_key(university):
+    return f"filter:gen:{university}"
+
+
+def generation(university):
+    key = generation_key(university)
+    value = cache.get(key)
+    if value is None:
+        # Seed from the clock rather than 1 so an evicted counter can never
+        # come back at a number whose entries are still cached.
+        cache.add(key, time.time_ns(), timeout=None)
+        value = cache.get(key)
+    return value
+
+
+def bump(*universities):
+    """Invalidate the universities' entries once the current transaction commits.
+
+    Bumping earlier would let a concurrent request rebuild the response from
+    pre-commit rows under the new generation and keep serving it.
+    """
+    universities = {u for u in universities if u}
+    if universities:
+        transaction.on_commit(lambda: increment_generations(universities))
+
+
+def increment_generations(universities):
+    for university in universities:
+        try:
+            cache.incr(generation_key(university))
+        except ValueError:
+            cache.add(generation_key(university), time.time_ns(), timeout=None)
+
+
+def bump_all():
+    bump(*REGISTRY.codes())
+
+
+def canonical_query(params):
+    """Known filter parameters only, stripped, blank ones dropped, in a fixed order."""
+    pairs = []
+    for name in FILTER_PARAMS:
+        value = (params.get(name) or '').strip()
+        if value:
+            pairs.append((name, value))
+    return urlencode(pairs)
+
+
+def filter_key(university, origin, params):
+    """`origin` is scheme://host: responses carry absolute pagination links, so http and https differ."""
+    digest = hashlib.sha1(f"{origin}?{canonical_query(params)}".encode()).hexdigest()
+    return f"filter:{university}:{generation(university)}:{digest}"
+
+
+def get_or_build(key, build):
+    """Cached value for `key`, calling build() on a miss. build() returns (value, cacheable).
+
+    Without a shared cache backend every call builds.
+    """
+    if not is_shared():
+        return build()[0]
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        increment('hits')
+        return value
+    increment('misses')
+
+    lock_key = f"{key}:lock"
+    if not cache.add(lock_key, 1, timeout=LOCK_TTL):
+        increment('waits')
+        deadline = time.monotonic() + LOCK_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_SECONDS)
+            value = cache.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+        # The builder is slow or died; serve this request uncached rather than keep waiting
+        return build()[0]
+    try:
+        value, cacheable = build()
+        if cacheable:
+            cache.set(key, value, timeout=FILTER_CACHE_TTL)
+        return value
+    finally:
+        cache.delete(lock_key)
@@ -0,0 +1,88 @@
+"""ETag / Last-Modified support for the accommodation endpoints.
+
+A list's validators come from one aggregate over the caller's university scope
+(max(updated_at) and row count) plus the query string, so a 304 costs a single
+query and nothing is serialized. A detail's validators are its id and
+updated_at. PUT/PATCH honour If-Match / If-Unmodified-Since against the row as
+it is locked for the write, so two staff edits cannot silently overwrite each
+other.
+"""
+import hashlib
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.response import Response
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = "The resource has changed since it was fetched."
+    default_code = 'precondition_failed'
+
+
+def collection_validators(queryset, *parts):
+    scope = queryset.order_by().aggregate(last=Max('updated_at'), count=Count('id'))
+    last = scope['last']
+    raw = ":".join(str(p) for p in (*parts, scope['count'], last.isoformat() if last else ""))
+    return quote_etag(hashlib.sha1(raw.encode()).hexdigest()), last
+
+
+def object_validators(pk, updated_at):
+    return quote_etag(f"{pk}-{int(updated_at.timestamp() * 1_000_000)}"), updated_at
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
+def check_preconditions(request, etag, last_modified):
+    """The 304/412 response the request's conditional headers call for, or None to carry on."""
+    return get_conditional_response(
+        request, etag=etag, last_modified=int(last_modified.timestamp()) if last_modified else None
+    )
+
+
+class ConditionalMixin:
+    """Adds validators to list/retrieve and enforces If-Match on update for a ModelViewSet with `updated_at`."""
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        etag, last_modified = collection_validators(queryset, request.user.university, request.get_full_path())
+        response = check_preconditions(request, etag, last_modified)
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+        return set_validators(response, etag, last_modified)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        etag, last_modified = object_validators(instance.pk, instance.updated_at)
+        response = check_preconditions(request, etag, last_modified)
+        if response is None:
+            response = Response(self.get_serializer(instance).data)
+        return set_validators(response, etag, last_modified)
+
+    def update(self, request, *args, **kwargs):
+        response = super().update(request, *args, **kwargs)
+        return set_validators(response, *self.saved_validators)
+
+    def perform_update(self, serializer):
+        instance = serializer.instance
+        with transaction.atomic():
+            current = (
+                type(instance).objects.select_for_update()
+                .filter(pk=instance.pk).values_list('updated_at', flat=True).first()
+            )
+            if current is None:
+                # Deleted after get_object() read it
+                raise NotFound()
+            early = check_preconditions(self.request, *object_validators(instance.pk, current))
+            if early is not None:
+                raise PreconditionFailed()
+            super().perform_update(serializer)
+        self.saved_validators = object_validators(instance.pk, instance.updated_at)
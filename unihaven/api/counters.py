@@ -0,0 +1,38 @@
+"""Named counters kept in the default cache so every process adds to, and reports, the same totals.
+
+Management commands such as `process_geocode_queue --stats` run in a process
+of their own, so counters held in module globals would always read zero
+there. With a process-local backend (LocMemCache) the totals are per process
+again, like the filter cache (see settings.CACHES).
+"""
+import threading
+from django.core.cache import cache
+
+
+class SharedCounters:
+    def __init__(self, prefix, names):
+        self.prefix = prefix
+        self.names = tuple(names)
+        # FileBasedCache.incr() is a read then a write; this keeps one process's threads from losing counts
+        self.lock = threading.Lock()
+
+    def key(self, name):
+        return f"{self.prefix}:{name}"
+
+    def increment(self, name, delta=1):
+        key = self.key(name)
+        with self.lock:
+            try:
+                return cache.incr(key, delta)
+            except ValueError:
+                if cache.add(key, delta, timeout=None):
+                    return delta
+                # Another process created it in between
+                return cache.incr(key, delta)
+
+    def snapshot(self):
+        values = cache.get_many([self.key(name) for name in self.names])
+        return {name: values.get(self.key(name), 0) for name in self.names}
+
+    def reset(self):
+        cache.delete_many([self.key(name) for name in self.names])
@@ -0,0 +1,179 @@
+"""Near-duplicate listing detection.
+
+Listings are bucketed by geohash cell (identical coordinates, and so identical
+geo_address, always share one) plus normalized floor and flat. Inside a bucket
+the title and description become a set of character shingles summarised by a
+MinHash signature, and locality-sensitive hashing over signature bands picks
+the candidate pairs; only those are compared. Work grows with bucket sizes,
+never with the square of the table.
+
+Pairs whose estimated similarity reaches NEAR_DUPLICATE_THRESHOLD are stored
+as DuplicateCandidate rows (newer listing -> older one) for staff to confirm
+or dismiss. scan() only revisits listings changed since the previous
+DuplicateScan unless full=True; check_listing() runs the same test for one
+new listing and check_listings() for a batch of imported ones.
+
+Signatures are computed with NumPy when it is installed and in plain Python
+otherwise; both give identical values.
+"""
+import random
+import zlib
+from collections import defaultdict
+from itertools import combinations
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is optional
+    np = None
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from api.als import normalize_address
+from api.models import Accommodation, DuplicateCandidate, DuplicateScan
+
+THRESHOLD = getattr(settings, 'NEAR_DUPLICATE_THRESHOLD', 0.7)
+SHINGLE_SIZE = 3
+NUM_PERM = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+CHUNK_SIZE = 1000
+FIELDS = ('id', 'title', 'description', 'geo_cell', 'floor_number', 'flat_number')
+
+# (a * crc32 + b) mod a prime above 2**32 stays inside uint64
+_PRIME = 4294967311
+_rng = random.Random(1)
+_PERMUTATIONS = [(_rng.randrange(1, 2 ** 31), _rng.randrange(0, 2 ** 31)) for _ in range(NUM_PERM)]
+if np is not None:
+    _A = np.array([a for a, b in _PERMUTATIONS], dtype=np.uint64)
+    _B = np.array([b for a, b in _PERMUTATIONS], dtype=np.uint64)
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    text = normalize_address(text)
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def signature(title, description):
+    """MinHash signature of a listing's text, or None when it has no text."""
+    found = shingles(f"{title} {description}")
+    if not found:
+        return None
+    hashes = [zlib.crc32(s.encode()) for s in found]
+    if np is None:
+        return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS)
+    hashes = np.array(hashes, dtype=np.uint64)
+    return tuple(((hashes[:, None] * _A + _B) % _PRIME).min(axis=0).tolist())
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(x == y for x, y in zip(a, b)) / NUM_PERM
+
+
+def bucket_key(geo_cell, floor_number, flat_number):
+    if not geo_cell:
+        return None
+    return geo_cell, (floor_number or '').strip().lower(), (flat_number or '').strip().lower()
+
+
+def candidate_pairs(signed):
+    """(lower id, higher id) pairs sharing at least one LSH band, from [(id, signature)] in one bucket."""
+    pairs = set()
+    for band in range(BANDS):
+        lo = band * ROWS_PER_BAND
+        groups = defaultdict(list)
+        for pk, sig in signed:
+            groups[sig[lo:lo + ROWS_PER_BAND]].append(pk)
+        for ids in groups.values():
+            pairs.update(combinations(sorted(ids), 2))
+    return pairs
+
+
+def find(rows, threshold=THRESHOLD):
+    """(newer id, older id, similarity) for near-duplicates involving any of `rows` (tuples of FIELDS)."""
+    wanted = {row[0] for row in rows}
+    keys = {bucket_key(*row[3:]) for row in rows} - {None}
+    if not keys:
+        return []
+    buckets = defaultdict(list)
+    members = Accommodation.objects.filter(geo_cell__in={key[0] for key in keys}).values_list(*FIELDS)
+    for pk, title, description, *place in members.iterator():
+        key = bucket_key(*place)
+        if key in keys:
+            sig = signature(title, description)
+            if sig is not None:
+                buckets[key].append((pk, sig))
+
+    found = []
+    for signed in buckets.values():
+        signatures = dict(signed)
+        for older, newer in candidate_pairs(signed):
+            if older not in wanted and newer not in wanted:
+                continue
+            score = similarity(signatures[older], signatures[newer])
+            if score >= threshold:
+                found.append((newer, older, score))
+    return found
+
+
+def flag(found):
+    """Store new DuplicateCandidate rows; pairs already flagged (or dismissed) are left alone."""
+    if not found:
+        return 0
+    existing = set(
+        DuplicateCandidate.objects.filter(accommodation_id__in={newer for newer, older, score in found})
+        .values_list('accommodation_id', 'duplicate_of_id')
+    )
+    new = [
+        DuplicateCandidate(accommodation_id=newer, duplicate_of_id=older, similarity=round(score, 3))
+        for newer, older, score in found if (newer, older) not in existing
+    ]
+    DuplicateCandidate.objects.bulk_create(new, ignore_conflicts=True)
+    return len(new)
+
+
+def check_listing(listing, threshold=THRESHOLD):
+    """Flag near-duplicates of one listing. Ungeocoded listings are left to the next scan()."""
+    if not listing.geo_cell:
+        return 0
+    row = (listing.pk, listing.title, listing.description, listing.geo_cell, listing.floor_number, listing.flat_number)
+    return flag(find([row], threshold))
+
+
+def check_listings(listings, threshold=THRESHOLD):
+    """check_listing() for a batch in one pass. Returns the ids of the listings flagged as re-posts."""
+    rows = [(a.pk, a.title, a.description, a.geo_cell, a.floor_number, a.flat_number) for a in listings if a.geo_cell]
+    if not rows:
+        return set()
+    wanted = {row[0] for row in rows}
+    found = find(rows, threshold)
+    flag(found)
+    return {newer for newer, older, score in found if newer in wanted}
+
+
+def scan(full=False, threshold=THRESHOLD, chunk_size=CHUNK_SIZE):
+    """Flag near-duplicates among listings changed since the last finished scan (all listings if full)."""
+    run = DuplicateScan.objects.create(started_at=timezone.now())
+    changed = Accommodation.objects.exclude(geo_cell='')
+    last = DuplicateScan.objects.filter(finished_at__isnull=False).order_by('-started_at').first()
+    if last and not full:
+        changed = changed.filter(updated_at__gte=last.started_at)
+
+    # Walk in (geo_cell, id) order so each chunk loads a contiguous run of buckets
+    position = None
+    while True:
+        chunk = changed.order_by('geo_cell', 'id')
+        if position:
+            chunk = chunk.filter(Q(geo_cell__gt=position[0]) | Q(geo_cell=position[0], id__gt=position[1]))
+        chunk = list(chunk.values_list(*FIELDS)[:chunk_size])
+        if not chunk:
+            break
+        position = chunk[-1][3], chunk[-1][0]
+        run.scanned += len(chunk)
+        run.flagged += flag(find(chunk, threshold))
+
+    run.finished_at = timezone.now()
+    run.save()
+    return run
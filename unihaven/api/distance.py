@@ -0,0 +1,97 @@
+"""Campus distance engine shared by Accommodation.save() and the filter views.
+
+Campus coordinates are converted to radians once. Candidate listings are
+evaluated in one pass with NumPy arrays when NumPy is installed, falling back
+to plain Python otherwise. Distances use the same equirectangular formula as
+calculate_distance(), so stored and computed values agree.
+"""
+import heapq
+import math
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is optional
+    np = None
+
+EARTH_RADIUS_KM = 6371
+
+
+def calculate_distance(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(float, [lat1, lon1, lat2, lon2])
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    distance = EARTH_RADIUS_KM * math.sqrt(x*x + y*y)  # Distance in kilometers
+    return round(distance, 2)
+
+
+class DistanceEngine:
+    def __init__(self, locations):
+        self.labels = list(locations)
+        self.campuses = {
+            label: (math.radians(lat), math.radians(lon)) for label, (lat, lon) in locations.items()
+        }
+
+    def point(self, origin):
+        """Accept a LOCATIONS label or a (lat, lon) pair in degrees; return radians."""
+        if isinstance(origin, str):
+            return self.campuses[origin]
+        lat, lon = origin
+        return math.radians(float(lat)), math.radians(float(lon))
+
+    def campus_distances(self, lat, lon, universities):
+        """Distances from one listing to every campus of the given universities."""
+        lat_r, lon_r = math.radians(float(lat)), math.radians(float(lon))
+        prefixes = tuple(f"{uni} - " for uni in universities)
+        distances = {}
+        for label in self.labels:
+            if label.startswith(prefixes):
+                c_lat, c_lon = self.campuses[label]
+                x = (lon_r - c_lon) * math.cos((lat_r + c_lat) / 2)
+                y = lat_r - c_lat
+                distances[label] = round(EARTH_RADIUS_KM * math.sqrt(x*x + y*y), 2)
+        return distances
+
+    def distances(self, origin, lats, lons):
+        """Distances (km, rounded to 2dp) from `origin` to every (lat, lon) pair."""
+        o_lat, o_lon = self.point(origin)
+        if np is None:
+            result = []
+            for lat, lon in zip(lats, lons):
+                lat_r, lon_r = math.radians(float(lat)), math.radians(float(lon))
+                x = (lon_r - o_lon) * math.cos((lat_r + o_lat) / 2)
+                y = lat_r - o_lat
+                result.append(round(EARTH_RADIUS_KM * math.sqrt(x*x + y*y), 2))
+            return result
+        lat_r = np.radians(np.asarray(lats, dtype=float))
+        lon_r = np.radians(np.asarray(lons, dtype=float))
+        x = (lon_r - o_lon) * np.cos((lat_r + o_lat) / 2)
+        y = lat_r - o_lat
+        return np.round(EARTH_RADIUS_KM * np.hypot(x, y), 2)
+
+    def rank(self, origin, rows, max_distance=None, limit=None):
+        """Sort (id, lat, lon) rows by distance from `origin`.
+
+        Returns a list of (id, km). Rows further than `max_distance` are dropped.
+        With `limit`, only the nearest `limit` rows are selected (argpartition /
+        heap) instead of sorting everything.
+        """
+        if not rows:
+            return []
+
+        if np is None:
+            ids, lats, lons = zip(*rows)
+            km = self.distances(origin, lats, lons)
+            pairs = [(d, i) for i, d in zip(ids, km) if max_distance is None or d <= max_distance]
+            pairs = heapq.nsmallest(limit, pairs) if limit is not None else sorted(pairs)
+            return [(i, d) for d, i in pairs]
+
+        table = np.array(rows, dtype=float)
+        ids = table[:, 0].astype(np.int64)
+        km = self.distances(origin, table[:, 1], table[:, 2])
+        index = np.arange(len(km))
+        if max_distance is not None:
+            index = index[km <= max_distance]
+        if limit is not None and limit < len(index):
+            index = index[np.argpartition(km[index], limit)[:limit]]
+        index = index[np.argsort(km[index], kind='stable')]
+        return list(zip(ids[index].tolist(), km[index].tolist()))
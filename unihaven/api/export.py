@@ -0,0 +1,69 @@
+"""Streaming CSV / NDJSON exports.
+
+Rows are read with values() and QuerySet.iterator(), so no model instances or
+serializers are built and memory use does not grow with the table; each row is
+encoded and handed to the client as soon as it is read.
+"""
+import csv
+from datetime import datetime, time, timedelta
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+CHUNK_SIZE = 2000
+FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+RESERVATION_FIELDS = [
+    'id', 'accommodation_id', 'accommodation__title', 'student_name', 'student_email', 'start_date', 'end_date',
+    'status', 'created_by__username', 'created_by__university', 'created_at', 'updated_at',
+]
+RATING_FIELDS = [
+    'id', 'accommodation_id', 'accommodation__title', 'student_name', 'value', 'comment',
+    'created_by__username', 'created_by__university', 'created_at',
+]
+
+
+class Echo:
+    """File-like object whose write() returns the line, so csv.writer can feed a generator."""
+    def write(self, value):
+        return value
+
+
+def ndjson_lines(rows):
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(row) + "\n"
+
+
+def csv_lines(rows, fields):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([row[f] for f in fields])
+
+
+def start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def filter_range(queryset, start=None, end=None, university=None):
+    """created_at within [start, end] (YYYY-MM-DD, inclusive) and, optionally, one university's rows.
+
+    Compared as datetime bounds rather than created_at__date so the created_at index is used.
+    """
+    if start:
+        queryset = queryset.filter(created_at__gte=start_of_day(datetime.strptime(start, "%Y-%m-%d").date()))
+    if end:
+        end_day = datetime.strptime(end, "%Y-%m-%d").date()
+        queryset = queryset.filter(created_at__lt=start_of_day(end_day + timedelta(days=1)))
+    if university:
+        queryset = queryset.filter(created_by__university=university)
+    return queryset
+
+
+def stream(queryset, fields, fmt, filename):
+    rows = queryset.order_by('id').values(*fields).iterator(chunk_size=CHUNK_SIZE)
+    lines = csv_lines(rows, fields) if fmt == 'csv' else ndjson_lines(rows)
+    response = StreamingHttpResponse(lines, content_type=FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    return response
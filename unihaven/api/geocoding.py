@@ -0,0 +1,101 @@
+from concurrent.futures import ThreadPoolExecutor
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Min, Q
+from django.utils import timezone
+from api import models as api_models
+from api.models import GeocodeJob
+
+MAX_ATTEMPTS = getattr(settings, 'GEOCODE_MAX_ATTEMPTS', 5)
+RETRY_BASE_SECONDS = getattr(settings, 'GEOCODE_RETRY_BASE_SECONDS', 30)
+CLAIM_SECONDS = 300
+
+
+def retry_delay(attempts):
+    # Exponential backoff: 30s, 1m, 2m, 4m, ...
+    return timedelta(seconds=RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0))
+
+
+def due(now):
+    """Jobs ready to run: pending ones whose retry time has come, and lapsed claims."""
+    return GeocodeJob.objects.filter(Q(status='pending') | Q(status='processing'), next_attempt_at__lte=now)
+
+
+def claim(batch_size=50, now=None):
+    """Claim up to batch_size due jobs for this caller alone and return them, like outbox.claim()."""
+    now = now or timezone.now()
+    token = uuid.uuid4().hex
+    with transaction.atomic():
+        ids = list(
+            due(now).select_for_update(skip_locked=True).order_by('next_attempt_at', 'id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        due(now).filter(id__in=ids).update(
+            status='processing', claimed_by=token, next_attempt_at=timezone.now() + timedelta(seconds=CLAIM_SECONDS)
+        )
+    return list(
+        GeocodeJob.objects.select_related('accommodation')
+        .filter(status='processing', claimed_by=token).order_by('id')
+    )
+
+
+def lookup_in_pool(address):
+    """Geocode one address on a pool thread.
+
+    The lookup reads and writes GeocodeCache, which opens a connection for this
+    thread; it is closed here so finished workers never leak one.
+    """
+    try:
+        # Resolved through the module so tests can patch api.models.lookup_coordinates_and_geoaddress
+        return api_models.lookup_coordinates_and_geoaddress(address)
+    finally:
+        connection.close()
+
+
+def process_jobs(batch_size=50, workers=4, now=None):
+    """Drain one batch of due geocode jobs and return a summary of what happened."""
+    jobs = claim(batch_size, now)
+    summary = {'processed': len(jobs), 'geocoded': 0, 'retried': 0, 'failed': 0}
+    if not jobs:
+        return summary
+
+    # The lookups (GeocodeCache and ALS) run in the pool; the job and listing writes stay on this thread.
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        results = list(pool.map(lambda job: lookup_in_pool(job.accommodation.address), jobs))
+
+    for job, (lat, lon, geo_address) in zip(jobs, results):
+        # An address edited meanwhile re-queues the job and drops our claim; leave that one to the next batch
+        ours = GeocodeJob.objects.filter(pk=job.pk, claimed_by=job.claimed_by)
+        if lat is not None and lon is not None:
+            if ours.delete()[0]:
+                job.accommodation.apply_geocode(lat, lon, geo_address)
+                summary['geocoded'] += 1
+            continue
+
+        attempts = job.attempts + 1
+        if attempts >= MAX_ATTEMPTS:
+            if ours.update(attempts=attempts, last_error="No coordinates returned by ALS.", status='failed',
+                           claimed_by='', updated_at=timezone.now()):
+                job.accommodation.geocode_status = 'failed'
+                job.accommodation.save(update_fields=['geocode_status', 'updated_at'])
+                summary['failed'] += 1
+        elif ours.update(attempts=attempts, last_error="No coordinates returned by ALS.", status='pending',
+                         claimed_by='', next_attempt_at=timezone.now() + retry_delay(attempts),
+                         updated_at=timezone.now()):
+            summary['retried'] += 1
+    return summary
+
+
+def queue_stats(now=None):
+    """Queue depth and lag (age of the oldest pending job, in seconds)."""
+    now = now or timezone.now()
+    pending = GeocodeJob.objects.filter(status__in=('pending', 'processing'))
+    oldest = pending.aggregate(oldest=Min('created_at'))['oldest']
+    return {
+        'pending': pending.count(),
+        'due': pending.filter(next_attempt_at__lte=now).count(),
+        'failed': GeocodeJob.objects.filter(status='failed').count(),
+        'lag_seconds': round((now - oldest).total_seconds(), 1) if oldest else 0.0,
+    }
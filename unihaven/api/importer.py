@@ -0,0 +1,232 @@
+"""Bulk import of accommodations from CSV or NDJSON.
+
+The input is parsed lazily and handled one chunk at a time, so memory stays
+flat however long the file is. For each chunk:
+
+* rows are validated with AccommodationSerializer, bad rows go to the error report;
+* duplicates (same unit fingerprint, see unit_fingerprint) are dropped with
+  one indexed query against the table, which already holds every earlier chunk;
+* unique addresses without coordinates are geocoded concurrently through the
+  ALS cache, and anything ALS cannot resolve is queued for the geocode worker;
+* campus distances are computed per campus for the whole chunk at once;
+* listings and their AccommodationUniversity / CampusDistance / GeocodeJob
+  rows are written with bulk_create;
+* the written listings get the same near-duplicate check as an API create
+  (dedupe.check_listings); re-posts are flagged for review, not rejected, and
+  counted in the summary as near_duplicates.
+"""
+import csv
+import io
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from django.db import IntegrityError, transaction
+from api import cache, dedupe
+from api.geocoding import lookup_in_pool
+from api.models import (
+    Accommodation, AccommodationUniversity, CampusDistance, GeocodeJob, DISTANCE_ENGINE, LOCATIONS, UNIT_FIELDS,
+    unit_fingerprint,
+)
+from api.serializers import AccommodationSerializer
+from api.spatial import encode_geohash
+
+CHUNK_SIZE = 500
+FORMATS = ('csv', 'ndjson')
+
+
+def detect_format(name, default='csv'):
+    name = (name or '').lower()
+    if name.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    if name.endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def parse_universities(value):
+    if isinstance(value, str):
+        value = value.strip()
+        if value.startswith('['):
+            return json.loads(value)
+        return [code for code in re.split(r'[;,|\s]+', value) if code]
+    return value
+
+
+def parse_rows(stream, fmt):
+    """Yield (line number, row dict or parse error message) from a text stream."""
+    if fmt == 'ndjson':
+        for number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield number, f"Invalid JSON: {e}"
+                continue
+            yield number, row if isinstance(row, dict) else "Each line must be a JSON object."
+        return
+    for number, row in enumerate(csv.DictReader(stream), start=2):
+        # Blank CSV cells mean "not given" so model defaults apply
+        yield number, {key: value for key, value in row.items() if key and value not in ('', None)}
+
+
+def dedupe_key(data):
+    return unit_fingerprint(*(data.get(name) for name in UNIT_FIELDS))
+
+
+def geocode_addresses(addresses, workers):
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        return dict(zip(addresses, pool.map(lookup_in_pool, addresses)))
+
+
+def batch_campus_distances(listings):
+    """Fill campus_distances for every geocoded listing, one vectorized pass per campus."""
+    located = [a for a in listings if a.latitude is not None and a.longitude is not None]
+    if not located:
+        return
+    lats = [a.latitude for a in located]
+    lons = [a.longitude for a in located]
+    wanted = set().union(*(a.universities_offered for a in located))
+    for label in LOCATIONS:
+        university = label.split(" - ", 1)[0]
+        if university not in wanted:
+            continue
+        for listing, km in zip(located, list(map(float, DISTANCE_ENGINE.distances(label, lats, lons)))):
+            if university in listing.universities_offered:
+                listing.campus_distances[label] = km
+
+
+class Importer:
+    def __init__(self, user, chunk_size=CHUNK_SIZE, workers=4, on_error=None):
+        self.user = user
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.on_error = on_error or (lambda line, errors: None)
+        self.summary = {
+            'rows': 0, 'created': 0, 'duplicates': 0, 'near_duplicates': 0, 'errors': 0, 'geocode_queued': 0,
+        }
+
+    def run(self, stream, fmt):
+        rows = parse_rows(stream, fmt)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            self.import_chunk(chunk)
+        return self.summary
+
+    def error(self, line, errors):
+        self.summary['errors'] += 1
+        self.on_error(line, errors)
+
+    def validate(self, chunk):
+        valid = []
+        for line, row in chunk:
+            self.summary['rows'] += 1
+            if isinstance(row, str):
+                self.error(line, {'row': [row]})
+                continue
+            if 'universities_offered' in row:
+                try:
+                    row['universities_offered'] = parse_universities(row['universities_offered'])
+                except ValueError:
+                    self.error(line, {'universities_offered': ["Invalid list."]})
+                    continue
+            serializer = AccommodationSerializer(data=row)
+            if not serializer.is_valid():
+                self.error(line, serializer.errors)
+                continue
+            valid.append(serializer.validated_data)
+        return valid
+
+    def dedupe(self, rows):
+        keyed = [(dedupe_key(data), data) for data in rows]
+        existing = set(
+            Accommodation.objects.filter(fingerprint__in={key for key, data in keyed})
+            .values_list('fingerprint', flat=True)
+        )
+        unique = []
+        for key, data in keyed:
+            if key in existing:
+                self.summary['duplicates'] += 1
+                continue
+            existing.add(key)
+            unique.append(data)
+        return unique
+
+    def drop_existing(self, listings):
+        """Built listings whose unit is still free, counting the others as duplicates."""
+        existing = set(
+            Accommodation.objects.filter(fingerprint__in=[a.fingerprint for a in listings])
+            .values_list('fingerprint', flat=True)
+        )
+        self.summary['duplicates'] += sum(a.fingerprint in existing for a in listings)
+        return [a for a in listings if a.fingerprint not in existing]
+
+    def build(self, rows):
+        missing = sorted({d['address'] for d in rows if d.get('latitude') is None or d.get('longitude') is None})
+        found = geocode_addresses(missing, self.workers) if missing else {}
+        listings = []
+        for data in rows:
+            listing = Accommodation(created_by=self.user, **data)
+            listing.fingerprint = listing.compute_fingerprint()
+            if listing.latitude is None or listing.longitude is None:
+                lat, lon, geo_address = found[listing.address]
+                if lat is not None and lon is not None:
+                    listing.latitude, listing.longitude, listing.geo_address = lat, lon, (geo_address or '')[:50]
+            if listing.latitude is None or listing.longitude is None:
+                listing.geocode_status = 'pending'
+            else:
+                listing.geo_cell = encode_geohash(listing.latitude, listing.longitude)
+            listing.campus_distances = {}
+            listings.append(listing)
+        batch_campus_distances(listings)
+        return listings
+
+    def import_chunk(self, chunk):
+        rows = self.dedupe(self.validate(chunk))
+        if not rows:
+            return
+        listings = self.build(rows)
+        try:
+            with transaction.atomic():
+                pending = write_listings(listings)
+        except IntegrityError:
+            # A concurrent import or API create took one of these units after dedupe(); drop it and retry once
+            free = self.drop_existing(listings)
+            if len(free) == len(listings):
+                raise
+            listings = free
+            with transaction.atomic():
+                pending = write_listings(listings)
+        self.summary['created'] += len(listings)
+        self.summary['geocode_queued'] += pending
+        self.summary['near_duplicates'] += len(dedupe.check_listings(listings))
+        cache.bump(*{code for a in listings for code in a.universities_offered})
+
+
+def write_listings(listings):
+    """bulk_create built listings with the rows save() would have derived. Returns the geocode jobs queued."""
+    Accommodation.objects.bulk_create(listings)
+    AccommodationUniversity.objects.bulk_create([
+        AccommodationUniversity(accommodation=a, university=code)
+        for a in listings for code in set(a.universities_offered)
+    ])
+    CampusDistance.objects.bulk_create([
+        CampusDistance(accommodation=a, campus=label, km=km)
+        for a in listings for label, km in a.campus_distances.items()
+    ])
+    pending = [a for a in listings if a.geocode_status == 'pending']
+    GeocodeJob.objects.bulk_create([GeocodeJob(accommodation=a) for a in pending])
+    return len(pending)
+
+
+def import_file(binary, user, fmt=None, name=None, **options):
+    """Import from a binary file object (an upload or an open file)."""
+    fmt = fmt or detect_format(name or getattr(binary, 'name', ''))
+    stream = io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
+    try:
+        return Importer(user, **options).run(stream, fmt)
+    finally:
+        stream.detach()
@@ -0,0 +1,48 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from api import distance
+from api.models import DISTANCE_ENGINE, LOCATIONS
+
+
+class Command(BaseCommand):
+    help = "Time the campus distance engine on synthetic listings around Hong Kong."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--limit', type=int, default=20, help="k for the top-k mode.")
+        parser.add_argument('--max-distance', type=float, default=5.0)
+        parser.add_argument('--campus', default="HKU - Main Campus", choices=sorted(LOCATIONS))
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        backend = "numpy" if distance.np is not None else "pure python"
+        self.stdout.write(f"Distance engine backend: {backend}, campus: {options['campus']}")
+        self.stdout.write(f"{'listings':>10} {'loop+sort ms':>14} {'full sort ms':>14} {'radius ms':>12} {'top-k ms':>10}")
+
+        for size in options['sizes']:
+            rows = [(i, 22.20 + rng.random() * 0.30, 113.90 + rng.random() * 0.45) for i in range(size)]
+            campus = options['campus']
+            base_lat, base_lng = LOCATIONS[campus]
+
+            timings = {
+                'loop': lambda: sorted(rows, key=lambda r: distance.calculate_distance(base_lat, base_lng, r[1], r[2])),
+                'full': lambda: DISTANCE_ENGINE.rank(campus, rows),
+                'radius': lambda: DISTANCE_ENGINE.rank(campus, rows, max_distance=options['max_distance']),
+                'topk': lambda: DISTANCE_ENGINE.rank(campus, rows, limit=options['limit']),
+            }
+            results = {name: self.best_of(fn, options['repeat']) for name, fn in timings.items()}
+            self.stdout.write(
+                f"{size:>10} {results['loop']:>14.1f} {results['full']:>14.1f} "
+                f"{results['radius']:>12.1f} {results['topk']:>10.1f}"
+            )
+
+    def best_of(self, fn, repeat):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        return best * 1000
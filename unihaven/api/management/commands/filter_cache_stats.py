@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from api import cache as filter_cache
+
+
+class Command(BaseCommand):
+    help = "Print the accommodation filter cache's hit ratio, summed over every process sharing the cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help="Zero the counters after printing them.")
+
+    def handle(self, *args, **options):
+        stats = filter_cache.stats()
+        self.stdout.write(
+            f"Filter cache: {stats['hits']} hits, {stats['misses']} misses "
+            f"(hit ratio {stats['hit_ratio']}), {stats['waits']} waited on a concurrent build"
+        )
+        if not filter_cache.is_shared():
+            self.stdout.write("The default cache is process-local, so the filter cache is disabled.")
+        if options['reset']:
+            filter_cache.reset_stats()
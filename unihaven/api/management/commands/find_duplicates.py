@@ -0,0 +1,20 @@
+import time
+from django.core.management.base import BaseCommand
+from api.dedupe import CHUNK_SIZE, THRESHOLD, scan
+
+
+class Command(BaseCommand):
+    help = "Flag listings that look like re-posts of another listing at the same place, floor and flat."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Scan every listing, not just those changed since the last run.")
+        parser.add_argument('--threshold', type=float, default=THRESHOLD, help="Minimum estimated similarity (0-1).")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Changed listings per batch.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        run = scan(full=options['full'], threshold=options['threshold'], chunk_size=options['chunk_size'])
+        self.stdout.write(
+            f"Scanned {run.scanned} listing(s), flagged {run.flagged} new near-duplicate(s) "
+            f"in {time.perf_counter() - started:.3f}s."
+        )
@@ -0,0 +1,225 @@
+import math
+import random
+import time
+import uuid
+from collections import Counter
+from datetime import date, timedelta
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from api import cache
+from api.availability import ACTIVE_STATUSES, stay_nights
+from api.importer import batch_campus_distances, write_listings
+from api.models import Accommodation, NightOccupancy, Rating, Reservation
+from api.registry import REGISTRY
+from api.spatial import encode_geohash
+from users.models import StaffProfile, StudentProfile, User
+
+ADJECTIVES = ["Bright", "Cosy", "Spacious", "Modern", "Quiet", "Renovated", "Sunny", "Compact", "Furnished", "Airy"]
+KINDS = {"AP": "apartment", "HM": "house", "HR": "room in a house", "SH": "shared room"}
+STREETS = [
+    "Pok Fu Lam Road", "Bonham Road", "Des Voeux Road West", "Tai Po Road", "Chung Hau Street",
+    "Clear Water Bay Road", "Hang Hau Road", "Sha Tin Wai Road", "Nathan Road", "Kennedy Town Praya",
+]
+FEATURES = [
+    "Walking distance to the MTR.", "Utilities included.", "Sea view from the living room.",
+    "Air-conditioned bedrooms.", "Shared kitchen and laundry.", "Close to supermarkets and minibus stops.",
+    "Newly painted, with a study desk.", "Quiet building with a lift.", "Balcony and plenty of daylight.",
+]
+KM_PER_DEGREE = 111.32
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a seeded synthetic dataset: students and staff for every university in universities.json, "
+        "listings scattered around their campuses, and reservations and ratings, all with bulk inserts. "
+        "Coordinates are generated, so nothing is geocoded."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=3000, help="Students, split evenly across universities.")
+        parser.add_argument('--accommodations', type=int, default=100_000)
+        parser.add_argument('--reservations', type=int, default=1_000_000, help="Approximate total.")
+        parser.add_argument('--ratings', type=int, default=500_000, help="Approximate total.")
+        parser.add_argument('--radius-km', type=float, default=3.0, help="Typical distance from the nearest campus.")
+        parser.add_argument('--batch-size', type=int, default=2000, help="Listings written per transaction.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='synthetic', help="Username prefix of generated users.")
+        parser.add_argument('--clear', action='store_true', help="Delete data generated earlier with --prefix first.")
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if options['clear']:
+            deleted = User.objects.filter(username__startswith=f"{prefix}-").delete()[0]
+            self.stdout.write(f"Deleted {deleted} row(s) generated earlier.")
+        elif User.objects.filter(username__startswith=f"{prefix}-").exists():
+            raise CommandError(f"Users named {prefix}-* already exist; pass --clear or another --prefix.")
+
+        if options['users'] < len(REGISTRY.codes()):
+            raise CommandError("Generate at least one student per university.")
+        self.rng = random.Random(options['seed'])
+        self.today = date.today()
+        started = time.perf_counter()
+        staff, students = self.make_users(prefix, options['users'])
+        self.stdout.write(f"Created {options['users']} student(s) and {len(staff)} staff.")
+
+        total = options['accommodations']
+        reservations_per_listing = options['reservations'] / total if total else 0
+        ratings_per_listing = options['ratings'] / total if total else 0
+        first_number = (Accommodation.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+        counts = Counter()
+        for offset in range(0, total, options['batch_size']):
+            size = min(options['batch_size'], total - offset)
+            listings = [
+                self.make_listing(first_number + offset + i, staff, options['radius_km']) for i in range(size)
+            ]
+            batch_campus_distances(listings)
+            with transaction.atomic():
+                stays = [self.make_stays(a, students, reservations_per_listing) for a in listings]
+                ratings = [self.make_ratings(a, students, ratings_per_listing) for a in listings]
+                write_listings(listings)
+                for listing, (reservations, booked) in zip(listings, stays):
+                    for r in reservations:
+                        r.accommodation = listing
+                    counts['reservations'] += len(reservations)
+                    counts['nights'] += len(booked)
+                Reservation.objects.bulk_create([r for reservations, booked in stays for r in reservations], batch_size=5000)
+                NightOccupancy.objects.bulk_create([
+                    NightOccupancy(accommodation=listing, night=night, booked=count)
+                    for listing, (reservations, booked) in zip(listings, stays) for night, count in booked.items()
+                ], batch_size=5000)
+                for listing, rows in zip(listings, ratings):
+                    for rating in rows:
+                        rating.accommodation = listing
+                    counts['ratings'] += len(rows)
+                Rating.objects.bulk_create([r for rows in ratings for r in rows], batch_size=5000)
+            counts['accommodations'] += size
+            self.stdout.write(
+                f"  {counts['accommodations']}/{total} listings, {counts['reservations']} reservations, "
+                f"{counts['ratings']} ratings ({time.perf_counter() - started:.1f}s)"
+            )
+        # Bulk inserts skip the model signals
+        cache.bump_all()
+        self.stdout.write(
+            f"Generated {counts['accommodations']} listings, {counts['reservations']} reservations "
+            f"({counts['nights']} held nights) and {counts['ratings']} ratings in {time.perf_counter() - started:.1f}s."
+        )
+
+    def make_users(self, prefix, count):
+        password = make_password(prefix)
+        codes = REGISTRY.codes()
+        staff = [
+            User(username=f"{prefix}-staff-{code.lower()}", password=password, university=code,
+                 is_cedars_staff=True, email=f"{prefix}-staff@{code.lower()}.hk", UID=uuid.uuid4().hex[:10])
+            for code in codes
+        ]
+        students = [
+            User(username=f"{prefix}-student-{i}", password=password, university=codes[i % len(codes)],
+                 is_student=True, email=f"{prefix}-student-{i}@example.com", UID=uuid.uuid4().hex[:10],
+                 first_name=f"Student{i}", last_name=prefix.title())
+            for i in range(count)
+        ]
+        with transaction.atomic():
+            User.objects.bulk_create(staff + students, batch_size=2000)
+            StaffProfile.objects.bulk_create([StaffProfile(user=u, university=u.university) for u in staff])
+            StudentProfile.objects.bulk_create(
+                [StudentProfile(user=u, university=u.university, UID=u.UID) for u in students], batch_size=2000
+            )
+        by_university = {code: [] for code in codes}
+        for user in students:
+            by_university[user.university].append(user)
+        return {u.university: u for u in staff}, by_university
+
+    def make_listing(self, number, staff, radius_km):
+        rng = self.rng
+        label = rng.choice(list(REGISTRY.locations))
+        university = REGISTRY.university_of(label)
+        campus_lat, campus_lon = REGISTRY.locations[label]
+        # Most listings sit within a few km of a campus, a few much further out
+        distance = min(rng.expovariate(1 / radius_km), 25.0)
+        bearing = rng.uniform(0, 2 * math.pi)
+        lat = campus_lat + distance * math.cos(bearing) / KM_PER_DEGREE
+        lon = campus_lon + distance * math.sin(bearing) / (KM_PER_DEGREE * math.cos(math.radians(campus_lat)))
+        offered = [university] + [code for code in REGISTRY.codes() if code != university and rng.random() < 0.2]
+        property_type = rng.choice(list(KINDS))
+        bedrooms = rng.randint(1, 4) if property_type in ("AP", "HM") else 1
+        street = rng.choice(STREETS)
+        available_from = self.today - timedelta(days=rng.randint(0, 200))
+        listing = Accommodation(
+            title=f"{rng.choice(ADJECTIVES)} {KINDS[property_type]} near {label}",
+            description=" ".join(rng.sample(FEATURES, 3)),
+            property_type=property_type,
+            price=rng.randrange(3000, 25000, 100),
+            beds=bedrooms + rng.randint(0, 2),
+            bedrooms=bedrooms,
+            address=f"{number} {street}, Hong Kong",
+            flat_number=rng.choice("ABCDEFGH"),
+            floor_number=str(rng.randint(1, 40)),
+            latitude=round(lat, 6),
+            longitude=round(lon, 6),
+            geo_address=f"{number} {street}"[:50],
+            available_from=available_from,
+            available_to=available_from + timedelta(days=rng.randint(180, 600)),
+            universities_offered=offered,
+            created_by=staff[university],
+            geocode_status='done',
+        )
+        listing.geo_cell = encode_geohash(listing.latitude, listing.longitude)
+        listing.fingerprint = listing.compute_fingerprint()
+        listing.campus_distances = {}
+        return listing
+
+    def make_stays(self, listing, students, mean):
+        """Reservations for one listing and the nights they hold; stays that would overbook are cancelled."""
+        rng = self.rng
+        booked = Counter()
+        reservations = []
+        for _ in range(poisson(rng, mean)):
+            student = rng.choice(students[rng.choice(listing.universities_offered)])
+            start = self.today + timedelta(days=rng.randint(-180, 180))
+            end = start + timedelta(days=rng.randint(1, 14))
+            if end < self.today:
+                status = 'cancelled' if rng.random() < 0.1 else 'completed'
+            elif start <= self.today:
+                status = 'confirmed'
+            else:
+                status = rng.choices(['pending', 'confirmed', 'cancelled'], weights=[6, 3, 1])[0]
+            if status in ACTIVE_STATUSES:
+                nights = stay_nights(start, end)
+                if any(booked[night] >= listing.beds for night in nights):
+                    status = 'cancelled'
+                else:
+                    booked.update(nights)
+            reservations.append(Reservation(
+                student_name=student.get_full_name(), student_email=student.email, start_date=start,
+                end_date=end, status=status, created_by=student,
+            ))
+        return reservations, booked
+
+    def make_ratings(self, listing, students, mean):
+        """Ratings for one listing, with its stored aggregates set to match."""
+        rng = self.rng
+        ratings = []
+        for _ in range(poisson(rng, mean)):
+            student = rng.choice(students[rng.choice(listing.universities_offered)])
+            ratings.append(Rating(
+                student_name=student.get_full_name(), value=rng.choices([1, 2, 3, 4, 5], weights=[1, 2, 4, 6, 4])[0],
+                comment=rng.choice(["", "", "Good value.", "Landlord was helpful.", "A bit noisy at night."]),
+                created_by=student,
+            ))
+        listing.rating_count = len(ratings)
+        listing.rating_sum = sum(r.value for r in ratings)
+        listing.rating = round(listing.rating_sum / listing.rating_count, 2) if ratings else 0.0
+        return ratings
+
+
+def poisson(rng, mean):
+    """Knuth's method, which is fine for the small per-listing means used here."""
+    if mean <= 0:
+        return 0
+    limit, count, product = math.exp(-mean), 0, rng.random()
+    while product > limit:
+        count += 1
+        product *= rng.random()
+    return count
@@ -0,0 +1,46 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from api import importer
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Bulk import accommodations from a CSV or NDJSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--user', required=True, help="Username recorded as created_by.")
+        parser.add_argument('--format', choices=importer.FORMATS, help="Defaults to the file extension.")
+        parser.add_argument('--chunk-size', type=int, default=importer.CHUNK_SIZE)
+        parser.add_argument('--workers', type=int, default=4, help="Concurrent ALS lookups per chunk.")
+        parser.add_argument('--errors', help="Write rejected rows here as NDJSON (default: stderr).")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['user']!r}.")
+
+        report = open(options['errors'], 'w') if options['errors'] else None
+
+        def on_error(line, errors):
+            entry = json.dumps({'line': line, 'errors': errors}, default=str)
+            if report:
+                report.write(entry + "\n")
+            else:
+                self.stderr.write(entry)
+
+        try:
+            with open(options['path'], 'rb') as f:
+                summary = importer.import_file(
+                    f, user, fmt=options['format'], chunk_size=options['chunk_size'],
+                    workers=options['workers'], on_error=on_error,
+                )
+        finally:
+            if report:
+                report.close()
+        self.stdout.write(
+            f"Read {summary['rows']} row(s): {summary['created']} created, {summary['duplicates']} duplicate(s), "
+            f"{summary['near_duplicates']} flagged as likely re-posts, {summary['errors']} rejected, "
+            f"{summary['geocode_queued']} queued for geocoding."
+        )
@@ -0,0 +1,105 @@
+import random
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from rest_framework.exceptions import PermissionDenied
+from api import services
+from api.availability import ACTIVE_STATUSES, stay_nights
+from api.models import Accommodation, NightOccupancy, Reservation
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammer one listing with concurrent reservation attempts and check it is never overbooked. "
+        "Writes to the configured database and removes its own data afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+        parser.add_argument('--requests', type=int, default=400, help="Reservation attempts per concurrency level.")
+        parser.add_argument('--beds', type=int, default=10)
+        parser.add_argument('--days', type=int, default=30, help="Window the random stays are drawn from.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        user = User.objects.create_user(username=f"loadtest-{time.time_ns()}", university="HKU")
+        self.stdout.write(f"Database: {connection.vendor}, beds: {options['beds']}, attempts per level: {options['requests']}")
+        self.stdout.write(f"{'clients':>8} {'accepted':>9} {'rejected':>9} {'errors':>7} {'attempts/s':>11} {'overbooked':>11}")
+        try:
+            for clients in options['concurrency']:
+                listing = self.make_listing(user, options['beds'])
+                try:
+                    self.run_level(user, listing, clients, options)
+                finally:
+                    listing.delete()
+        finally:
+            user.delete()
+
+    def make_listing(self, user, beds):
+        today = date.today()
+        return Accommodation.objects.create(
+            title="Load test", description="", property_type="AP", price=1, beds=beds, bedrooms=1,
+            address="", available_from=today, available_to=today + timedelta(days=365),
+            created_by=user, universities_offered=["HKU"], latitude=22.283, longitude=114.135,
+        )
+
+    def run_level(self, user, listing, clients, options):
+        rng = random.Random(options['seed'])
+        start = date.today() + timedelta(days=1)
+        stays = []
+        for _ in range(options['requests']):
+            first = start + timedelta(days=rng.randrange(options['days']))
+            stays.append((first, first + timedelta(days=rng.randint(1, 5))))
+
+        outcome = Counter()
+        lock = threading.Lock()
+
+        def worker(chunk):
+            try:
+                for first, last in chunk:
+                    data = {
+                        'accommodation': listing, 'student_name': "Load test", 'student_email': "load@test.hk",
+                        'start_date': first, 'end_date': last, 'status': 'pending',
+                    }
+                    try:
+                        services.book(user, data)
+                        result = 'accepted'
+                    except PermissionDenied:
+                        result = 'rejected'
+                    except Exception:
+                        result = 'errors'
+                    with lock:
+                        outcome[result] += 1
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(stays[i::clients],)) for i in range(clients)]
+        began = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - began
+
+        overbooked = self.verify(listing)
+        self.stdout.write(
+            f"{clients:>8} {outcome['accepted']:>9} {outcome['rejected']:>9} {outcome['errors']:>7} "
+            f"{options['requests'] / elapsed:>11.1f} {overbooked:>11}"
+        )
+        if overbooked:
+            raise CommandError(f"{overbooked} night(s) overbooked at {clients} concurrent clients.")
+
+    def verify(self, listing):
+        """Nights booked beyond capacity, recounted from the reservations themselves."""
+        held = Counter()
+        active = Reservation.objects.filter(accommodation=listing, status__in=ACTIVE_STATUSES)
+        for first, last in active.values_list('start_date', 'end_date'):
+            held.update(stay_nights(first, last))
+        recorded = dict(NightOccupancy.objects.filter(accommodation=listing).values_list('night', 'booked'))
+        if any(recorded.get(night, 0) != count for night, count in held.items()):
+            raise CommandError("NightOccupancy does not match the reservations it was built from.")
+        return sum(1 for count in held.values() if count > listing.beds)
@@ -0,0 +1,47 @@
+import time
+from django.core.management.base import BaseCommand
+from api import als
+from api.geocoding import process_jobs, queue_stats
+
+
+class Command(BaseCommand):
+    help = "Fill in coordinates for accommodations waiting on an ALS geocode lookup."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--workers', type=int, default=4, help="Concurrent ALS lookups per batch.")
+        parser.add_argument('--loop', action='store_true', help="Keep polling the queue instead of exiting when it is empty.")
+        parser.add_argument('--interval', type=float, default=5.0, help="Seconds to sleep between polls with --loop.")
+        parser.add_argument('--stats', action='store_true', help="Only print queue depth, lag and lookup counters.")
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.print_stats()
+            return
+
+        while True:
+            summary = process_jobs(options['batch_size'], options['workers'])
+            if summary['processed']:
+                self.stdout.write(
+                    f"Processed {summary['processed']} job(s): {summary['geocoded']} geocoded, "
+                    f"{summary['retried']} retried, {summary['failed']} failed."
+                )
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.print_stats()
+
+    def print_stats(self):
+        stats = queue_stats()
+        self.stdout.write(
+            f"Queue depth: {stats['pending']} pending ({stats['due']} due), "
+            f"{stats['failed']} failed, lag {stats['lag_seconds']}s"
+        )
+        counters = als.stats()
+        self.stdout.write(
+            f"ALS lookups: {counters['cache_hits']} cache hits, {counters['cache_misses']} misses, "
+            f"{counters['coalesced']} coalesced, {counters['requests']} requests, {counters['errors']} errors, "
+            f"{counters['breaker_rejections']} rejected (breaker {counters['breaker_state']})"
+        )
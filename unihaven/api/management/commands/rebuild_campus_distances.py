@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from api.importer import batch_campus_distances
+from api.models import Accommodation, CampusDistance
+from api import cache
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute stored campus distances for every accommodation from the current universities.json. "
+        "Run after moving, adding or removing a campus."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help="Accommodation ids per batch.")
+
+    def handle(self, *args, **options):
+        last_id = Accommodation.objects.aggregate(last=Max('id'))['last'] or 0
+        batch = options['batch_size']
+        updated = 0
+        for start in range(0, last_id + 1, batch):
+            listings = list(
+                Accommodation.objects.filter(id__gte=start, id__lt=start + batch)
+                .only('id', 'latitude', 'longitude', 'universities_offered', 'campus_distances')
+            )
+            for listing in listings:
+                listing.campus_distances = {}
+            batch_campus_distances(listings)
+            with transaction.atomic():
+                Accommodation.objects.bulk_update(listings, ['campus_distances'])
+                CampusDistance.objects.filter(accommodation__in=listings).delete()
+                CampusDistance.objects.bulk_create([
+                    CampusDistance(accommodation=a, campus=label, km=km)
+                    for a in listings for label, km in a.campus_distances.items()
+                ])
+            updated += len(listings)
+        # Bulk updates skip the model signals, so invalidate cached filter results here
+        cache.bump_all()
+        self.stdout.write(f"Rebuilt campus distances for {updated} accommodation(s).")
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from api.models import Accommodation, Rating, derived_rating
+from api import cache
+
+
+class Command(BaseCommand):
+    help = "Recompute rating_sum, rating_count and rating for every accommodation from the Rating table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help="Accommodation ids per UPDATE.")
+
+    def handle(self, *args, **options):
+        per_listing = Rating.objects.filter(accommodation=OuterRef('pk')).values('accommodation')
+        rating_sum = Coalesce(Subquery(per_listing.annotate(s=Sum('value')).values('s')), Value(0), output_field=IntegerField())
+        rating_count = Coalesce(Subquery(per_listing.annotate(c=Count('id')).values('c')), Value(0), output_field=IntegerField())
+
+        last_id = Accommodation.objects.aggregate(last=Max('id'))['last'] or 0
+        batch = options['batch_size']
+        updated = 0
+        for start in range(0, last_id + 1, batch):
+            with transaction.atomic():
+                rows = Accommodation.objects.filter(id__gte=start, id__lt=start + batch)
+                updated += rows.update(rating_sum=rating_sum, rating_count=rating_count, updated_at=timezone.now())
+                rows.update(rating=derived_rating('rating_sum', 'rating_count'))
+        # Bulk updates skip the model signals, so invalidate cached filter results here
+        cache.bump_all()
+        self.stdout.write(f"Rebuilt rating aggregates for {updated} accommodation(s).")
@@ -0,0 +1,196 @@
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import date, timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max
+from rest_framework.test import APIClient
+from api.models import Accommodation, EmailOutbox, Rating, Reservation
+from api.registry import REGISTRY
+from users.models import User
+
+FLOWS = ('filter', 'list', 'reserve', 'rate')
+PERCENTILES = (50, 95, 99)
+
+
+def parse_mix(value):
+    """'filter=40,list=30,reserve=20,rate=10' -> {'filter': 40, ...}"""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in FLOWS:
+            raise CommandError(f"Unknown flow {name!r}; choose from {', '.join(FLOWS)}.")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the filter, list, reserve and rate API flows with concurrent in-process clients and report "
+        "p50/p95/p99 latency and throughput. Run generate_data first; reservations and ratings made here "
+        "are removed afterwards unless --keep is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, nargs='+', default=[1, 8])
+        parser.add_argument('--requests', type=int, default=1000, help="Requests per concurrency level.")
+        parser.add_argument('--mix', type=parse_mix, default='filter=40,list=30,reserve=20,rate=10')
+        parser.add_argument('--prefix', default='synthetic', help="Students named <prefix>-* act as clients.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', help="Also write the results here as JSON.")
+        parser.add_argument('--keep', action='store_true', help="Keep the reservations and ratings created.")
+
+    def handle(self, *args, **options):
+        students = list(User.objects.filter(username__startswith=f"{options['prefix']}-", is_student=True)[:2000])
+        if not students:
+            raise CommandError(f"No students named {options['prefix']}-*; run `manage.py generate_data` first.")
+        rng = random.Random(options['seed'])
+        self.listings = {}
+        for code in REGISTRY.codes():
+            ids = list(Accommodation.objects.offered_to_university(code).order_by('id').values_list('id', flat=True))
+            self.listings[code] = rng.sample(ids, min(len(ids), 5000))
+        self.students = [s for s in students if self.listings.get(s.university)]
+        self.host = next((h for h in settings.ALLOWED_HOSTS if h not in ('*', '') and not h.startswith('.')), 'localhost')
+        # Rejected reservations are expected; don't log a warning for each one
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        last_outbox = EmailOutbox.objects.aggregate(last=Max('id'))['last'] or 0
+        # Reservations made here carry this in student_name, so their notification emails can be told apart
+        self.tag = f"[benchmark {uuid.uuid4().hex[:8]}]"
+        self.created = {'reservations': [], 'ratings': []}
+        self.created_lock = threading.Lock()
+
+        results = []
+        try:
+            for clients in options['clients']:
+                results.append(self.run_level(clients, options))
+        finally:
+            if not options['keep']:
+                self.cleanup(last_outbox)
+
+        if options['json']:
+            with open(options['json'], 'w') as f:
+                json.dump({'seed': options['seed'], 'mix': options['mix'], 'levels': results}, f, indent=2)
+
+    def run_level(self, clients, options):
+        samples = defaultdict(list)
+        outcomes = defaultdict(lambda: defaultdict(int))
+        lock = threading.Lock()
+        per_client = [options['requests'] // clients + (i < options['requests'] % clients) for i in range(clients)]
+        flows, weights = zip(*options['mix'].items())
+
+        def worker(index, count):
+            rng = random.Random(options['seed'] * 1000 + index)
+            client = APIClient(SERVER_NAME=self.host)
+            try:
+                for _ in range(count):
+                    flow = rng.choices(flows, weights)[0]
+                    student = rng.choice(self.students)
+                    client.force_authenticate(user=student)
+                    started = time.perf_counter()
+                    try:
+                        outcome = getattr(self, f"do_{flow}")(client, student, rng)
+                    except Exception:
+                        outcome = 'errors'
+                    elapsed = (time.perf_counter() - started) * 1000
+                    with lock:
+                        samples[flow].append(elapsed)
+                        outcomes[flow][outcome] += 1
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(i, n)) for i, n in enumerate(per_client)]
+        began = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - began
+
+        self.stdout.write(f"\n{clients} client(s), {options['requests']} requests in {elapsed:.2f}s "
+                          f"({options['requests'] / elapsed:.1f} req/s)")
+        self.stdout.write(f"{'flow':>8} {'count':>6} {'ok':>6} {'rejected':>9} {'errors':>7} "
+                          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8}")
+        level = {'clients': clients, 'requests': options['requests'], 'seconds': round(elapsed, 3), 'flows': {}}
+        for flow in flows:
+            ordered = sorted(samples[flow])
+            row = {
+                'count': len(ordered),
+                **{name: outcomes[flow][name] for name in ('ok', 'rejected', 'errors')},
+                **{f"p{p}_ms": round(percentile(ordered, p), 2) for p in PERCENTILES},
+                'throughput': round(len(ordered) / elapsed, 1),
+            }
+            level['flows'][flow] = row
+            self.stdout.write(
+                f"{flow:>8} {row['count']:>6} {row['ok']:>6} {row['rejected']:>9} {row['errors']:>7} "
+                f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['throughput']:>8.1f}"
+            )
+        return level
+
+    def outcome(self, response, kind=None):
+        if response.status_code >= 500:
+            return 'errors'
+        if response.status_code >= 400:
+            return 'rejected'
+        if kind:
+            with self.created_lock:
+                self.created[kind].append(response.data['id'])
+        return 'ok'
+
+    def do_filter(self, client, student, rng):
+        params = {'page_size': 20}
+        campuses = REGISTRY.campus_labels(student.university)
+        if campuses and rng.random() < 0.7:
+            params['campus_label'] = rng.choice(campuses)
+            params['max_distance'] = rng.choice([2, 5, 10])
+        if rng.random() < 0.3:
+            params['property_type'] = rng.choice(['AP', 'HM', 'HR', 'SH'])
+        if rng.random() < 0.3:
+            params['min_price'], params['max_price'] = 3000, rng.choice([8000, 12000, 20000])
+        return self.outcome(client.get('/api/accommodations/filter/', params))
+
+    def do_list(self, client, student, rng):
+        ordering = rng.choice(['created_at', '-created_at', 'price', '-price'])
+        return self.outcome(client.get('/api/accommodations/', {'page_size': 20, 'ordering': ordering}))
+
+    def do_reserve(self, client, student, rng):
+        start = date.today() + timedelta(days=rng.randint(1, 120))
+        response = client.post('/api/reservations/', {
+            'accommodation': rng.choice(self.listings[student.university]),
+            'student_name': f"{self.tag} {student.get_full_name() or student.username}",
+            'student_email': student.email,
+            'start_date': start.isoformat(),
+            'end_date': (start + timedelta(days=rng.randint(1, 7))).isoformat(),
+        }, format='json')
+        return self.outcome(response, 'reservations')
+
+    def do_rate(self, client, student, rng):
+        response = client.post('/api/ratings/', {
+            'accommodation': rng.choice(self.listings[student.university]),
+            'student_name': student.get_full_name() or student.username,
+            'value': rng.randint(1, 5),
+            'comment': "Benchmark rating",
+        }, format='json')
+        return self.outcome(response, 'ratings')
+
+    def cleanup(self, last_outbox):
+        # The delete signals roll back held nights and rating aggregates too
+        Reservation.objects.filter(id__in=self.created['reservations']).delete()
+        Rating.objects.filter(id__in=self.created['ratings']).delete()
+        # Only this run's notifications; anything real traffic queued meanwhile stays
+        EmailOutbox.objects.filter(id__gt=last_outbox, body__contains=f"Reservation for {self.tag} ").delete()
+        self.stdout.write(
+            f"\nRemoved {len(self.created['reservations'])} reservation(s) and {len(self.created['ratings'])} rating(s)."
+        )
@@ -0,0 +1,31 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from api.models import EmailOutbox
+from api.outbox import drain
+
+
+class Command(BaseCommand):
+    help = "Send queued notification emails in batches over one mail connection."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--digest', action='store_true', help="Combine a batch's messages to the same mailbox into one email.")
+        parser.add_argument('--loop', action='store_true', help="Keep polling the outbox instead of exiting when it is empty.")
+        parser.add_argument('--interval', type=float, default=10.0, help="Seconds to sleep between polls with --loop.")
+
+    def handle(self, *args, **options):
+        while True:
+            summary = drain(options['batch_size'], digest=options['digest'])
+            if summary['processed']:
+                self.stdout.write(
+                    f"Processed {summary['processed']} message(s): {summary['sent']} sent in {summary['emails']} email(s), "
+                    f"{summary['retried']} retried, {summary['failed']} failed."
+                )
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        counts = dict(EmailOutbox.objects.values_list('status').annotate(n=Count('id')))
+        self.stdout.write(f"Outbox: {counts.get('pending', 0)} pending, {counts.get('failed', 0)} failed.")
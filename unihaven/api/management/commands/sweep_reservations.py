@@ -0,0 +1,23 @@
+import time
+from django.core.management.base import BaseCommand
+from api.sweeper import CHUNK_SIZE, sweep_reservations
+
+
+class Command(BaseCommand):
+    help = "Confirm started and complete ended reservations with bulk UPDATEs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Rows per UPDATE.")
+        parser.add_argument('--loop', action='store_true', help="Keep sweeping instead of exiting after one pass.")
+        parser.add_argument('--interval', type=float, default=3600.0, help="Seconds between sweeps with --loop.")
+
+    def handle(self, *args, **options):
+        while True:
+            summary = sweep_reservations(chunk_size=options['chunk_size'])
+            self.stdout.write(
+                f"Confirmed {summary['confirmed']}, completed {summary['completed']} reservation(s); "
+                f"pruned {summary['pruned_nights']} past night(s) in {summary['seconds']}s."
+            )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:55
+
+from django.conf import settings
+from django.db import migrations, models
+from api.spatial import encode_geohash
+
+
+def backfill_geo_cells(apps, schema_editor):
+    Accommodation = apps.get_model('api', 'Accommodation')
+    rows = Accommodation.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    for acc in rows.only('id', 'latitude', 'longitude').iterator():
+        acc.geo_cell = encode_geohash(acc.latitude, acc.longitude)
+        acc.save(update_fields=['geo_cell'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_geocode_cache'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accommodation',
+            name='geo_cell',
+            field=models.CharField(blank=True, db_index=True, max_length=12),
+        ),
+        migrations.AddIndex(
+            model_name='accommodation',
+            index=models.Index(fields=['latitude', 'longitude'], name='api_accommo_latitud_f67add_idx'),
+        ),
+        migrations.RunPython(backfill_geo_cells, migrations.RunPython.noop),
+    ]
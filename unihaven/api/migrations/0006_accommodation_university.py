@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_universities_offered(apps, schema_editor):
+    Accommodation = apps.get_model('api', 'Accommodation')
+    AccommodationUniversity = apps.get_model('api', 'AccommodationUniversity')
+    rows = []
+    for acc_id, codes in Accommodation.objects.values_list('id', 'universities_offered').iterator():
+        rows.extend(
+            AccommodationUniversity(accommodation_id=acc_id, university=code)
+            for code in set(codes or [])
+        )
+    AccommodationUniversity.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_spatial_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccommodationUniversity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('university', models.CharField(max_length=10)),
+                ('accommodation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='offered_to', to='api.accommodation')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('university', 'accommodation'), name='unique_accommodation_university')],
+            },
+        ),
+        migrations.RunPython(copy_universities_offered, migrations.RunPython.noop),
+    ]
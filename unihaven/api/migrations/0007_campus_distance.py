@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_campus_distances(apps, schema_editor):
+    Accommodation = apps.get_model('api', 'Accommodation')
+    CampusDistance = apps.get_model('api', 'CampusDistance')
+    rows = []
+    for acc_id, distances in Accommodation.objects.values_list('id', 'campus_distances').iterator():
+        rows.extend(
+            CampusDistance(accommodation_id=acc_id, campus=label, km=km)
+            for label, km in (distances or {}).items()
+        )
+    CampusDistance.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_accommodation_university'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CampusDistance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('campus', models.CharField(max_length=100)),
+                ('km', models.FloatField()),
+                ('accommodation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='distances', to='api.accommodation')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['campus', 'km'], name='api_campusd_campus_6cb55a_idx')],
+                'constraints': [models.UniqueConstraint(fields=('accommodation', 'campus'), name='unique_accommodation_campus')],
+            },
+        ),
+        migrations.RunPython(copy_campus_distances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:59
+
+from django.db import migrations, models
+from django.db.models import Count, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf, Round
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Accommodation = apps.get_model('api', 'Accommodation')
+    Rating = apps.get_model('api', 'Rating')
+    per_listing = Rating.objects.filter(accommodation=OuterRef('pk')).values('accommodation')
+    Accommodation.objects.update(
+        rating_sum=Coalesce(Subquery(per_listing.annotate(s=Sum('value')).values('s')), Value(0)),
+        rating_count=Coalesce(Subquery(per_listing.annotate(c=Count('id')).values('c')), Value(0)),
+    )
+    Accommodation.objects.update(
+        rating=Coalesce(Round(Cast('rating_sum', FloatField()) / NullIf('rating_count', 0), 2), Value(0.0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accommodation',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='accommodation',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:06
+
+import django.db.models.deletion
+from collections import Counter
+from datetime import timedelta
+from django.db import migrations, models
+
+
+# Frozen copies of api.availability.ACTIVE_STATUSES and stay_nights as of this migration
+ACTIVE_STATUSES = ('pending', 'confirmed')
+
+
+def stay_nights(start, end):
+    stop = max(end, start + timedelta(days=1))
+    return [start + timedelta(days=i) for i in range((stop - start).days)]
+
+
+def backfill_occupancy(apps, schema_editor):
+    Reservation = apps.get_model('api', 'Reservation')
+    NightOccupancy = apps.get_model('api', 'NightOccupancy')
+    booked = Counter()
+    active = Reservation.objects.filter(status__in=ACTIVE_STATUSES)
+    for accommodation_id, start, end in active.values_list('accommodation_id', 'start_date', 'end_date').iterator():
+        for night in stay_nights(start, end):
+            booked[accommodation_id, night] += 1
+    NightOccupancy.objects.bulk_create(
+        [NightOccupancy(accommodation_id=a, night=n, booked=b) for (a, n), b in booked.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NightOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('night', models.DateField()),
+                ('booked', models.PositiveIntegerField(default=0)),
+                ('accommodation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occupancy', to='api.accommodation')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('accommodation', 'night'), name='unique_accommodation_night')],
+            },
+        ),
+        migrations.RunPython(backfill_occupancy, migrations.RunPython.noop),
+    ]
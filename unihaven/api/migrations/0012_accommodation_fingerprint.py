@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:16
+
+import hashlib
+import re
+
+from django.db import migrations, models
+
+
+# Frozen copies of api.als.normalize_address and api.models.unit_fingerprint as of this migration
+def normalize_address(address):
+    return " ".join(re.sub(r"[^\w\s]", " ", (address or "").lower()).split())
+
+
+def unit_fingerprint(address, flat_number, floor_number, room_number):
+    unit = [normalize_address(address)] + [(part or '').strip().lower() for part in (flat_number, floor_number, room_number)]
+    return hashlib.sha1("|".join(unit).encode()).hexdigest()
+
+
+def backfill_fingerprints(apps, schema_editor):
+    Accommodation = apps.get_model('api', 'Accommodation')
+    seen = set()
+    batch = []
+    rows = Accommodation.objects.order_by('id').values_list('id', 'address', 'flat_number', 'floor_number', 'room_number')
+    for pk, *unit in rows.iterator():
+        fingerprint = unit_fingerprint(*unit)
+        # Existing duplicates keep a null fingerprint; the oldest listing owns the unit
+        if fingerprint in seen:
+            continue
+        seen.add(fingerprint)
+        batch.append(Accommodation(id=pk, fingerprint=fingerprint))
+        if len(batch) == 1000:
+            Accommodation.objects.bulk_update(batch, ['fingerprint'])
+            batch = []
+    Accommodation.objects.bulk_update(batch, ['fingerprint'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_email_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accommodation',
+            name='fingerprint',
+            field=models.CharField(editable=False, max_length=40, null=True),
+        ),
+        migrations.RunPython(backfill_fingerprints, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='accommodation',
+            name='fingerprint',
+            field=models.CharField(editable=False, max_length=40, null=True, unique=True),
+        ),
+    ]
@@ -1,66 +1,123 @@
-import requests
-import math
-import json
-import os
-from datetime import date, datetime
-from django.db import models
-from django.db.models import Avg
+import copy
+import hashlib
+from datetime import date, datetime, timedelta
+from django.db import models, transaction
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Cast, Coalesce, NullIf, Round
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db.models import JSONField
 from django.conf import settings
+from django.utils import timezone
 from users.models import User
+from api import als, availability
+from api.distance import calculate_distance
+from api.registry import DISTANCE_ENGINE, LOCATIONS
+from api.spatial import encode_geohash
 
-# Load university data dynamically
-DATA_PATH = os.path.join(settings.BASE_DIR, 'api/data/universities.json')
+GEOCODE_CACHE_TTL = timedelta(seconds=getattr(settings, 'GEOCODE_CACHE_TTL', 30 * 24 * 3600))
 
-def load_universities():
-    with open(DATA_PATH) as f:
-        return json.load(f)["universities"]
-
-def get_university_choices():
-    return [(u["code"], u["name"]) for u in load_universities()]
-
-def get_all_locations():
-    result = {}
-    for u in load_universities():
-        for label, coords in u["campuses"].items():
-            key = f"{u['code']} - {label}"
-            result[key] = tuple(coords)
-    return result
-
-LOCATIONS = get_all_locations()
-UNIVERSITY_CHOICES = get_university_choices()
-
-def calculate_distance(lat1, lon1, lat2, lon2):
-    lat1, lon1, lat2, lon2 = map(float, [lat1, lon1, lat2, lon2])
-    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
-    y = math.radians(lat2 - lat1)
-    distance = 6371 * math.sqrt(x*x + y*y)  # Distance in kilometers
-    return round(distance, 2)
+def _fetch_and_cache(key, address):
+    # Another caller may have filled the cache while we waited for the single-flight slot
+    cached = GeocodeCache.fresh(key)
+    if cached:
+        return cached.as_tuple()
+    result = als.breaker.call(als.fetch, address)
+    if result is None:
+        print("No address found.")
+        return None, None, ""
+    lat, lon, geo_address = result
+    GeocodeCache.objects.update_or_create(
+        address_key=key,
+        defaults={'address': als.normalize_address(address), 'latitude': lat, 'longitude': lon,
+                  'geo_address': (geo_address or "")[:50], 'fetched_at': timezone.now()},
+    )
+    return lat, lon, geo_address
 
 def lookup_coordinates_and_geoaddress(address):
-    url = "https://www.als.gov.hk/lookup"
-    params = {"q": address, "output": "JSON"}
-    headers = {"Accept": "application/json"}
+    key = GeocodeCache.key_for(address)
+    cached = GeocodeCache.fresh(key)
+    if cached:
+        als.increment('cache_hits')
+        return cached.as_tuple()
+    als.increment('cache_misses')
     try:
-        res = requests.get(url, params=params, headers=headers, timeout=10)
-        res.raise_for_status()
-        data = res.json()
-        suggestions = data.get("SuggestedAddress")
-        if not suggestions:
-            print("No address found.")
-            return None, None, ""
-        premises = suggestions[0]['Address']['PremisesAddress']
-        geo_info = premises['GeospatialInformation']
-        lat = float(geo_info['Latitude'])
-        lon = float(geo_info['Longitude'])
-        geo_address = premises.get("GeoAddress", "")
-        return lat, lon, geo_address
+        return als.single_flight.do(key, _fetch_and_cache, key, address)
+    except als.CircuitOpen:
+        als.increment('breaker_rejections')
+        return None, None, ""
     except Exception as e:
+        als.increment('errors')
         print(f"[ALS Lookup Error] {e}")
         return None, None, ""
 
-class Accommodation(models.Model):
+GEOCODE_STATUSES = [
+    ('pending', 'Pending'),
+    ('done', 'Done'),
+    ('failed', 'Failed'),
+]
+
+class DirtyFieldsMixin:
+    """Remembers the column values an instance was loaded with so save() can tell what changed."""
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.take_snapshot()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        if fields is None or getattr(self, '_loaded_values', None) is None:
+            self.take_snapshot()
+        else:
+            # Reading a deferred field lands here; keep the other fields' pending changes
+            self.mark_clean(*(self._meta.get_field(name).attname for name in fields))
+
+    def take_snapshot(self):
+        deferred = self.get_deferred_fields()
+        self._loaded_values = {
+            f.attname: copy.deepcopy(getattr(self, f.attname))
+            for f in self._meta.concrete_fields if f.attname not in deferred
+        }
+
+    def mark_clean(self, *fields):
+        if getattr(self, '_loaded_values', None) is not None:
+            for name in fields:
+                self._loaded_values[name] = copy.deepcopy(getattr(self, name))
+
+    def is_tracked(self):
+        return not self._state.adding and getattr(self, '_loaded_values', None) is not None
+
+    def dirty_fields(self):
+        """Attnames changed since load. Unsaved or untracked instances report every field.
+
+        A field deferred at load time and assigned since has no snapshot value,
+        so it counts as changed.
+        """
+        if not self.is_tracked():
+            return {f.attname for f in self._meta.concrete_fields}
+        loaded = self._loaded_values
+        return {
+            f.attname for f in self._meta.concrete_fields
+            if f.attname in self.__dict__ and (f.attname not in loaded or self.__dict__[f.attname] != loaded[f.attname])
+        }
+
+def derived_rating(rating_sum, rating_count):
+    """SQL expression for the 2dp average rating, 0 when there are no ratings."""
+    return Coalesce(Round(Cast(rating_sum, FloatField()) / NullIf(rating_count, 0), 2), Value(0.0))
+
+UNIT_FIELDS = ('address', 'flat_number', 'floor_number', 'room_number')
+
+def unit_fingerprint(address, flat_number, floor_number, room_number):
+    """Hash of the normalized address and unit, equal for trivially different spellings of one unit."""
+    unit = [als.normalize_address(address)] + [(part or '').strip().lower() for part in (flat_number, floor_number, room_number)]
+    return hashlib.sha1("|".join(unit).encode()).hexdigest()
+
+class AccommodationQuerySet(models.QuerySet):
+    def offered_to_university(self, university):
+        return self.filter(offered_to__university=university)
+
+class Accommodation(DirtyFieldsMixin, models.Model):
     PROPERTY_TYPES = [
         ('AP', 'Apartment'),
         ('HM', 'House - Entire'),
@@ -91,34 +148,211 @@ class Accommodation(models.Model):
     reserved = models.BooleanField(default=False)
     campus_distances = JSONField(default=dict)
     rating = models.FloatField(default=0.0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    geocode_status = models.CharField(max_length=10, choices=GEOCODE_STATUSES, default='done')
+    geo_cell = models.CharField(max_length=12, blank=True, db_index=True)
+    # Null only for rows the backfill found to duplicate an earlier listing
+    fingerprint = models.CharField(max_length=40, unique=True, null=True, editable=False)
+
+    objects = AccommodationQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['latitude', 'longitude']),
+            # Keyset pagination orderings
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['price', 'id']),
+        ]
+
+    def needs_geocode(self):
+        return not self.latitude or not self.longitude or not self.geo_address
+
+    def compute_campus_distances(self):
+        return DISTANCE_ENGINE.campus_distances(self.latitude, self.longitude, self.universities_offered)
+
+    def compute_fingerprint(self):
+        return unit_fingerprint(self.address, self.flat_number, self.floor_number, self.room_number)
+
+    def geocode_needed(self, dirty):
+        if 'address' not in dirty:
+            return False
+        if not self.is_tracked():
+            return self.needs_geocode() and (self._state.adding or self.geocode_status != 'pending')
+        # A new address needs new coordinates unless the caller supplied them too
+        return not ({'latitude', 'longitude'} & dirty) or not self.latitude or not self.longitude
 
     def save(self, *args, **kwargs):
-        if not self.latitude or not self.longitude or not self.geo_address:
-            lat, lon, geo_addr = lookup_coordinates_and_geoaddress(self.address)
-            self.latitude = lat
-            self.longitude = lon
-            self.geo_address = geo_addr
-
-        if self.latitude and self.longitude and self.universities_offered:
-            self.campus_distances = {}
-            for label, (lat_campus, lon_campus) in LOCATIONS.items():
-                if any(label.startswith(uni) for uni in self.universities_offered):
-                    self.campus_distances[label] = calculate_distance(
-                        self.latitude, self.longitude, lat_campus, lon_campus
-                    )
+        """Save only what changed since load, recomputing derived columns only when their inputs changed.
+
+        Loaded instances are saved with update_fields narrowed to their dirty
+        fields; an explicit update_fields limits both the write and the derived
+        work to those fields. updated_at is always written.
+        """
+        update_fields = kwargs.get('update_fields')
+        dirty = self.dirty_fields()
+        if update_fields is not None:
+            dirty &= {self._meta.get_field(name).attname for name in update_fields}
+        elif self.is_tracked():
+            update_fields = set(dirty)
+        derived = set()
+
+        # The ALS lookup is slow, so it never runs inside save(): the listing is
+        # stored straight away and a GeocodeJob fills in the coordinates later.
+        enqueue_geocode = self.geocode_needed(dirty)
+        if enqueue_geocode:
+            self.geocode_status = 'pending'
+            derived.add('geocode_status')
+
+        if dirty & set(UNIT_FIELDS):
+            self.fingerprint = self.compute_fingerprint()
+            derived.add('fingerprint')
+
+        if dirty & {'latitude', 'longitude', 'universities_offered'}:
+            if self.latitude and self.longitude and self.universities_offered:
+                self.campus_distances = self.compute_campus_distances()
+            else:
+                self.campus_distances = {}
+            self.geo_cell = encode_geohash(self.latitude, self.longitude) if self.latitude and self.longitude else ''
+            derived |= {'campus_distances', 'geo_cell'}
 
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | derived | {'updated_at'}
         super().save(*args, **kwargs)
 
+        if 'universities_offered' in dirty:
+            self.sync_universities()
+        if 'campus_distances' in derived:
+            self.sync_campus_distances()
+        self.take_snapshot()
+
+        if enqueue_geocode:
+            GeocodeJob.objects.update_or_create(
+                accommodation=self,
+                defaults={
+                    'status': 'pending',
+                    'attempts': 0,
+                    'next_attempt_at': timezone.now(),
+                    'last_error': '',
+                    'claimed_by': '',
+                },
+            )
+
+    def sync_universities(self):
+        """Mirror the universities_offered list into the indexed AccommodationUniversity rows."""
+        wanted = set(self.universities_offered or [])
+        existing = set(self.offered_to.values_list('university', flat=True))
+        if existing - wanted:
+            self.offered_to.filter(university__in=existing - wanted).delete()
+        if wanted - existing:
+            AccommodationUniversity.objects.bulk_create([
+                AccommodationUniversity(accommodation=self, university=code) for code in wanted - existing
+            ])
+
+    def sync_campus_distances(self):
+        """Mirror campus_distances into the indexed CampusDistance rows."""
+        self.distances.exclude(campus__in=list(self.campus_distances)).delete()
+        if self.campus_distances:
+            CampusDistance.objects.bulk_create(
+                [CampusDistance(accommodation=self, campus=label, km=km) for label, km in self.campus_distances.items()],
+                update_conflicts=True, unique_fields=['accommodation', 'campus'], update_fields=['km'],
+            )
+
+    def apply_geocode(self, lat, lon, geo_address):
+        self.latitude = lat
+        self.longitude = lon
+        self.geo_address = geo_address
+        self.geocode_status = 'done'
+        self.save(update_fields=['latitude', 'longitude', 'geo_address', 'geocode_status'])
+
     def average_rating(self):
-        ratings = self.ratings.all()
-        total = sum(r.value for r in ratings)
-        count = ratings.count()
-        return round(total / count, 2) if count > 0 else 0
+        return round(self.rating_sum / self.rating_count, 2) if self.rating_count > 0 else 0
+
+    @classmethod
+    def add_rating(cls, pk, value_delta, count_delta):
+        """Adjust the rating aggregates in one UPDATE, without touching any other column."""
+        rating_sum = F('rating_sum') + value_delta
+        rating_count = F('rating_count') + count_delta
+        cls.objects.filter(pk=pk).update(
+            rating_sum=rating_sum,
+            rating_count=rating_count,
+            rating=derived_rating(rating_sum, rating_count),
+            updated_at=timezone.now(),
+        )
 
     def __str__(self):
         return f"{self.title} - {self.get_property_type_display()}"
 
-class Reservation(models.Model):
+class AccommodationUniversity(models.Model):
+    accommodation = models.ForeignKey(Accommodation, on_delete=models.CASCADE, related_name='offered_to')
+    university = models.CharField(max_length=10)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['university', 'accommodation'], name='unique_accommodation_university'),
+        ]
+
+    def __str__(self):
+        return f"{self.accommodation_id} offered to {self.university}"
+
+class CampusDistance(models.Model):
+    accommodation = models.ForeignKey(Accommodation, on_delete=models.CASCADE, related_name='distances')
+    campus = models.CharField(max_length=100)
+    km = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['accommodation', 'campus'], name='unique_accommodation_campus'),
+        ]
+        indexes = [models.Index(fields=['campus', 'km'])]
+
+    def __str__(self):
+        return f"{self.accommodation_id} - {self.campus}: {self.km}km"
+
+class CapacityExceeded(Exception):
+    pass
+
+class NightOccupancy(models.Model):
+    """Beds held on one night at one listing by pending/confirmed reservations."""
+    accommodation = models.ForeignKey(Accommodation, on_delete=models.CASCADE, related_name='occupancy')
+    night = models.DateField()
+    booked = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['accommodation', 'night'], name='unique_accommodation_night'),
+        ]
+
+    @classmethod
+    def hold(cls, accommodation_id, start, end, capacity=None):
+        """Take a bed on every night of the stay.
+
+        With `capacity`, the increment is one guarded UPDATE (`booked < capacity`)
+        and CapacityExceeded is raised unless every night matched; the caller's
+        transaction then rolls back. The database serializes concurrent UPDATEs of
+        the same rows, so two bookings can never both take the last bed.
+        """
+        nights = availability.stay_nights(start, end)
+        cls.objects.bulk_create(
+            [cls(accommodation_id=accommodation_id, night=night) for night in nights], ignore_conflicts=True
+        )
+        rows = cls.objects.filter(accommodation_id=accommodation_id, night__gte=nights[0], night__lte=nights[-1])
+        if capacity is not None:
+            rows = rows.filter(booked__lt=capacity)
+        if rows.update(booked=F('booked') + 1) != len(nights) and capacity is not None:
+            raise CapacityExceeded("No bed is free for every night of this stay.")
+
+    @classmethod
+    def release(cls, accommodation_id, start, end):
+        nights = availability.stay_nights(start, end)
+        cls.objects.filter(
+            accommodation_id=accommodation_id, night__gte=nights[0], night__lte=nights[-1], booked__gt=0
+        ).update(booked=F('booked') - 1)
+
+    def __str__(self):
+        return f"{self.accommodation_id} - {self.night}: {self.booked}"
+
+class Reservation(DirtyFieldsMixin, models.Model):
     accommodation = models.ForeignKey(Accommodation, on_delete=models.CASCADE)
     student_name = models.CharField(max_length=255)
     student_email = models.EmailField()
@@ -134,6 +368,50 @@ class Reservation(models.Model):
     created_at = models.DateTimeField(default=datetime.now)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['created_at', 'id'])]
+
+    @staticmethod
+    def hold_for(accommodation_id, start_date, end_date, status):
+        """The (accommodation, start, end) whose nights a reservation occupies, or None once it is no longer active."""
+        if status not in availability.ACTIVE_STATUSES:
+            return None
+        return accommodation_id, start_date, end_date
+
+    def stored_hold(self):
+        """The hold of the row as stored now, read under a row lock so a stale instance never releases it twice."""
+        if self._state.adding:
+            return None
+        row = Reservation.objects.select_for_update().filter(pk=self.pk).values_list(
+            'accommodation_id', 'start_date', 'end_date', 'status'
+        ).first()
+        return self.hold_for(*row) if row else None
+
+    def save(self, *args, enforce_capacity=False, **kwargs):
+        """Save and move the held nights, raising CapacityExceeded instead of overbooking.
+
+        An existing reservation that takes nights it did not hold (reactivated
+        or moved) is always checked; a new one only with enforce_capacity.
+        """
+        adding = self._state.adding
+        try:
+            with transaction.atomic():
+                before = self.stored_hold()
+                super().save(*args, **kwargs)
+                after = self.hold_for(self.accommodation_id, self.start_date, self.end_date, self.status)
+                if before != after:
+                    if before:
+                        NightOccupancy.release(*before)
+                    if after:
+                        capacity = self.accommodation.beds if enforce_capacity or not adding else None
+                        NightOccupancy.hold(*after, capacity=capacity)
+        except CapacityExceeded:
+            if adding:
+                # The INSERT was rolled back with the rest of the transaction
+                self.pk, self._state.adding = None, True
+            raise
+        self.take_snapshot()
+
     def update_status(self):
         today = date.today()
         if self.status in ['cancelled', 'completed']:
@@ -157,5 +435,131 @@ class Rating(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['created_at', 'id'])]
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            previous = None
+            if not self._state.adding:
+                previous = Rating.objects.filter(pk=self.pk).values_list('accommodation_id', 'value').first()
+            super().save(*args, **kwargs)
+            if previous and previous[0] == self.accommodation_id:
+                if previous[1] != self.value:
+                    self.apply_to_accommodation(self.accommodation_id, self.value - previous[1], 0)
+                return
+            if previous:
+                self.apply_to_accommodation(previous[0], -previous[1], -1)
+            self.apply_to_accommodation(self.accommodation_id, self.value, 1)
+
+    def apply_to_accommodation(self, accommodation_id, value_delta, count_delta):
+        Accommodation.add_rating(accommodation_id, value_delta, count_delta)
+        # Keep an already-loaded accommodation in step with the row we just updated
+        if Rating.accommodation.is_cached(self) and self.accommodation.pk == accommodation_id:
+            acc = self.accommodation
+            acc.rating_sum += value_delta
+            acc.rating_count += count_delta
+            acc.rating = acc.average_rating()
+            acc.mark_clean('rating_sum', 'rating_count', 'rating')
+
     def __str__(self):
         return f"{self.value} stars for {self.accommodation.title}"
+
+class GeocodeCache(models.Model):
+    address_key = models.CharField(max_length=64, unique=True)
+    address = models.TextField()
+    latitude = models.DecimalField(max_digits=9, decimal_places=6)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6)
+    geo_address = models.CharField(max_length=50, blank=True)
+    fetched_at = models.DateTimeField(default=timezone.now)
+
+    @staticmethod
+    def key_for(address):
+        return hashlib.sha256(als.normalize_address(address).encode()).hexdigest()
+
+    @classmethod
+    def fresh(cls, key):
+        return cls.objects.filter(address_key=key, fetched_at__gte=timezone.now() - GEOCODE_CACHE_TTL).first()
+
+    def as_tuple(self):
+        return float(self.latitude), float(self.longitude), self.geo_address
+
+    def __str__(self):
+        return self.address
+
+class GeocodeJob(models.Model):
+    accommodation = models.OneToOneField(Accommodation, on_delete=models.CASCADE, related_name='geocode_job')
+    status = models.CharField(max_length=10, default='pending', choices=[
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('failed', 'Failed'),
+    ])
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    claimed_by = models.CharField(max_length=32, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+
+    def __str__(self):
+        return f"Geocode job for {self.accommodation.title} ({self.status})"
+
+class EmailOutbox(models.Model):
+    """A notification waiting to be mailed by `manage.py send_outbox`, written in the same transaction as its event."""
+    recipient = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=10, default='pending', choices=[
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ])
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # The drain() call delivering a 'sending' row; its claim lapses at next_attempt_at
+    claimed_by = models.CharField(max_length=32, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.recipient} ({self.status})"
+
+
+class DuplicateCandidate(models.Model):
+    """A listing that looks like a re-post of an older one, flagged by api/dedupe.py for staff review."""
+    accommodation = models.ForeignKey(Accommodation, on_delete=models.CASCADE, related_name='duplicate_flags')
+    duplicate_of = models.ForeignKey(Accommodation, on_delete=models.CASCADE, related_name='+')
+    similarity = models.FloatField()
+    status = models.CharField(max_length=10, default='open', choices=[
+        ('open', 'Open'),
+        ('confirmed', 'Confirmed'),
+        ('dismissed', 'Dismissed'),
+    ])
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['accommodation', 'duplicate_of'], name='unique_duplicate_pair'),
+        ]
+
+    def __str__(self):
+        return f"{self.accommodation_id} ~ {self.duplicate_of_id} ({self.similarity:.2f}, {self.status})"
+
+
+class DuplicateScan(models.Model):
+    """One run of the near-duplicate job; the next incremental run starts from the last started_at."""
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(null=True, blank=True)
+    scanned = models.PositiveIntegerField(default=0)
+    flagged = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Duplicate scan at {self.started_at:%Y-%m-%d %H:%M} ({self.flagged} flagged)"
@@ -0,0 +1,117 @@
+"""Background delivery of queued notification emails.
+
+Requests only insert EmailOutbox rows (inside the transaction that caused
+them); drain() later sends a batch over one reused mail connection, backing off
+and retrying rows whose delivery fails. With digest=True every pending message
+for the same mailbox goes out as a single email.
+
+drain() first claims its batch with one conditional UPDATE (status 'sending',
+its own claimed_by token, next_attempt_at pushed CLAIM_SECONDS ahead), so
+overlapping drains never send the same row twice. A claim left behind by a
+crashed drain lapses and the row is picked up again.
+"""
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from api.models import EmailOutbox
+
+MAX_ATTEMPTS = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 5)
+RETRY_BASE_SECONDS = getattr(settings, 'OUTBOX_RETRY_BASE_SECONDS', 60)
+CLAIM_SECONDS = 300
+
+
+def enqueue(recipient, subject, body):
+    return EmailOutbox.objects.create(recipient=recipient, subject=subject, body=body)
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0))
+
+
+def due(now):
+    """Rows ready to send: pending ones whose retry time has come, and lapsed claims."""
+    return EmailOutbox.objects.filter(Q(status='pending') | Q(status='sending'), next_attempt_at__lte=now)
+
+
+def claim(batch_size=100, now=None):
+    """Claim up to batch_size due rows for this caller alone and return them."""
+    now = now or timezone.now()
+    token = uuid.uuid4().hex
+    with transaction.atomic():
+        ids = list(
+            due(now).select_for_update(skip_locked=True).order_by('next_attempt_at', 'id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        # Re-checking due() in the UPDATE is what makes the claim safe where row locks are unavailable
+        due(now).filter(id__in=ids).update(
+            status='sending', claimed_by=token, next_attempt_at=timezone.now() + timedelta(seconds=CLAIM_SECONDS)
+        )
+    return list(EmailOutbox.objects.filter(status='sending', claimed_by=token).order_by('id'))
+
+
+def compose(rows, digest):
+    """[(EmailMessage, rows it delivers)] for a batch."""
+    if not digest:
+        return [(EmailMessage(r.subject, r.body, settings.DEFAULT_FROM_EMAIL, [r.recipient]), [r]) for r in rows]
+    by_recipient = defaultdict(list)
+    for row in rows:
+        by_recipient[row.recipient].append(row)
+    messages = []
+    for recipient, group in by_recipient.items():
+        if len(group) == 1:
+            subject, body = group[0].subject, group[0].body
+        else:
+            subject = f"UniHaven: {len(group)} reservation updates"
+            body = "\n\n".join(f"{r.subject}\n{r.body}" for r in group)
+        messages.append((EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, [recipient]), group))
+    return messages
+
+
+def drain(batch_size=100, digest=False, now=None):
+    """Claim and send one batch of due messages and return a summary of what happened."""
+    rows = claim(batch_size, now)
+    summary = {'processed': len(rows), 'sent': 0, 'emails': 0, 'retried': 0, 'failed': 0}
+    if not rows:
+        return summary
+
+    connection = get_connection()
+    connection.open()
+    try:
+        for message, group in compose(rows, digest):
+            ids = [r.id for r in group]
+            try:
+                connection.send_messages([message])
+            except Exception as e:
+                for outcome, count in record_failure(group, e).items():
+                    summary[outcome] += count
+                continue
+            EmailOutbox.objects.filter(id__in=ids).update(
+                status='sent', sent_at=timezone.now(), last_error='', claimed_by=''
+            )
+            summary['sent'] += len(ids)
+            summary['emails'] += 1
+    finally:
+        connection.close()
+    return summary
+
+
+def record_failure(group, error):
+    counts = {'retried': 0, 'failed': 0}
+    for row in group:
+        row.attempts += 1
+        row.last_error = str(error)
+        row.claimed_by = ''
+        if row.attempts >= MAX_ATTEMPTS:
+            row.status = 'failed'
+            counts['failed'] += 1
+        else:
+            row.status = 'pending'
+            row.next_attempt_at = timezone.now() + retry_delay(row.attempts)
+            counts['retried'] += 1
+        row.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at', 'claimed_by'])
+    return counts
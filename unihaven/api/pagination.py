@@ -0,0 +1,121 @@
+"""Keyset (cursor) pagination for the list endpoints.
+
+Pages are selected with `WHERE (key, id) > (last_key, last_id) ORDER BY key, id
+LIMIT n`, so deep pages cost the same as the first one. The cursor carries the
+last row's sort key and id; clients only ever follow the next/previous links.
+"""
+import base64
+import json
+from collections import OrderedDict
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    page_size = settings.REST_FRAMEWORK.get('PAGE_SIZE', 20)
+    max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 100)
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_ordering(self, request, view):
+        """(field, descending). Views list their keyset columns in `keyset_fields`, the first is the default."""
+        allowed = getattr(view, 'keyset_fields', ('id',))
+        requested = request.query_params.get(self.ordering_query_param, '')
+        field = requested.lstrip('-')
+        if field not in allowed:
+            return allowed[0], False
+        return field, requested.startswith('-')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            return cursor['v'], int(cursor['id']), bool(cursor.get('r'))
+        except (ValueError, KeyError, TypeError):
+            raise NotFound("Invalid cursor.")
+
+    def encode_cursor(self, obj, reverse):
+        value = getattr(obj, self.field) if not isinstance(obj, tuple) else obj[1]
+        pk = obj.id if not isinstance(obj, tuple) else obj[0]
+        payload = {'v': None if value is None else str(value), 'id': pk, 'r': int(reverse)}
+        encoded = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.field, self.descending = self.get_ordering(request, view)
+        size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor[2])
+        # Walking backwards is the same query with every comparison and sort flipped
+        descending = self.descending != reverse
+
+        if isinstance(queryset, list):
+            rows = self.slice_ranked(queryset, cursor, descending, size + 1)
+        else:
+            if cursor:
+                value, pk = cursor[0], cursor[1]
+                op = 'lt' if descending else 'gt'
+                queryset = queryset.filter(
+                    Q(**{f'{self.field}__{op}': value}) | Q(**{self.field: value, f'id__{op}': pk})
+                )
+            prefix = '-' if descending else ''
+            rows = list(queryset.order_by(f'{prefix}{self.field}', f'{prefix}id')[:size + 1])
+
+        has_more = len(rows) > size
+        rows = rows[:size]
+        if reverse:
+            rows.reverse()
+        self.next_link = self.previous_link = None
+        if rows:
+            if has_more or reverse:
+                self.next_link = self.encode_cursor(rows[-1], reverse=False)
+            if (has_more and reverse) or (cursor and not reverse):
+                self.previous_link = self.encode_cursor(rows[0], reverse=True)
+        return rows
+
+    def slice_ranked(self, ranked, cursor, descending, count):
+        """Keyset slice of a precomputed list of (id, key) pairs, e.g. ranked distances."""
+        keyed = sorted(((key, pk) for pk, key in ranked), reverse=descending)
+        if cursor:
+            position = (float(cursor[0]), cursor[1])
+            keyed = (k for k in keyed if (k < position if descending else k > position))
+        page = []
+        for key, pk in keyed:
+            page.append((pk, key))
+            if len(page) == count:
+                break
+        return page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.next_link),
+            ('previous', self.previous_link),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
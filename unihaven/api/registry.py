@@ -0,0 +1,154 @@
+"""The one place universities.json is read.
+
+REGISTRY parses the file lazily on first use and re-reads it when its mtime
+changes (checked at most once per CHECK_INTERVAL seconds), so campus edits
+take effect without restarting workers. Everything derived from campus
+positions (the DistanceEngine, per-university radian arrays) is rebuilt with
+it, and functions registered with on_reload() run after each reload so
+callers can drop their own derived state.
+
+LOCATIONS and DISTANCE_ENGINE are live views: code holding a reference to
+them always sees the current file.
+"""
+import json
+import math
+import os
+import threading
+import time
+from collections.abc import Mapping
+from django.conf import settings
+from api.distance import DistanceEngine
+
+DATA_PATH = os.path.join(settings.BASE_DIR, 'api/data/universities.json')
+CHECK_INTERVAL = 1.0
+
+
+class Snapshot:
+    """Everything derived from one version of universities.json."""
+
+    def __init__(self, universities, version):
+        self.version = version
+        self.universities = universities
+        self.names = {u['code']: u['name'] for u in universities}
+        self.choices = [(u['code'], u['name']) for u in universities]
+        self.locations = {
+            f"{u['code']} - {campus}": tuple(coords)
+            for u in universities for campus, coords in u['campuses'].items()
+        }
+        self.labels_by_university = {
+            u['code']: [f"{u['code']} - {campus}" for campus in u['campuses']] for u in universities
+        }
+        self.radians = {
+            code: [(math.radians(self.locations[l][0]), math.radians(self.locations[l][1])) for l in labels]
+            for code, labels in self.labels_by_university.items()
+        }
+        self.engine = DistanceEngine(self.locations)
+
+
+class UniversityRegistry:
+    def __init__(self, path=DATA_PATH, check_interval=CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.listeners = []
+        self._snapshot = None
+        self._mtime = None
+        self._checked_at = 0.0
+
+    def on_reload(self, callback):
+        self.listeners.append(callback)
+        return callback
+
+    def current(self):
+        now = time.monotonic()
+        if self._snapshot is not None and now - self._checked_at < self.check_interval:
+            return self._snapshot
+        self._checked_at = now
+        mtime = os.stat(self.path).st_mtime_ns
+        if self._snapshot is not None and mtime == self._mtime:
+            return self._snapshot
+        return self.reload(mtime)
+
+    def reload(self, mtime=None):
+        with self.lock:
+            mtime = mtime or os.stat(self.path).st_mtime_ns
+            if self._snapshot is not None and mtime == self._mtime:
+                return self._snapshot
+            with open(self.path) as f:
+                universities = json.load(f)["universities"]
+            first_load = self._snapshot is None
+            version = 1 if first_load else self._snapshot.version + 1
+            self._snapshot, self._mtime = Snapshot(universities, version), mtime
+        if not first_load:
+            for callback in self.listeners:
+                callback(self._snapshot)
+        return self._snapshot
+
+    @property
+    def version(self):
+        return self.current().version
+
+    @property
+    def choices(self):
+        return self.current().choices
+
+    @property
+    def locations(self):
+        return self.current().locations
+
+    @property
+    def engine(self):
+        return self.current().engine
+
+    def codes(self):
+        return list(self.current().names)
+
+    def name(self, code):
+        return self.current().names.get(code)
+
+    def campus_labels(self, university):
+        return self.current().labels_by_university.get(university, [])
+
+    def campus_radians(self, university):
+        """[(lat, lon)] in radians for each campus of one university, in file order."""
+        return self.current().radians.get(university, [])
+
+    def university_of(self, label):
+        code = label.split(" - ", 1)[0]
+        return code if label in self.current().locations else None
+
+
+class LiveLocations(Mapping):
+    """Read-only {campus label: (lat, lon)} that always reflects the registry."""
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    def __getitem__(self, label):
+        return self.registry.locations[label]
+
+    def __iter__(self):
+        return iter(self.registry.locations)
+
+    def __len__(self):
+        return len(self.registry.locations)
+
+
+class LiveEngine:
+    """Forwards to the DistanceEngine built from the registry's current campuses."""
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    def __getattr__(self, name):
+        return getattr(self.registry.engine, name)
+
+
+REGISTRY = UniversityRegistry()
+LOCATIONS = LiveLocations(REGISTRY)
+DISTANCE_ENGINE = LiveEngine(REGISTRY)
+
+
+def university_choices():
+    """Callable model-field choices, so the list follows the file without migrations."""
+    return REGISTRY.choices
@@ -1,3 +1,4 @@
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
 from api.models import Accommodation, Reservation, Rating
 
@@ -6,13 +7,22 @@ class AccommodationSerializer(serializers.ModelSerializer):
     campus_distances = serializers.JSONField(read_only=True)
     created_by = serializers.ReadOnlyField(source='created_by.username')
     rating = serializers.FloatField(read_only=True)
+    geocode_status = serializers.CharField(read_only=True)
 
     class Meta:
         model = Accommodation
         fields = '__all__'
-        read_only_fields = ['created_by']
+        read_only_fields = ['created_by', 'geo_cell', 'rating_sum', 'rating_count']
         unique_together = ('geo_address', 'flat_number', 'floor_number', 'room_number')
 
+    def update(self, instance, validated_data):
+        try:
+            with transaction.atomic():
+                return super().update(instance, validated_data)
+        except IntegrityError:
+            # The new address/flat/floor/room matches another listing's unique fingerprint
+            raise serializers.ValidationError("Another listing already exists for this unit.")
+
 class ReservationSerializer(serializers.ModelSerializer):
     created_by = serializers.ReadOnlyField(source='created_by.username')
 
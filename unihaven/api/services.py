@@ -0,0 +1,134 @@
+"""Accommodation, reservation and rating operations shared by the API and the HTML frontend.
+
+The DRF viewsets and the views in accommodations/views.py both call these
+functions directly, so university scoping and permission checks live in one
+place and a page render never makes a second HTTP request to the API.
+Failures are raised as DRF exceptions (NotFound, PermissionDenied).
+"""
+import random
+import time
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, transaction
+from rest_framework.exceptions import NotFound, PermissionDenied
+from api import dedupe, outbox
+from api.models import Accommodation, Reservation, Rating, CapacityExceeded, UNIT_FIELDS, unit_fingerprint
+
+RESERVATION_RETRIES = getattr(settings, 'RESERVATION_RETRIES', 5)
+RESERVATION_RETRY_SECONDS = getattr(settings, 'RESERVATION_RETRY_SECONDS', 0.02)
+
+
+def accommodations_for(user):
+    return Accommodation.objects.offered_to_university(user.university)
+
+
+def get_accommodation(user, pk):
+    try:
+        return accommodations_for(user).get(pk=pk)
+    except (Accommodation.DoesNotExist, ValueError, TypeError):
+        raise NotFound("Accommodation not found.")
+
+
+def create_accommodation(user, data):
+    fingerprint = unit_fingerprint(*(data.get(name) for name in UNIT_FIELDS))
+    if Accommodation.objects.filter(fingerprint=fingerprint).exists():
+        raise PermissionDenied("Duplicate accommodation entry.")
+    try:
+        with transaction.atomic():
+            accommodation = Accommodation.objects.create(created_by=user, **data)
+    except IntegrityError:
+        # A concurrent create of the same unit won the unique fingerprint index
+        raise PermissionDenied("Duplicate accommodation entry.")
+    # Re-posts with reworded text are only flagged for review, not rejected
+    dedupe.check_listing(accommodation)
+    return accommodation
+
+
+def reservations_for(user):
+    return Reservation.objects.filter(created_by__university=user.university)
+
+
+def get_reservation(user, pk):
+    try:
+        return reservations_for(user).get(pk=pk)
+    except (Reservation.DoesNotExist, ValueError, TypeError):
+        raise NotFound("Reservation not found.")
+
+
+def create_reservation(user, data):
+    accommodation = data['accommodation']
+    if user.university not in accommodation.universities_offered:
+        raise PermissionDenied("You can only reserve accommodations offered to your university.")
+
+    return book(user, data, notify=True)
+
+
+def book(user, data, notify=False):
+    """Insert a reservation and take its beds in one transaction, retrying briefly on lock contention."""
+    for attempt in range(RESERVATION_RETRIES):
+        try:
+            with transaction.atomic():
+                reservation = Reservation(created_by=user, **data)
+                reservation.save(enforce_capacity=True)
+                if notify:
+                    notify_staff(user, reservation.accommodation, reservation.student_name, cancelled=False)
+            return reservation
+        except CapacityExceeded:
+            raise PermissionDenied("This accommodation is fully booked.")
+        except OperationalError:
+            # SQLite "database is locked" or a server-side deadlock: back off and try again
+            if attempt == RESERVATION_RETRIES - 1:
+                raise
+            time.sleep(RESERVATION_RETRY_SECONDS * 2 ** attempt * (1 + random.random()))
+
+
+def update_reservation(user, reservation, data):
+    """Apply an edit; reactivating or moving the stay needs free beds like a new booking."""
+    for name, value in data.items():
+        setattr(reservation, name, value)
+    try:
+        with transaction.atomic():
+            reservation.save()
+    except CapacityExceeded:
+        raise PermissionDenied("This accommodation is fully booked.")
+    return reservation
+
+
+def cancel_reservation(user, reservation, confirm_to=None):
+    """Cancel and queue the staff notification (and optionally a confirmation) in the same transaction.
+
+    Cancelling an already cancelled reservation changes nothing.
+    """
+    with transaction.atomic():
+        current = Reservation.objects.select_for_update().filter(pk=reservation.pk).values_list('status', flat=True)
+        if current.first() == 'cancelled':
+            # Already cancelled by another request; its beds were released and staff notified then
+            reservation.refresh_from_db()
+            return reservation
+        reservation.status = 'cancelled'
+        reservation.save()
+        notify_staff(user, reservation.accommodation, reservation.student_name, cancelled=True)
+        if confirm_to:
+            outbox.enqueue(
+                confirm_to, 'UniHaven: Reservation Cancelled', 'The reservation has been cancelled successfully.'
+            )
+    return reservation
+
+
+def notify_staff(user, accommodation, student_name, cancelled=False):
+    subject = f"Reservation {'Cancelled' if cancelled else 'Created'} - {accommodation.title}"
+    message = (
+        f"Reservation for {student_name} has been {'cancelled' if cancelled else 'created'} for {accommodation.title}\n"
+        f"University: {user.university}"
+    )
+    uni_email = f"accommodation@{user.university.lower()}.hk"
+    # Delivered later by `manage.py send_outbox`, so the request never waits on the mail server
+    outbox.enqueue(uni_email, subject, message)
+
+
+def ratings_for(user):
+    return Rating.objects.all()
+
+
+def create_rating(user, data):
+    # Rating.save() updates the accommodation's rating aggregates in the same transaction
+    return Rating.objects.create(created_by=user, **data)
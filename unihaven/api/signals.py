@@ -0,0 +1,49 @@
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from api.models import Accommodation, NightOccupancy, Reservation, Rating
+from api import cache
+from api.registry import REGISTRY
+
+
+def universities_of(accommodation):
+    # The snapshot still holds the pre-save values here, so a listing moved
+    # away from a university invalidates that university as well.
+    previous = getattr(accommodation, '_loaded_values', None) or {}
+    return set(accommodation.universities_offered or []) | set(previous.get('universities_offered') or [])
+
+
+@receiver(post_save, sender=Accommodation)
+@receiver(post_delete, sender=Accommodation)
+def invalidate_accommodation(sender, instance, **kwargs):
+    cache.bump(*universities_of(instance))
+
+
+@receiver(post_save, sender=Reservation)
+@receiver(post_delete, sender=Reservation)
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def invalidate_related(sender, instance, **kwargs):
+    offered = Accommodation.objects.filter(pk=instance.accommodation_id).values_list('universities_offered', flat=True)
+    for universities in offered:
+        cache.bump(*universities)
+
+
+@receiver(pre_delete, sender=Reservation)
+def release_nights(sender, instance, **kwargs):
+    # A signal rather than Reservation.delete() so cascades and queryset deletes release too;
+    # it runs inside the deletion's transaction, before the row is gone
+    hold = instance.stored_hold()
+    if hold:
+        NightOccupancy.release(*hold)
+
+
+@receiver(post_delete, sender=Rating)
+def remove_rating(sender, instance, **kwargs):
+    # Also fires for cascades and queryset deletes, which skip Rating.delete()
+    instance.apply_to_accommodation(instance.accommodation_id, -instance.value, -1)
+
+
+@REGISTRY.on_reload
+def invalidate_campuses(snapshot):
+    # Cached filter responses embed campus distances; stored ones need `manage.py rebuild_campus_distances`
+    cache.bump_all()
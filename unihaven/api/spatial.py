@@ -0,0 +1,100 @@
+"""Spatial lookups around a campus or any (lat, lon) point.
+
+Every geocoded Accommodation stores a geohash cell in `geo_cell` (indexed) and
+its coordinates sit under a (latitude, longitude) index. Radius queries first
+prune in SQL with the covering cells and a bounding box, then run exact
+distance checks on the survivors only.
+"""
+import math
+from api.distance import EARTH_RADIUS_KM
+
+GEOHASH_PRECISION = 6  # cells are ~1.2km x 0.6km
+MAX_COVERING_CELLS = 256
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def encode_geohash(lat, lon, precision=GEOHASH_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    lat, lon = float(lat), float(lon)
+    cell, bits, bit_count, even = [], 0, 0, True
+    while len(cell) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            cell.append(_BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(cell)
+
+
+def cell_size(precision=GEOHASH_PRECISION):
+    """(lat degrees, lon degrees) spanned by one cell."""
+    lon_bits = math.ceil(precision * 5 / 2)
+    lat_bits = math.floor(precision * 5 / 2)
+    return 180 / 2 ** lat_bits, 360 / 2 ** lon_bits
+
+
+def bounding_box(lat, lon, radius_km):
+    """(min_lat, max_lat, min_lon, max_lon) containing every point within radius_km."""
+    lat, lon = float(lat), float(lon)
+    dlat = radius_km / KM_PER_DEGREE
+    widest = max(abs(lat - dlat), abs(lat + dlat))
+    dlon = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(min(widest, 89.9))), 1e-6))
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+
+def covering_cells(lat, lon, radius_km, precision=GEOHASH_PRECISION, max_cells=MAX_COVERING_CELLS):
+    """Geohash cells overlapping the bounding box, or None when there would be too many to list."""
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_km)
+    step_lat, step_lon = cell_size(precision)
+    rows = int((max_lat - min_lat) / step_lat) + 2
+    cols = int((max_lon - min_lon) / step_lon) + 2
+    if rows * cols > max_cells:
+        return None
+    cells = set()
+    for r in range(rows):
+        for c in range(cols):
+            cells.add(encode_geohash(min(min_lat + r * step_lat, max_lat), min(min_lon + c * step_lon, max_lon), precision))
+    return cells
+
+
+def prune(queryset, lat, lon, radius_km):
+    """Restrict a queryset to listings that can be within radius_km, using indexed columns only."""
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_km)
+    queryset = queryset.filter(
+        latitude__gte=min_lat, latitude__lte=max_lat,
+        longitude__gte=min_lon, longitude__lte=max_lon,
+    )
+    cells = covering_cells(lat, lon, radius_km)
+    if cells is not None:
+        queryset = queryset.filter(geo_cell__in=cells)
+    return queryset
+
+
+def within_radius(queryset, lat, lon, radius_km, limit=None):
+    """(id, km) pairs within radius_km of (lat, lon), nearest first."""
+    from api.models import DISTANCE_ENGINE
+    rows = list(prune(queryset, lat, lon, radius_km).values_list('id', 'latitude', 'longitude'))
+    return DISTANCE_ENGINE.rank((lat, lon), rows, max_distance=radius_km, limit=limit)
+
+
+def nearest(queryset, lat, lon, k, start_km=1.0, max_km=64.0):
+    """The k nearest geocoded listings, widening the search radius until enough are found."""
+    from api.models import DISTANCE_ENGINE
+    radius = start_km
+    while radius <= max_km:
+        ranked = within_radius(queryset, lat, lon, radius, limit=k)
+        if len(ranked) >= k:
+            return ranked
+        radius *= 2
+    rows = queryset.filter(latitude__isnull=False, longitude__isnull=False)
+    return DISTANCE_ENGINE.rank((lat, lon), list(rows.values_list('id', 'latitude', 'longitude')), limit=k)
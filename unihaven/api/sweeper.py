@@ -0,0 +1,77 @@
+"""Date-driven reservation status transitions, applied in bulk.
+
+Reservation.update_status() moves one reservation at a time. The sweeper
+applies the same forward transitions to every reservation at once with chunked,
+set-based UPDATEs:
+
+    pending             -> confirmed  once start_date <= today <= end_date
+    pending, confirmed  -> completed  once end_date < today
+
+Each UPDATE repeats its date condition, so a sweep is idempotent and safe to
+run next to normal traffic. Completed stays only held past nights, so the
+sweeper also drops NightOccupancy rows for nights before today.
+"""
+import threading
+import time
+from datetime import date
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from api import cache
+from api.models import NightOccupancy, Reservation
+
+CHUNK_SIZE = 1000
+
+
+def transitions(today):
+    return [
+        ('completed', Reservation.objects.filter(status__in=['pending', 'confirmed'], end_date__lt=today)),
+        ('confirmed', Reservation.objects.filter(status='pending', start_date__lte=today, end_date__gte=today)),
+    ]
+
+
+def move(queryset, status, chunk_size):
+    moved = 0
+    while True:
+        ids = list(queryset.order_by('id').values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return moved
+        # One short transaction per chunk keeps row locks brief
+        with transaction.atomic():
+            moved += queryset.filter(id__in=ids).update(status=status, updated_at=timezone.now())
+
+
+def prune_nights(today, chunk_size):
+    pruned = 0
+    while True:
+        ids = list(NightOccupancy.objects.filter(night__lt=today).values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return pruned
+        pruned += NightOccupancy.objects.filter(id__in=ids).delete()[0]
+
+
+def sweep_reservations(today=None, chunk_size=CHUNK_SIZE):
+    """Apply every due transition. Returns rows moved per new status, nights pruned and elapsed seconds."""
+    today = today or date.today()
+    started = time.perf_counter()
+    summary = {status: move(queryset, status, chunk_size) for status, queryset in transitions(today)}
+    summary['pruned_nights'] = prune_nights(today, chunk_size)
+    if summary['completed'] or summary['confirmed']:
+        # Bulk updates skip the model signals
+        cache.bump_all()
+    summary['seconds'] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+def start(interval=3600, chunk_size=CHUNK_SIZE):
+    """Run sweep_reservations() every `interval` seconds on a daemon thread inside this process."""
+    stop = threading.Event()
+
+    def loop():
+        while not stop.is_set():
+            close_old_connections()
+            sweep_reservations(chunk_size=chunk_size)
+            stop.wait(interval)
+
+    thread = threading.Thread(target=loop, name="reservation-sweeper", daemon=True)
+    thread.start()
+    return stop
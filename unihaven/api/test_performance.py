@@ -0,0 +1,160 @@
+"""Query-count and latency regression checks for the API and frontend pages.
+
+Each endpoint is requested against datasets of increasing size. The test fails
+when an endpoint's SQL query count changes with the number of rows (an N+1 or
+a queryset turned into a Python loop) or when its median time at a size
+exceeds the stored baseline by more than the allowed margin.
+
+Wall-clock timings depend on the machine, so the checks only run when asked:
+
+    UNIHAVEN_PERF=1 python manage.py test api.test_performance
+
+Environment:
+    UNIHAVEN_PERF          set to run these tests; a plain `manage.py test` skips them
+    PERF_MARGIN            allowed slowdown over the baseline, 1.0 = twice as slow (default 1.0)
+    PERF_SLACK_MS          extra absolute allowance for very fast endpoints (default 5)
+    PERF_REPORT            where to write the JSON report (default: unihaven_perf_report.json in the temp dir)
+    PERF_UPDATE_BASELINE   set to 1 to rewrite api/perf_baseline.json from this run
+"""
+import json
+import os
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+from unittest import skipUnless
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from api.models import Accommodation, Reservation, Rating
+from users.models import User
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'perf_baseline.json')
+MARGIN = float(os.environ.get('PERF_MARGIN', 1.0))
+SLACK_MS = float(os.environ.get('PERF_SLACK_MS', 5))
+REPORT_PATH = os.environ.get('PERF_REPORT') or os.path.join(tempfile.gettempdir(), 'unihaven_perf_report.json')
+UPDATE_BASELINE = os.environ.get('PERF_UPDATE_BASELINE') == '1'
+
+SIZES = (5, 20, 60)
+REPEATS = 5
+
+
+@skipUnless(os.environ.get('UNIHAVEN_PERF'), "set UNIHAVEN_PERF=1 to run the performance checks")
+class EndpointPerformanceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = User.objects.create_user(
+            username="perf-student", password="testpass123", university="HKU", is_student=True
+        )
+        cls.staff = User.objects.create_user(
+            username="perf-staff", password="testpass123", university="HKU", is_cedars_staff=True
+        )
+
+    def setUp(self):
+        self.api_client = APIClient()
+        self.api_client.force_authenticate(user=self.student)
+        self.staff_client = Client()
+        self.staff_client.force_login(self.staff)
+        self.student_client = Client()
+        self.student_client.force_login(self.student)
+        self.seeded = 0
+        self.first_listing = None
+
+    def endpoints(self):
+        """name -> (client, url). Every request must answer 200."""
+        filter_url = reverse("accommodation-filter")
+        return {
+            'api accommodations': (self.api_client, "/api/accommodations/?page_size=100"),
+            'api accommodation detail': (self.api_client, f"/api/accommodations/{self.first_listing.pk}/"),
+            'api filter': (self.api_client, f"{filter_url}?page_size=100"),
+            'api filter by campus': (self.api_client, f"{filter_url}?campus_label=HKU - Main Campus&page_size=100"),
+            'api filter near point': (self.api_client, f"{filter_url}?lat=22.3&lon=114.2&page_size=100"),
+            'api reservations': (self.api_client, "/api/reservations/"),
+            'api reservation filter': (self.api_client, reverse("reservation-filter")),
+            'api ratings': (self.api_client, "/api/ratings/"),
+            'api me': (self.api_client, reverse("me-view")),
+            'page accommodation list': (self.student_client, reverse("accommodation_list")),
+            'page accommodation detail': (self.student_client, reverse("accommodation_detail", args=[self.first_listing.pk])),
+            'page my reservations': (self.student_client, reverse("my_reservations")),
+            'page all reservations': (self.staff_client, reverse("view_reservations")),
+            'page all ratings': (self.staff_client, reverse("view_all_ratings")),
+        }
+
+    def seed(self, size):
+        """Grow the dataset to `size` listings, each with a reservation and a rating by its own owner."""
+        for i in range(self.seeded, size):
+            owner = User.objects.create_user(username=f"perf-owner-{i}", password="x", university="HKU")
+            listing = Accommodation.objects.create(
+                title=f"Perf listing {i}", description="A nice place", property_type="AP",
+                price=1000 + i, beds=2, bedrooms=1, address=f"{i} Perf St, HK", flat_number="1A",
+                floor_number="1", available_from=date.today(), available_to=date.today() + timedelta(days=60),
+                created_by=owner, universities_offered=["HKU"], geo_address="Geo",
+                latitude=22.28 + i * 0.001, longitude=114.13 + i * 0.001,
+            )
+            for user in (owner, self.student):
+                Reservation.objects.create(
+                    accommodation=listing, student_name=user.username, student_email="perf@example.com",
+                    start_date=date.today() + timedelta(days=i % 30), end_date=date.today() + timedelta(days=i % 30 + 2),
+                    created_by=user,
+                )
+            Rating.objects.create(accommodation=listing, student_name=owner.username, value=1 + i % 5, created_by=owner)
+            self.first_listing = self.first_listing or listing
+        self.seeded = size
+
+    def measure(self, client, url):
+        """(query count, median milliseconds) for one endpoint, each call starting with a cold filter cache."""
+        cache.clear()
+        client.get(url)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        # Read now: the next request_started signal clears connection.queries
+        count = len(queries)
+        timings = []
+        for _ in range(REPEATS):
+            cache.clear()
+            started = time.perf_counter()
+            client.get(url)
+            timings.append((time.perf_counter() - started) * 1000)
+        return count, round(statistics.median(timings), 3)
+
+    def test_endpoint_cost_does_not_grow_with_rows(self):
+        """Query counts stay flat across dataset sizes and latency stays within the baseline margin."""
+        baseline = {}
+        if os.path.exists(BASELINE_PATH):
+            with open(BASELINE_PATH) as f:
+                baseline = json.load(f)
+
+        results = {}
+        for size in SIZES:
+            self.seed(size)
+            for name, (client, url) in self.endpoints().items():
+                queries, median_ms = self.measure(client, url)
+                entry = results.setdefault(name, {'queries': {}, 'median_ms': {}, 'baseline_ms': {}, 'problems': []})
+                entry['queries'][str(size)] = queries
+                entry['median_ms'][str(size)] = median_ms
+                expected = baseline.get(name, {}).get(str(size))
+                entry['baseline_ms'][str(size)] = expected
+                if not UPDATE_BASELINE and expected is not None and median_ms > expected * (1 + MARGIN) + SLACK_MS:
+                    entry['problems'].append(f"{median_ms}ms at {size} rows, baseline {expected}ms")
+        for entry in results.values():
+            if len(set(entry['queries'].values())) > 1:
+                entry['problems'].insert(0, f"query count grows with rows: {entry['queries']}")
+
+        report = {
+            'sizes': list(SIZES), 'repeats': REPEATS, 'margin': MARGIN, 'slack_ms': SLACK_MS,
+            'database': connection.vendor, 'endpoints': results,
+        }
+        with open(REPORT_PATH, 'w') as f:
+            json.dump(report, f, indent=2)
+        if UPDATE_BASELINE:
+            with open(BASELINE_PATH, 'w') as f:
+                json.dump({name: entry['median_ms'] for name, entry in results.items()}, f, indent=2, sort_keys=True)
+                f.write("\n")
+
+        problems = [f"{name}: {problem}" for name, entry in results.items() for problem in entry['problems']]
+        self.assertFalse(problems, "\n".join(problems + [f"Full report: {REPORT_PATH}"]))
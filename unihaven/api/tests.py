@@ -1,31 +1,63 @@
+import importlib
+import io
 import json
 import math
 import os
+import tempfile
+import threading
+import time
 import requests
 from datetime import date, timedelta
 from decimal import Decimal
 from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.core import mail
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.utils import timezone
 from unittest.mock import patch, MagicMock
+from django.core.management import call_command
 from django.contrib.admin.sites import AdminSite
 from django.core.exceptions import ValidationError
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import Q
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.authtoken.models import Token
 from random import randint
-from api.models import Accommodation, Reservation, Rating, calculate_distance
+from api.models import Accommodation, Reservation, Rating, GeocodeJob, CampusDistance, NightOccupancy, EmailOutbox, DuplicateCandidate, calculate_distance, unit_fingerprint
+from api import geocoding
+from api.geocoding import process_jobs, queue_stats
+from api import als
+from api.models import lookup_coordinates_and_geoaddress, LOCATIONS, DISTANCE_ENGINE
+from api.distance import DistanceEngine
+from api import spatial
+from api import availability
+from api import services
+from api import sweeper
+from api import outbox
+from api import dedupe
+from api import importer
+from api import export
+from api import cache as filter_cache
+from api.registry import UniversityRegistry
 from api.serializers import AccommodationSerializer, ReservationSerializer, RatingSerializer
 from api.views import MeView, AccommodationFilterView, ReservationFilterView, ReservationCancelView
 from api.viewsets import AccommodationViewSet, ReservationViewSet, RatingViewSet
 from api.admin import AccommodationAdmin, ReservationAdmin, RatingAdmin
 from accommodations.forms import AccommodationForm, ReservationForm, RatingForm, CancelReservationForm
 from users.models import User, StudentProfile, StaffProfile, AdminProfile
+from users import principal
 
 class UniHavenTests(TestCase):
     def setUp(self):
         """Set up test environment with client, users, and sample data."""
         self.client = Client()
         self.api_client = APIClient()
+        cache.clear()
         
         # Create test users
         self.user_student = User.objects.create_user(
@@ -91,7 +123,7 @@ class UniHavenTests(TestCase):
                 }
             ]
         }
-        with patch("api.models.DATA_PATH", "/tmp/universities.json"):
+        with patch("api.registry.DATA_PATH", "/tmp/universities.json"):
             with patch("builtins.open", MagicMock()) as mock_open:
                 mock_open.return_value.__enter__.return_value.read.return_value = json.dumps(universities_data)
                 return universities_data
@@ -148,14 +180,15 @@ class UniHavenTests(TestCase):
             email="testuser@example.com"
         )
         StudentProfile.objects.create(user=user, university="HKU", UID="1234567890")
-        with patch('builtins.hasattr') as mock_hasattr:
-            mock_hasattr.side_effect = lambda obj, attr: attr in ['student_profile', 'staff_profile']
-            with self.assertRaises(ValidationError) as cm:
-                user.clean()
-            self.assertEqual(
-                str(cm.exception),
-                "['A user can only have one profile role (student, staff, admin).']"
-            )
+        with self.assertNumQueries(1):
+            user.clean()
+        StaffProfile.objects.create(user=user, university="HKU")
+        with self.assertRaises(ValidationError) as cm:
+            user.clean()
+        self.assertEqual(
+            str(cm.exception),
+            "['A user can only have one profile role (student, staff, admin).']"
+        )
 
     def test_user_clean_multiple_roles(self):
         """Test that creating multiple profile roles raises ValidationError."""
@@ -240,7 +273,12 @@ class UniHavenTests(TestCase):
             available_to=date.today() + timedelta(days=30), created_by=self.user_staff,
             universities_offered=["HKU"]
         )
-        self.assertEqual(accommodation.latitude, 22.283)
+        self.assertEqual(accommodation.geocode_status, "pending")
+        mock_lookup.assert_not_called()
+        process_jobs()
+        accommodation.refresh_from_db()
+        self.assertEqual(accommodation.geocode_status, "done")
+        self.assertEqual(float(accommodation.latitude), 22.283)
         self.assertEqual(accommodation.property_type, "AP")
         self.assertEqual(accommodation.price, 1000.00)
         self.assertEqual(accommodation.beds, 2)
@@ -269,9 +307,12 @@ class UniHavenTests(TestCase):
                     available_to=date.today() + timedelta(days=30), created_by=self.user_staff,
                     universities_offered=["HKU"]
                 )
+                process_jobs()
+            accommodation.refresh_from_db()
             self.assertIsNone(accommodation.latitude)
             self.assertIsNone(accommodation.longitude)
-            self.assertEqual(accommodation.geo_address, "")
+            self.assertFalse(accommodation.geo_address)
+            self.assertEqual(accommodation.geocode_job.attempts, 1)
 
     @patch("api.models.lookup_coordinates_and_geoaddress")
     def test_accommodation_lookup_exception(self, mock_get):
@@ -287,9 +328,154 @@ class UniHavenTests(TestCase):
                     available_to=date.today() + timedelta(days=30), created_by=self.user_staff,
                     universities_offered=["HKU"]
                 )
+                process_jobs()
+            accommodation.refresh_from_db()
             self.assertIsNone(accommodation.latitude)
             self.assertIsNone(accommodation.longitude)
-            self.assertEqual(accommodation.geo_address, "")
+            self.assertFalse(accommodation.geo_address)
+            self.assertEqual(accommodation.geocode_status, "pending")
+
+    @patch("api.models.lookup_coordinates_and_geoaddress")
+    def test_geocode_job_retries_then_fails(self, mock_lookup):
+        """Test failed lookups are retried with backoff and eventually marked failed."""
+        mock_lookup.return_value = (None, None, "")
+        accommodation = Accommodation.objects.create(
+            title="Retry Apartment", description="A nice place", property_type="AP",
+            price=1000.00, beds=2, bedrooms=1, address="Nowhere St, HK",
+            flat_number="5E", floor_number="5", available_from=date.today(),
+            available_to=date.today() + timedelta(days=30), created_by=self.user_staff,
+            universities_offered=["HKU"]
+        )
+        job = accommodation.geocode_job
+        for attempt in range(1, 6):
+            summary = process_jobs(now=job.next_attempt_at)
+            job.refresh_from_db()
+            self.assertEqual(job.attempts, attempt)
+        self.assertEqual(summary["failed"], 1)
+        self.assertEqual(job.status, "failed")
+        accommodation.refresh_from_db()
+        self.assertEqual(accommodation.geocode_status, "failed")
+
+    @patch("api.models.lookup_coordinates_and_geoaddress")
+    def test_geocode_claim_is_exclusive(self, mock_lookup):
+        """Test overlapping workers never share a job and an abandoned claim is picked up once it lapses."""
+        mock_lookup.return_value = (22.28, 114.13, "Geo")
+        for i in range(3):
+            Accommodation.objects.create(
+                title=f"Claimed {i}", description="A nice place", property_type="AP",
+                price=1000.00, beds=2, bedrooms=1, address=f"{i} Claim St, HK",
+                flat_number="1A", floor_number="1", available_from=date.today(),
+                available_to=date.today() + timedelta(days=30), created_by=self.user_staff,
+                universities_offered=["HKU"]
+            )
+        first = geocoding.claim()
+        self.assertEqual(len(first), 3)
+        self.assertEqual(geocoding.claim(), [])
+        self.assertEqual(process_jobs()["processed"], 0)
+        mock_lookup.assert_not_called()
+        self.assertEqual(queue_stats()["pending"], 3)
+        # The first worker died before geocoding; its claim lapses after CLAIM_SECONDS
+        later = timezone.now() + timedelta(seconds=geocoding.CLAIM_SECONDS + 1)
+        self.assertEqual(process_jobs(now=later)["geocoded"], 3)
+        self.assertFalse(GeocodeJob.objects.exists())
+        self.assertEqual(Accommodation.objects.filter(title__startswith="Claimed", geocode_status="done").count(), 3)
+
+    def test_geocode_queue_stats(self):
+        """Test queue depth and lag reporting."""
+        self.assertEqual(queue_stats()["pending"], 0)
+        with patch("api.models.lookup_coordinates_and_geoaddress") as mock_lookup:
+            Accommodation.objects.create(
+                title="Queued Apartment", description="A nice place", property_type="AP",
+                price=1000.00, beds=2, bedrooms=1, address="789 Queue St, HK",
+                flat_number="6F", floor_number="6", available_from=date.today(),
+                available_to=date.today() + timedelta(days=30), created_by=self.user_staff,
+                universities_offered=["HKU"]
+            )
+            mock_lookup.assert_not_called()
+        stats = queue_stats()
+        self.assertEqual(stats["pending"], 1)
+        self.assertEqual(stats["due"], 1)
+        self.assertGreaterEqual(stats["lag_seconds"], 0)
+
+    def als_response(self):
+        return MagicMock(status_code=200, json=lambda: {"SuggestedAddress": [{"Address": {"PremisesAddress": {
+            "GeospatialInformation": {"Latitude": "22.2839", "Longitude": "114.1376"},
+            "GeoAddress": "3828112495T20050430",
+        }}}]})
+
+    def test_geocode_cache_reuses_lookup(self):
+        """Test repeated lookups of the same (normalized) address hit the cache instead of ALS."""
+        als.reset_stats()
+        with patch("api.als.SESSION.get", return_value=self.als_response()) as mock_get:
+            first = lookup_coordinates_and_geoaddress("Haking Wong Building, HKU")
+            second = lookup_coordinates_and_geoaddress("  haking wong building hku. ")
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(first, second)
+        self.assertEqual(first[2], "3828112495T20050430")
+        counters = als.stats()
+        self.assertEqual(counters["cache_hits"], 1)
+        self.assertEqual(counters["cache_misses"], 1)
+
+    def test_geocode_circuit_breaker_opens(self):
+        """Test repeated ALS timeouts open the breaker so later lookups fail fast."""
+        als.reset_stats()
+        with patch("builtins.print"), patch("api.als.SESSION.get", side_effect=requests.Timeout("slow")) as mock_get:
+            for i in range(als.breaker.failure_threshold + 3):
+                self.assertEqual(lookup_coordinates_and_geoaddress(f"{i} Slow Road"), (None, None, ""))
+        self.assertEqual(mock_get.call_count, als.breaker.failure_threshold)
+        counters = als.stats()
+        self.assertEqual(counters["breaker_state"], "open")
+        self.assertEqual(counters["breaker_rejections"], 3)
+        als.reset_stats()
+
+    def test_geocode_circuit_breaker_half_open_probe(self):
+        """Test the breaker is shared through the cache and lets a single probe through once it half-opens."""
+        als.reset_stats()
+        with patch("builtins.print"), patch("api.als.SESSION.get", side_effect=requests.Timeout("slow")):
+            for i in range(als.breaker.failure_threshold):
+                lookup_coordinates_and_geoaddress(f"{i} Slow Road")
+        # A fresh breaker object reads the same state, as another process would
+        other = als.CircuitBreaker(als.breaker.failure_threshold, als.breaker.reset_timeout)
+        self.assertEqual(other.state, "open")
+        later = time.time() + als.breaker.reset_timeout + 1
+        with patch("api.als.time.time", return_value=later):
+            self.assertEqual(other.state, "half_open")
+            self.assertTrue(cache.add(other.probe_key, 1))
+            fetch = MagicMock(return_value="ok")
+            with self.assertRaises(als.CircuitOpen):
+                als.breaker.call(fetch)
+            fetch.assert_not_called()
+            cache.delete(other.probe_key)
+            self.assertEqual(als.breaker.call(fetch), "ok")
+        self.assertEqual(als.stats()["breaker_state"], "closed")
+        out = io.StringIO()
+        call_command("process_geocode_queue", "--stats", stdout=out)
+        self.assertIn(f"{als.breaker.failure_threshold} requests, {als.breaker.failure_threshold} errors", out.getvalue())
+        als.reset_stats()
+
+    def test_single_flight_coalesces_concurrent_calls(self):
+        """Test concurrent calls for one key share a single in-flight call."""
+        als.reset_stats()
+        flight = als.SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def slow_lookup():
+            calls.append(1)
+            release.wait(5)
+            return "result"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do("key", slow_lookup))) for _ in range(5)]
+        for t in threads:
+            t.start()
+        while als.stats()["coalesced"] < 4:
+            pass
+        release.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, ["result"] * 5)
+        self.assertEqual(len(calls), 1)
 
     def test_accommodation_average_rating(self):
         """Test calculation of average rating for an accommodation."""
@@ -300,6 +486,133 @@ class UniHavenTests(TestCase):
         )
         self.assertEqual(self.accommodation.average_rating(), 3.0)
 
+    def test_rating_aggregates_incremental(self):
+        """Test rating_sum/rating_count follow rating inserts, edits and deletes with single-column updates."""
+        self.accommodation.refresh_from_db()
+        self.assertEqual((self.accommodation.rating_sum, self.accommodation.rating_count), (4, 1))
+        with self.assertNumQueries(1):
+            Accommodation.add_rating(self.accommodation.pk, 5, 1)
+        self.rating.value = 2
+        self.rating.save()
+        self.accommodation.refresh_from_db()
+        self.assertEqual((self.accommodation.rating_sum, self.accommodation.rating_count), (7, 2))
+        self.assertEqual(self.accommodation.rating, 3.5)
+        self.rating.delete()
+        self.accommodation.refresh_from_db()
+        self.assertEqual((self.accommodation.rating_sum, self.accommodation.rating_count), (5, 1))
+        self.assertEqual(self.accommodation.rating, 5.0)
+
+    def test_rating_aggregates_follow_cascade_and_bulk_deletes(self):
+        """Test aggregates drop ratings removed by a user cascade or a queryset delete."""
+        other = User.objects.create_user(username="rater2", password="testpass123", university="HKU")
+        for value in (2, 3):
+            Rating.objects.create(accommodation=self.accommodation, student_name="Rater", value=value, created_by=other)
+        self.user_student.delete()
+        self.accommodation.refresh_from_db()
+        self.assertEqual((self.accommodation.rating_sum, self.accommodation.rating_count), (5, 2))
+        Rating.objects.filter(value=3).delete()
+        self.accommodation.refresh_from_db()
+        self.assertEqual((self.accommodation.rating_sum, self.accommodation.rating_count), (2, 1))
+        self.assertEqual(self.accommodation.rating, 2.0)
+
+    def test_rebuild_rating_aggregates_command(self):
+        """Test the bulk rebuild recomputes aggregates from the Rating table."""
+        Accommodation.objects.update(rating_sum=0, rating_count=0, rating=0)
+        Rating.objects.create(
+            accommodation=self.accommodation, student_name="Student Two",
+            value=1, created_by=self.user_student
+        )
+        call_command("rebuild_rating_aggregates", stdout=MagicMock())
+        self.accommodation.refresh_from_db()
+        self.assertEqual((self.accommodation.rating_sum, self.accommodation.rating_count), (5, 2))
+        self.assertEqual(self.accommodation.rating, 2.5)
+
+    def test_accommodation_save_writes_only_changed_fields(self):
+        """Test a hot-path field change is a single UPDATE with no derived recomputation or geocoding."""
+        acc = Accommodation.objects.get(pk=self.accommodation.pk)
+        acc.reserved = True
+        with patch.object(Accommodation, "compute_campus_distances") as compute:
+            with self.assertNumQueries(1):
+                acc.save()
+            compute.assert_not_called()
+        self.assertFalse(GeocodeJob.objects.filter(accommodation=acc).exists())
+        acc.refresh_from_db()
+        self.assertTrue(acc.reserved)
+        self.assertEqual(acc.dirty_fields(), set())
+
+    def test_save_writes_fields_deferred_at_load(self):
+        """Test fields left out by only()/defer() are saved once assigned, and reading one keeps other edits."""
+        acc = Accommodation.objects.only("id", "title").get(pk=self.accommodation.pk)
+        acc.price = 777
+        acc.save()
+        acc = Accommodation.objects.defer("price", "beds").get(pk=self.accommodation.pk)
+        acc.title = "Renamed"
+        self.assertEqual(acc.price, 777)
+        acc.beds = 3
+        acc.save()
+        acc.refresh_from_db()
+        self.assertEqual((acc.price, acc.title, acc.beds), (777, "Renamed", 3))
+
+        reservation = Reservation.objects.only("id").get(pk=self.reservation.pk)
+        reservation.status = "cancelled"
+        reservation.save()
+        self.assertFalse(NightOccupancy.objects.filter(accommodation=self.accommodation, booked__gt=0).exists())
+
+    def test_accommodation_save_recomputes_distances_on_coordinate_change(self):
+        """Test campus distances and the geo cell follow coordinate edits only."""
+        acc = Accommodation.objects.get(pk=self.accommodation.pk)
+        acc.latitude, acc.longitude = 22.3964, 114.1095
+        acc.save()
+        acc.refresh_from_db()
+        self.assertEqual(
+            acc.campus_distances["HKU - Main Campus"],
+            calculate_distance(22.3964, 114.1095, *LOCATIONS["HKU - Main Campus"])
+        )
+        self.assertEqual(
+            CampusDistance.objects.get(accommodation=acc, campus="HKU - Main Campus").km,
+            acc.campus_distances["HKU - Main Campus"]
+        )
+        self.assertFalse(GeocodeJob.objects.filter(accommodation=acc).exists())
+
+    def test_accommodation_address_change_requeues_geocode(self):
+        """Test editing the address alone queues a new geocode job."""
+        acc = Accommodation.objects.get(pk=self.accommodation.pk)
+        acc.address = "1 New Street, Hong Kong"
+        acc.save()
+        acc.refresh_from_db()
+        self.assertEqual(acc.geocode_status, "pending")
+        self.assertTrue(GeocodeJob.objects.filter(accommodation=acc, status="pending").exists())
+
+    def test_sweep_reservations(self):
+        """Test the sweeper applies update_status transitions in bulk and is idempotent."""
+        today = date.today()
+        ended = Reservation.objects.create(
+            accommodation=self.accommodation, student_name="Student Two",
+            student_email="student2@example.com", start_date=today - timedelta(days=5),
+            end_date=today - timedelta(days=1), created_by=self.user_student, status="confirmed"
+        )
+        future = Reservation.objects.create(
+            accommodation=self.accommodation, student_name="Student Three",
+            student_email="student3@example.com", start_date=today + timedelta(days=3),
+            end_date=today + timedelta(days=4), created_by=self.user_student
+        )
+        summary = sweeper.sweep_reservations(chunk_size=1)
+        self.assertEqual((summary["confirmed"], summary["completed"], summary["pruned_nights"]), (1, 1, 4))
+        statuses = dict(Reservation.objects.values_list("id", "status"))
+        self.assertEqual(statuses[self.reservation.id], "confirmed")
+        self.assertEqual(statuses[ended.id], "completed")
+        self.assertEqual(statuses[future.id], "pending")
+        self.assertFalse(NightOccupancy.objects.filter(night__lt=today).exists())
+        summary = sweeper.sweep_reservations()
+        self.assertEqual((summary["confirmed"], summary["completed"], summary["pruned_nights"]), (0, 0, 0))
+
+    def test_sweep_reservations_command(self):
+        """Test the sweep_reservations command reports what moved."""
+        Reservation.objects.filter(pk=self.reservation.pk).update(end_date=date.today() - timedelta(days=1))
+        out = MagicMock()
+        call_command("sweep_reservations", stdout=out)
+        self.assertIn("completed 1 reservation(s)", out.write.call_args[0][0])
+
     def test_reservation_status_update(self):
         """Test automatic status updates for a reservation based on dates."""
         # Test completed status
@@ -347,6 +660,110 @@ class UniHavenTests(TestCase):
         expected_distance = R * c
         self.assertAlmostEqual(distance, expected_distance, delta=0.01)
 
+    def test_distance_engine_matches_calculate_distance(self):
+        """Test the vectorized engine agrees with calculate_distance for every campus."""
+        distances = DISTANCE_ENGINE.campus_distances(22.283, 114.135, ["HKU", "CUHK"])
+        self.assertEqual(set(distances), {label for label in LOCATIONS if label.startswith(("HKU - ", "CUHK - "))})
+        for label, km in distances.items():
+            self.assertEqual(km, calculate_distance(22.283, 114.135, *LOCATIONS[label]))
+
+    def test_distance_engine_rank(self):
+        """Test ranking by distance with radius and top-k limits."""
+        engine = DistanceEngine(LOCATIONS)
+        base_lat, base_lng = LOCATIONS["HKU - Main Campus"]
+        rows = [(i, base_lat + i * 0.01, base_lng) for i in range(10, 0, -1)]
+        ranked = engine.rank("HKU - Main Campus", rows)
+        self.assertEqual([pk for pk, km in ranked], list(range(1, 11)))
+        self.assertEqual(ranked[0][1], calculate_distance(base_lat, base_lng, base_lat + 0.01, base_lng))
+        self.assertEqual([pk for pk, km in engine.rank("HKU - Main Campus", rows, limit=3)], [1, 2, 3])
+        within = engine.rank("HKU - Main Campus", rows, max_distance=3.5)
+        self.assertEqual([pk for pk, km in within], [1, 2, 3])
+        self.assertEqual(engine.rank((base_lat + 0.1, base_lng), rows, limit=1)[0][0], 10)
+
+    def test_university_registry_reloads_on_change(self):
+        """Test the registry re-reads universities.json when its mtime changes and notifies listeners."""
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, "universities.json")
+        data = {"universities": [{"code": "HKU", "name": "HKU", "campuses": {"Main Campus": [22.28405, 114.13784]}}]}
+        with open(path, "w") as f:
+            json.dump(data, f)
+        registry = UniversityRegistry(path, check_interval=0)
+        reloads = []
+        registry.on_reload(lambda snapshot: reloads.append(snapshot.version))
+        self.assertEqual(registry.choices, [("HKU", "HKU")])
+        self.assertEqual(registry.campus_labels("HKU"), ["HKU - Main Campus"])
+        self.assertEqual(registry.campus_radians("HKU"), [(math.radians(22.28405), math.radians(114.13784))])
+        self.assertIs(registry.current(), registry.current())
+
+        data["universities"][0]["campuses"]["Main Campus"] = [22.3, 114.2]
+        with open(path, "w") as f:
+            json.dump(data, f)
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+        self.assertEqual(registry.locations["HKU - Main Campus"], (22.3, 114.2))
+        self.assertEqual(registry.engine.campus_distances(22.3, 114.2, ["HKU"]), {"HKU - Main Campus": 0.0})
+        self.assertEqual(reloads, [2])
+        self.assertEqual(registry.university_of("HKU - Main Campus"), "HKU")
+        self.assertIsNone(registry.university_of("HKU - Old Campus"))
+
+    def test_rebuild_campus_distances_command(self):
+        """Test stored campus distances are recomputed from the current campus positions."""
+        expected = dict(self.accommodation.campus_distances)
+        Accommodation.objects.filter(pk=self.accommodation.pk).update(campus_distances={})
+        CampusDistance.objects.filter(accommodation=self.accommodation).delete()
+        call_command("rebuild_campus_distances", stdout=MagicMock())
+        self.accommodation.refresh_from_db()
+        self.assertEqual(self.accommodation.campus_distances, expected)
+        self.assertEqual(
+            dict(self.accommodation.distances.values_list("campus", "km")), expected
+        )
+
+    def test_generate_data_command(self):
+        """Test the synthetic dataset is seeded, never overbooked and matches its derived rows."""
+        call_command(
+            "generate_data", "--users", "6", "--accommodations", "30", "--reservations", "150",
+            "--ratings", "60", "--batch-size", "10", stdout=MagicMock(),
+        )
+        listings = Accommodation.objects.filter(created_by__username__startswith="synthetic-")
+        self.assertEqual(listings.count(), 30)
+        self.assertEqual(User.objects.filter(username__startswith="synthetic-student-", student_profile__isnull=False).count(), 6)
+        self.assertFalse(listings.filter(Q(latitude__isnull=True) | Q(geo_cell="")).exists())
+        held = {}
+        for reservation in Reservation.objects.filter(accommodation__in=listings, status__in=availability.ACTIVE_STATUSES):
+            for night in availability.stay_nights(reservation.start_date, reservation.end_date):
+                held[reservation.accommodation_id, night] = held.get((reservation.accommodation_id, night), 0) + 1
+        stored = NightOccupancy.objects.filter(accommodation__in=listings).values_list("accommodation_id", "night", "booked")
+        self.assertEqual({(a, n): b for a, n, b in stored}, held)
+        for listing in listings:
+            self.assertEqual(listing.rating_count, listing.ratings.count())
+            self.assertLessEqual(max([0] + [b for (a, n), b in held.items() if a == listing.pk]), listing.beds)
+            self.assertEqual(set(listing.campus_distances), set(listing.distances.values_list("campus", flat=True)))
+
+    def test_geohash_encoding(self):
+        """Test geohash encoding against a known reference value."""
+        self.assertEqual(spatial.encode_geohash(57.64911, 10.40744, 11), "u4pruydqqvj")
+        self.assertEqual(self.accommodation.geo_cell, spatial.encode_geohash(22.283, 114.135))
+
+    def test_spatial_radius_and_nearest(self):
+        """Test radius and nearest queries around an arbitrary point."""
+        base_lat, base_lng = LOCATIONS["HKU - Main Campus"]
+        for i, offset in enumerate([0.005, 0.02, 0.05, 0.2]):
+            Accommodation.objects.create(
+                title=f"Spatial {i}", description="A nice place", property_type="AP",
+                price=1000.00, beds=2, bedrooms=1, address=f"{i} Spatial St, HK",
+                flat_number="1A", floor_number="1", available_from=date.today(),
+                available_to=date.today() + timedelta(days=30), created_by=self.user_staff,
+                universities_offered=["HKU"], latitude=base_lat + offset, longitude=base_lng, geo_address="Geo"
+            )
+        queryset = Accommodation.objects.filter(title__startswith="Spatial")
+        within = spatial.within_radius(queryset, base_lat, base_lng, 3)
+        titles = [Accommodation.objects.get(pk=pk).title for pk, km in within]
+        self.assertEqual(titles, ["Spatial 0", "Spatial 1"])
+        self.assertTrue(all(km <= 3 for pk, km in within))
+        nearest = spatial.nearest(queryset, base_lat + 0.2, base_lng, 2)
+        self.assertEqual([Accommodation.objects.get(pk=pk).title for pk, km in nearest], ["Spatial 3", "Spatial 2"])
+
     # Tests for Forms
     def test_accommodation_form_valid(self):
         """Test valid data for AccommodationForm."""
@@ -420,8 +837,9 @@ class UniHavenTests(TestCase):
         self.api_client.force_authenticate(user=self.user_student)
         response = self.api_client.get("/api/accommodations/")
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]["title"], "Test Apartment")
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(response.data["results"][0]["title"], "Test Apartment")
+        self.assertIsNone(response.data["next"])
 
     def test_accommodation_viewset_create(self):
         """Test creating an accommodation via AccommodationViewSet."""
@@ -464,6 +882,281 @@ class UniHavenTests(TestCase):
         response = self.api_client.post("/api/accommodations/", data, format="json")
         self.assertEqual(response.status_code, 403)
 
+    def test_accommodation_duplicate_detected_by_fingerprint(self):
+        """Test a differently spelled address for the same unit is a duplicate, enforced by the unique index."""
+        self.assertEqual(
+            self.accommodation.fingerprint,
+            unit_fingerprint(self.accommodation.address.upper().replace(",", " ,"), "1a ", "1", None),
+        )
+        data = {
+            "title": "Duplicate Apartment", "description": "A nice place", "property_type": "AP",
+            "price": "1000.00", "beds": 2, "bedrooms": 1, "address": "  " + self.accommodation.address.upper() + ".",
+            "flat_number": self.accommodation.flat_number.lower(), "floor_number": self.accommodation.floor_number,
+            "available_from": date.today(), "available_to": date.today() + timedelta(days=30),
+            "universities_offered": ["HKU"],
+        }
+        with self.assertRaises(PermissionDenied):
+            services.create_accommodation(self.user_staff, data)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Accommodation.objects.create(created_by=self.user_staff, **data)
+
+    def test_accommodation_update_onto_existing_unit_rejected(self):
+        """Test moving a listing onto another listing's unit is a 400, and the migration's frozen hash still matches."""
+        other = Accommodation.objects.create(
+            title="Other Apartment", description="A nice place", property_type="AP",
+            price=900.00, beds=1, bedrooms=1, address="9 Other St, HK", flat_number="2B", floor_number="3",
+            available_from=date.today(), available_to=date.today() + timedelta(days=30),
+            created_by=self.user_staff, universities_offered=["HKU"], latitude=22.284, longitude=114.136
+        )
+        self.api_client.force_authenticate(user=self.user_staff)
+        response = self.api_client.patch(
+            f"/api/accommodations/{other.id}/",
+            {"address": self.accommodation.address, "flat_number": "1a", "floor_number": "1"}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        other.refresh_from_db()
+        self.assertEqual(other.address, "9 Other St, HK")
+
+        migration = importlib.import_module("api.migrations.0012_accommodation_fingerprint")
+        self.assertEqual(migration.unit_fingerprint("9 Other St, HK", "2B", "3", None), other.fingerprint)
+
+    def test_near_duplicate_flagged_on_create(self):
+        """Test a re-post at the same place and unit with reworded text is flagged, not rejected."""
+        data = {
+            "title": "Test Apartments", "description": "A nice place!", "property_type": "AP",
+            "price": "900.00", "beds": 2, "bedrooms": 1, "address": "123 Test Street, Hong Kong",
+            "flat_number": "1a", "floor_number": "1", "latitude": 22.283, "longitude": 114.135,
+            "available_from": date.today(), "available_to": date.today() + timedelta(days=30),
+            "universities_offered": ["HKU"],
+        }
+        repost = services.create_accommodation(self.user_staff, data)
+        flag = DuplicateCandidate.objects.get()
+        self.assertEqual((flag.accommodation, flag.duplicate_of, flag.status), (repost, self.accommodation, "open"))
+        self.assertGreaterEqual(flag.similarity, dedupe.THRESHOLD)
+
+        other_flat = services.create_accommodation(self.user_staff, {**data, "flat_number": "2A"})
+        unrelated = services.create_accommodation(self.user_staff, {
+            **data, "address": "9 Other Rd, HK", "title": "Sea view studio", "description": "Quiet and bright",
+        })
+        self.assertFalse(DuplicateCandidate.objects.filter(accommodation__in=[other_flat, unrelated]).exists())
+
+    def test_near_duplicate_scan_is_incremental(self):
+        """Test the scan flags pairs once and later runs only revisit listings changed since the last run."""
+        Accommodation.objects.create(
+            title="Test Apartment", description="A very nice place", property_type="AP",
+            price=1000.00, beds=2, bedrooms=1, address="123 Test Road, HK",
+            flat_number="1A", floor_number="1", available_from=date.today(),
+            available_to=date.today() + timedelta(days=30), created_by=self.user_staff,
+            universities_offered=["HKU"], latitude=22.283, longitude=114.135, geo_address="Geo123"
+        )
+        first = dedupe.scan(chunk_size=1)
+        self.assertEqual((first.scanned, first.flagged), (2, 1))
+        second = dedupe.scan()
+        self.assertEqual((second.scanned, second.flagged), (0, 0))
+        self.assertEqual(dedupe.scan(full=True).flagged, 0)
+        self.assertEqual(DuplicateCandidate.objects.count(), 1)
+
+    def test_minhash_without_numpy(self):
+        """Test the plain Python signature matches the NumPy one."""
+        with_numpy = dedupe.signature("Test Apartment", "A nice place")
+        with patch("api.dedupe.np", None):
+            self.assertEqual(dedupe.signature("Test Apartment", "A nice place"), with_numpy)
+        self.assertEqual(dedupe.similarity(with_numpy, with_numpy), 1.0)
+
+    def add_listings_with_activity(self, count):
+        """Add `count` HKU listings, each created, reserved and rated by a different user."""
+        for i in range(count):
+            owner = User.objects.create_user(username=f"owner{count}-{i}", password="x", university="HKU")
+            listing = Accommodation.objects.create(
+                title=f"Listing {count}-{i}", description="A nice place", property_type="AP",
+                price=1000.00, beds=2, bedrooms=1, address=f"{i} Query St, HK", flat_number=f"{count}",
+                floor_number="1", available_from=date.today(), available_to=date.today() + timedelta(days=30),
+                created_by=owner, universities_offered=["HKU"], latitude=22.283, longitude=114.135, geo_address="Geo"
+            )
+            Reservation.objects.create(
+                accommodation=listing, student_name="Student", student_email="s@example.com",
+                start_date=date.today(), end_date=date.today() + timedelta(days=2), created_by=owner
+            )
+            Rating.objects.create(accommodation=listing, student_name="Student", value=4, created_by=owner)
+
+    def test_api_query_counts_do_not_grow_with_rows(self):
+        """Test each list endpoint runs the same fixed number of queries at several dataset sizes."""
+        self.api_client.force_authenticate(user=self.user_student)
+        endpoints = {
+            # ETag aggregate + page, with created_by joined in
+            "/api/accommodations/?page_size=100": 2,
+            "/api/reservations/": 1,
+            "/api/ratings/": 1,
+            reverse("accommodation-filter") + "?page_size=100": 1,
+            # Distance ranking, ungeocoded tail, then one in_bulk for the page
+            reverse("accommodation-filter") + "?campus_label=CUHK - Main Campus&page_size=100": 3,
+            reverse("reservation-filter"): 1,
+        }
+        for size in (1, 10, 30):
+            self.add_listings_with_activity(size)
+            cache.clear()
+            for url, expected in endpoints.items():
+                with self.subTest(url=url, size=size), self.assertNumQueries(expected):
+                    response = self.api_client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+    def test_accommodation_list_conditional_get(self):
+        """Test the list answers If-None-Match with 304 from one aggregate query and changes ETag on writes."""
+        self.api_client.force_authenticate(user=self.user_student)
+        response = self.api_client.get("/api/accommodations/")
+        etag = response["ETag"]
+        self.assertIn("Last-Modified", response)
+        with self.assertNumQueries(1):
+            response = self.api_client.get("/api/accommodations/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.api_client.get("/api/accommodations/?page_size=5", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.accommodation.title = "Renamed"
+        self.accommodation.save()
+        response = self.api_client.get("/api/accommodations/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_accommodation_detail_conditional_get(self):
+        """Test the detail view honours If-None-Match and If-Modified-Since."""
+        self.api_client.force_authenticate(user=self.user_student)
+        url = f"/api/accommodations/{self.accommodation.id}/"
+        response = self.api_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        response = self.api_client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        response = self.api_client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_accommodation_update_if_match(self):
+        """Test a PATCH with a stale If-Match is rejected with 412 and a current one succeeds."""
+        self.api_client.force_authenticate(user=self.user_staff)
+        url = f"/api/accommodations/{self.accommodation.id}/"
+        etag = self.api_client.get(url)["ETag"]
+        response = self.api_client.patch(url, {"title": "First edit"}, format="json", HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        response = self.api_client.patch(url, {"title": "Second edit"}, format="json", HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+        self.accommodation.refresh_from_db()
+        self.assertEqual(self.accommodation.title, "First edit")
+
+    def test_accommodation_update_of_concurrently_deleted_row(self):
+        """Test a conditional PATCH whose row is deleted mid-request is a 404, not a server error."""
+        self.api_client.force_authenticate(user=self.user_staff)
+        url = f"/api/accommodations/{self.accommodation.id}/"
+        etag = self.api_client.get(url)["ETag"]
+        real_get_object = AccommodationViewSet.get_object
+
+        def get_then_delete(view):
+            instance = real_get_object(view)
+            Accommodation.objects.filter(pk=instance.pk).delete()
+            return instance
+
+        with patch.object(AccommodationViewSet, "get_object", get_then_delete):
+            response = self.api_client.patch(url, {"title": "Gone"}, format="json", HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 404)
+
+    def test_import_accommodations_csv(self):
+        """Test the CSV import validates, dedupes, geocodes unique addresses once and bulk-inserts derived rows."""
+        header = "title,description,property_type,price,beds,bedrooms,address,flat_number,floor_number,available_from,available_to,universities_offered\n"
+        today, later = date.today().isoformat(), (date.today() + timedelta(days=90)).isoformat()
+        body = header + "".join([
+            f"Flat A,Nice,AP,5000,1,1,1 Pok Fu Lam Rd,1A,1,{today},{later},HKU;CUHK\n",
+            f"Flat B,Nice,AP,5000,1,1,1 Pok Fu Lam Rd,1B,1,{today},{later},HKU\n",
+            f"Flat B again,Nice,AP,5000,1,1,1 Pok Fu Lam Rd,1B,1,{today},{later},HKU\n",
+            f"Existing,Nice,AP,5000,1,1,\"123 Test St, HK\",1A,1,{today},{later},HKU\n",
+            f"Bad,Nice,XX,5000,1,1,2 Nowhere Rd,1,1,{today},{later},HKU\n",
+        ])
+        self.api_client.force_authenticate(user=self.user_staff)
+        upload = SimpleUploadedFile("listings.csv", body.encode())
+        with patch("api.models.lookup_coordinates_and_geoaddress", return_value=(22.2839, 114.1360, "Geo")) as lookup:
+            response = self.api_client.post(reverse("accommodation-import"), {"file": upload}, format="multipart")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            {k: response.data[k] for k in ("rows", "created", "duplicates", "errors")},
+            {"rows": 5, "created": 2, "duplicates": 2, "errors": 1}
+        )
+        self.assertEqual([e["line"] for e in response.data["error_report"]], [6])
+        lookup.assert_called_once_with("1 Pok Fu Lam Rd")
+        flat_a = Accommodation.objects.get(title="Flat A")
+        self.assertEqual(flat_a.campus_distances, flat_a.compute_campus_distances())
+        self.assertEqual(set(flat_a.offered_to.values_list("university", flat=True)), {"HKU", "CUHK"})
+        self.assertEqual(flat_a.distances.count(), 6)
+        self.assertEqual(flat_a.geo_cell, spatial.encode_geohash(22.2839, 114.1360))
+
+    def test_import_accommodations_ndjson_command(self):
+        """Test the NDJSON import command queues listings that could not be geocoded."""
+        row = {
+            "title": "Queued", "description": "x", "property_type": "AP", "price": "100", "beds": 1,
+            "bedrooms": 1, "address": "Unknown Rd", "flat_number": "1", "floor_number": "1",
+            "available_from": date.today().isoformat(), "available_to": date.today().isoformat(),
+            "universities_offered": ["HKU"],
+        }
+        path = "/tmp/unihaven_import_test.ndjson"
+        with open(path, "w") as f:
+            f.write(json.dumps(row) + "\nnot json\n")
+        out, err = MagicMock(), MagicMock()
+        with patch("api.models.lookup_coordinates_and_geoaddress", return_value=(None, None, "")):
+            call_command("import_accommodations", path, "--user", "staff1", stdout=out, stderr=err)
+        os.remove(path)
+        listing = Accommodation.objects.get(title="Queued")
+        self.assertEqual(listing.geocode_status, "pending")
+        self.assertTrue(GeocodeJob.objects.filter(accommodation=listing).exists())
+        self.assertIn("1 created", out.write.call_args[0][0])
+        self.assertIn('"line": 2', err.write.call_args[0][0])
+
+    def test_import_survives_concurrent_create_of_same_unit(self):
+        """Test a unit created by someone else between dedupe and insert is counted as a duplicate, not a 500."""
+        header = "title,description,property_type,price,beds,bedrooms,address,flat_number,floor_number,latitude,longitude,available_from,available_to,universities_offered\n"
+        today = date.today().isoformat()
+        body = header + "".join(
+            f"Flat {flat},Nice,AP,5000,1,1,5 Race Rd,{flat},2,22.28,114.13,{today},{today},HKU\n" for flat in "AB"
+        )
+        real_dedupe = importer.Importer.dedupe
+
+        def racing_dedupe(self, rows):
+            unique = real_dedupe(self, rows)
+            Accommodation.objects.create(
+                title="Racer", description="x", property_type="AP", price=1, beds=1, bedrooms=1,
+                address="5 Race Rd", flat_number="B", floor_number="2", available_from=date.today(),
+                available_to=date.today(), created_by=self.user, universities_offered=["HKU"],
+                latitude=22.28, longitude=114.13,
+            )
+            return unique
+
+        self.api_client.force_authenticate(user=self.user_staff)
+        upload = SimpleUploadedFile("listings.csv", body.encode())
+        with patch.object(importer.Importer, "dedupe", racing_dedupe):
+            response = self.api_client.post(reverse("accommodation-import"), {"file": upload}, format="multipart")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data["created"], response.data["duplicates"]), (1, 1))
+        self.assertEqual(
+            set(Accommodation.objects.filter(address="5 Race Rd").values_list("title", flat=True)), {"Flat A", "Racer"}
+        )
+
+    def test_import_flags_near_duplicates(self):
+        """Test imported rows get the same near-duplicate check as an API create and are counted in the summary."""
+        header = "title,description,property_type,price,beds,bedrooms,address,flat_number,floor_number,latitude,longitude,available_from,available_to,universities_offered\n"
+        today = date.today().isoformat()
+        body = header + "".join([
+            f"Test Apartments,A nice place!,AP,900,2,1,\"123 Test Street, Hong Kong\",1a,1,22.283,114.135,{today},{today},HKU\n",
+            f"Sea view studio,Quiet and bright,AP,900,2,1,9 Other Rd,1A,1,22.283,114.135,{today},{today},HKU\n",
+        ])
+        self.api_client.force_authenticate(user=self.user_staff)
+        upload = SimpleUploadedFile("listings.csv", body.encode())
+        response = self.api_client.post(reverse("accommodation-import"), {"file": upload}, format="multipart")
+        self.assertEqual((response.data["created"], response.data["near_duplicates"]), (2, 1))
+        flag = DuplicateCandidate.objects.get()
+        self.assertEqual((flag.accommodation.title, flag.duplicate_of), ("Test Apartments", self.accommodation))
+
+    def test_import_accommodations_requires_staff(self):
+        """Test students cannot bulk import."""
+        self.api_client.force_authenticate(user=self.user_student)
+        upload = SimpleUploadedFile("listings.csv", b"title\n")
+        response = self.api_client.post(reverse("accommodation-import"), {"file": upload}, format="multipart")
+        self.assertEqual(response.status_code, 403)
+
     def test_reservation_viewset_create(self):
         """Test creating a reservation via ReservationViewSet."""
         self.api_client.force_authenticate(user=self.user_student)
@@ -478,9 +1171,49 @@ class UniHavenTests(TestCase):
         response = self.api_client.post("/api/reservations/", data, format="json")
         self.assertEqual(response.status_code, 201)
         self.assertEqual(Reservation.objects.count(), 2)
+        # Notifications are queued with the reservation and sent later by the outbox worker
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(EmailOutbox.objects.filter(status="pending").count(), 1)
+        outbox.drain()
         self.assertEqual(len(mail.outbox), 1)
         self.assertTrue(mail.outbox[0].subject.startswith("Reservation Created"))
 
+    def test_outbox_drain_digest_and_retry(self):
+        """Test the outbox sends over one connection, builds per-mailbox digests and backs off on failure."""
+        for i in range(3):
+            outbox.enqueue("accommodation@hku.hk", f"Reservation Created - {i}", "body")
+        outbox.enqueue("student1@example.com", "UniHaven: Reservation Cancelled", "body")
+        with patch("api.outbox.get_connection", wraps=mail.get_connection) as get_connection:
+            summary = outbox.drain(digest=True)
+        get_connection.assert_called_once()
+        self.assertEqual((summary["sent"], summary["emails"]), (4, 2))
+        self.assertEqual(mail.outbox[0].subject, "UniHaven: 3 reservation updates")
+        self.assertEqual(outbox.drain()["processed"], 0)
+
+        outbox.enqueue("accommodation@hku.hk", "Reservation Cancelled - x", "body")
+        with patch("django.core.mail.backends.locmem.EmailBackend.send_messages", side_effect=OSError("down")):
+            summary = outbox.drain()
+        self.assertEqual(summary["retried"], 1)
+        row = EmailOutbox.objects.get(status="pending")
+        self.assertEqual(row.attempts, 1)
+        self.assertGreater(row.next_attempt_at, timezone.now())
+        self.assertEqual(outbox.drain(now=row.next_attempt_at)["sent"], 1)
+
+    def test_outbox_claim_is_exclusive(self):
+        """Test overlapping drains never share a row and an abandoned claim is picked up once it lapses."""
+        for i in range(3):
+            outbox.enqueue("accommodation@hku.hk", f"Reservation Created - {i}", "body")
+        first = outbox.claim()
+        self.assertEqual(len(first), 3)
+        self.assertEqual(outbox.claim(), [])
+        self.assertEqual(outbox.drain()["processed"], 0)
+        self.assertEqual(len(mail.outbox), 0)
+        # The first drain died before sending; its claim lapses after CLAIM_SECONDS
+        later = timezone.now() + timedelta(seconds=outbox.CLAIM_SECONDS + 1)
+        self.assertEqual(outbox.drain(now=later)["sent"], 3)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(set(EmailOutbox.objects.values_list("status", "claimed_by")), {("sent", "")})
+
     def test_reservation_viewset_create_fully_booked(self):
         """Test creating a reservation when accommodation is fully booked."""
         self.accommodation.beds = 1
@@ -503,6 +1236,166 @@ class UniHavenTests(TestCase):
         response = self.api_client.post("/api/reservations/", data, format="json")
         self.assertEqual(response.status_code, 403)
 
+    def test_reservation_viewset_create_non_overlapping_dates(self):
+        """Test a full listing still accepts a stay that starts when the existing one ends."""
+        self.accommodation.beds = 1
+        self.accommodation.save()
+        self.api_client.force_authenticate(user=self.user_student)
+        data = {
+            "accommodation": self.accommodation.id,
+            "student_name": "Student Two",
+            "student_email": "student2@example.com",
+            "start_date": (date.today() + timedelta(days=10)).isoformat(),
+            "end_date": (date.today() + timedelta(days=15)).isoformat(),
+            "status": "pending"
+        }
+        response = self.api_client.post("/api/reservations/", data, format="json")
+        self.assertEqual(response.status_code, 201)
+        data["start_date"] = (date.today() + timedelta(days=9)).isoformat()
+        response = self.api_client.post("/api/reservations/", data, format="json")
+        self.assertEqual(response.status_code, 403)
+
+    def test_guarded_booking_rolls_back_when_full(self):
+        """Test a booking that cannot take a bed on every night leaves no reservation or occupancy behind."""
+        today = date.today()
+        data = {
+            "accommodation": self.accommodation, "student_name": "Student Two",
+            "student_email": "student2@example.com", "start_date": today + timedelta(days=5),
+            "end_date": today + timedelta(days=12), "status": "pending",
+        }
+        services.book(self.user_student, data)
+        with self.assertRaises(PermissionDenied):
+            services.book(self.user_student, data)
+        self.assertEqual(Reservation.objects.filter(accommodation=self.accommodation).count(), 2)
+        booked = dict(NightOccupancy.objects.filter(accommodation=self.accommodation).values_list("night", "booked"))
+        self.assertEqual(booked[today + timedelta(days=5)], 2)
+        self.assertEqual(booked[today + timedelta(days=11)], 1)
+
+    def test_reservation_patch_checks_capacity(self):
+        """Test reactivating a cancelled reservation or moving its dates through PATCH cannot overbook."""
+        today = date.today()
+        data = {
+            "accommodation": self.accommodation, "student_name": "Student Two",
+            "student_email": "student2@example.com", "start_date": today, "end_date": today + timedelta(days=10),
+        }
+        second = services.book(self.user_student, data)
+        self.api_client.force_authenticate(user=self.user_student)
+        url = f"/api/reservations/{second.id}/"
+        self.assertEqual(self.api_client.patch(url, {"status": "cancelled"}, format="json").status_code, 200)
+        services.book(self.user_student, data)
+        self.assertEqual(self.api_client.patch(url, {"status": "pending"}, format="json").status_code, 403)
+        second.refresh_from_db()
+        self.assertEqual(second.status, "cancelled")
+
+        later = services.book(self.user_student, {
+            **data, "start_date": today + timedelta(days=20), "end_date": today + timedelta(days=22),
+        })
+        url = f"/api/reservations/{later.id}/"
+        moved = {"start_date": (today + timedelta(days=2)).isoformat(), "end_date": (today + timedelta(days=4)).isoformat()}
+        self.assertEqual(self.api_client.patch(url, moved, format="json").status_code, 403)
+        moved = {"start_date": (today + timedelta(days=25)).isoformat(), "end_date": (today + timedelta(days=27)).isoformat()}
+        self.assertEqual(self.api_client.patch(url, moved, format="json").status_code, 200)
+        self.assertEqual(availability.free_beds(self.accommodation, today, today + timedelta(days=10)), 0)
+        self.assertEqual(availability.free_beds(self.accommodation, today + timedelta(days=25), today + timedelta(days=27)), 1)
+
+    def test_booking_retries_on_lock_contention(self):
+        """Test a locked database is retried a bounded number of times."""
+        data = {
+            "accommodation": self.accommodation, "student_name": "Student Two",
+            "student_email": "student2@example.com", "start_date": date.today() + timedelta(days=20),
+            "end_date": date.today() + timedelta(days=21), "status": "pending",
+        }
+        original = Reservation.save
+        calls = []
+
+        def flaky_save(reservation, *args, **kwargs):
+            calls.append(1)
+            if len(calls) == 1:
+                raise OperationalError("database is locked")
+            return original(reservation, *args, **kwargs)
+
+        with patch.object(Reservation, "save", flaky_save), patch("api.services.time.sleep"):
+            reservation = services.book(self.user_student, data)
+        self.assertEqual(len(calls), 2)
+        self.assertIsNotNone(reservation.pk)
+        with patch.object(Reservation, "save", side_effect=OperationalError("database is locked")), \
+                patch("api.services.time.sleep"):
+            with self.assertRaises(OperationalError):
+                services.book(self.user_student, data)
+
+    def test_night_occupancy_follows_reservation_lifecycle(self):
+        """Test nights are held while a reservation is active and released on cancel, completion or delete."""
+        today = date.today()
+        self.assertEqual(availability.free_beds(self.accommodation, today, today + timedelta(days=10)), 1)
+        self.assertEqual(NightOccupancy.objects.filter(accommodation=self.accommodation, booked=1).count(), 10)
+        self.reservation.end_date = today + timedelta(days=12)
+        self.reservation.save()
+        self.assertEqual(NightOccupancy.objects.filter(accommodation=self.accommodation, booked=1).count(), 12)
+        self.reservation.status = "cancelled"
+        self.reservation.save()
+        self.assertEqual(availability.free_beds(self.accommodation, today, today + timedelta(days=12)), 2)
+        other = Reservation.objects.create(
+            accommodation=self.accommodation, student_name="Student Two",
+            student_email="student2@example.com", start_date=today,
+            end_date=today + timedelta(days=2), created_by=self.user_student
+        )
+        self.assertEqual(availability.free_beds(self.accommodation, today, today + timedelta(days=1)), 1)
+        other.delete()
+        self.assertEqual(availability.free_beds(self.accommodation, today, today + timedelta(days=1)), 2)
+
+    def test_duplicate_cancel_releases_nights_once(self):
+        """Test two stale copies cancelling the same reservation release its beds and notify staff only once."""
+        today = date.today()
+        first = Reservation.objects.get(pk=self.reservation.pk)
+        second = Reservation.objects.get(pk=self.reservation.pk)
+        other = services.book(self.user_student, {
+            "accommodation": self.accommodation, "student_name": "Student Two",
+            "student_email": "student2@example.com", "start_date": today, "end_date": today + timedelta(days=10),
+        })
+        services.cancel_reservation(self.user_student, first)
+        services.cancel_reservation(self.user_student, second)
+        second.status = "cancelled"
+        second.save()
+        self.assertEqual(EmailOutbox.objects.filter(subject__startswith="Reservation Cancelled").count(), 1)
+        self.assertEqual(availability.free_beds(self.accommodation, today, today + timedelta(days=10)), 1)
+        other.refresh_from_db()
+        self.assertEqual(other.status, "pending")
+
+    def test_night_occupancy_released_when_owner_deleted(self):
+        """Test deleting a user releases the nights their reservations held through the cascade."""
+        today = date.today()
+        self.assertEqual(availability.free_beds(self.accommodation, today, today + timedelta(days=10)), 1)
+        self.user_student.delete()
+        self.assertFalse(Reservation.objects.filter(accommodation=self.accommodation).exists())
+        self.assertFalse(NightOccupancy.objects.filter(accommodation=self.accommodation, booked__gt=0).exists())
+        self.assertEqual(availability.free_beds(self.accommodation, today, today + timedelta(days=10)), 2)
+
+    def test_accommodation_availability_view(self):
+        """Test the batch availability endpoint returns free beds per listing and per night."""
+        today = date.today()
+        self.api_client.force_authenticate(user=self.user_student)
+        url = reverse("accommodation-availability")
+        query = f"?ids={self.accommodation.id},999&start={today}&end={today + timedelta(days=12)}&nightly=1"
+        response = self.api_client.get(url + query)
+        self.assertEqual(response.status_code, 200)
+        row, = response.data["results"]
+        self.assertEqual((row["id"], row["beds"], row["free_beds"]), (self.accommodation.id, 2, 1))
+        self.assertEqual(row["nights"][(today + timedelta(days=11)).isoformat()], 2)
+        response = self.api_client.get(url + f"?start={today}&end={today}")
+        self.assertEqual(response.status_code, 400)
+
+        query = f"?start={today}&end={today + timedelta(days=3)}&nightly=1"
+        with CaptureQueriesContext(connection) as one_listing:
+            self.api_client.get(url + query)
+        self.add_listings_with_activity(4)
+        with self.assertNumQueries(len(one_listing)):
+            response = self.api_client.get(url + query)
+        self.assertEqual(len(response.data["results"]), 5)
+        self.assertTrue(all(len(row["nights"]) == 3 for row in response.data["results"]))
+        response = self.api_client.get(url + query + "&page_size=2")
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertIsNotNone(response.data["next"])
+
     def test_rating_viewset_create(self):
         """Test creating a rating via RatingViewSet."""
         self.api_client.force_authenticate(user=self.user_student)
@@ -525,6 +1418,56 @@ class UniHavenTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.data["university"], "HKU")
 
+    def test_token_auth_uses_cached_principal(self):
+        """Test a warm token resolves without queries and is dropped when the token or user changes."""
+        token = Token.objects.get(user=self.user_student)
+        self.api_client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+        self.assertEqual(self.api_client.get(reverse("me-view")).status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.api_client.get(reverse("me-view"))
+        self.assertEqual(response.data["university"], "HKU")
+
+        self.user_student.university = "CUHK"
+        self.user_student.save()
+        self.assertEqual(self.api_client.get(reverse("me-view")).data["university"], "CUHK")
+
+        token.delete()
+        self.assertEqual(self.api_client.get(reverse("me-view")).status_code, 401)
+
+    def test_principal_not_cached_in_process_local_cache(self):
+        """Test a process-local cache is never used, so a revoked token fails in every worker at once."""
+        token = Token.objects.get(user=self.user_student)
+        self.api_client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+        with self.settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}):
+            self.api_client.get(reverse("me-view"))
+            with self.assertNumQueries(2):
+                self.assertEqual(self.api_client.get(reverse("me-view")).status_code, 200)
+            Token.objects.filter(pk=token.pk).update(key="revoked")
+            self.assertEqual(self.api_client.get(reverse("me-view")).status_code, 401)
+
+    def test_cached_principal_role(self):
+        """Test the cached user keeps its role without profile queries and sees new profiles."""
+        user = User.objects.create_user(username="norole", password="testpass123", university="HKU")
+        self.assertEqual(principal.get_user(user.pk).get_user_role(), "unknown")
+        with self.assertNumQueries(0):
+            cached = principal.get_user(user.pk)
+            self.assertEqual(cached.get_user_role(), "unknown")
+            self.assertEqual(cached.get_session_auth_hash(), user.get_session_auth_hash())
+        StudentProfile.objects.create(user=user, university="HKU", UID="NR1")
+        self.assertEqual(principal.get_user(user.pk).get_user_role(), "student")
+        self.assertIsNone(principal.get_user(0))
+
+    def test_session_login_uses_cached_principal(self):
+        """Test session requests load the user from the principal cache and logout on password change."""
+        self.client.login(username="student1", password="testpass123")
+        self.assertEqual(self.client.get(reverse("me-view")).status_code, 200)
+        with self.assertNumQueries(1):  # the session row
+            self.assertEqual(self.client.get(reverse("me-view")).status_code, 200)
+
+        self.user_student.set_password("newpass456")
+        self.user_student.save()
+        self.assertEqual(self.client.get(reverse("me-view")).status_code, 401)
+
     def test_accommodation_filter_view_all_params(self):
         """Test AccommodationFilterView with all query parameters."""
         self.api_client.force_authenticate(user=self.user_student)
@@ -541,7 +1484,224 @@ class UniHavenTests(TestCase):
         )
         response = self.api_client.get(reverse("accommodation-filter") + query)
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.data), 0)
+        # The sample listing is offered to HKU and about 0.3km from the main campus
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(response.data["results"][0]["title"], "Test Apartment")
+
+    def test_accommodation_filter_view_university_scope(self):
+        """Test listings not offered to the user's university are filtered out in SQL."""
+        Accommodation.objects.create(
+            title="CUHK Only", description="A nice place", property_type="AP",
+            price=1000.00, beds=2, bedrooms=1, address="1 CUHK Rd, HK",
+            flat_number="1A", floor_number="1", available_from=date.today(),
+            available_to=date.today() + timedelta(days=30), created_by=self.user_staff,
+            universities_offered=["CUHK"], latitude=22.283, longitude=114.135, geo_address="Geo"
+        )
+        self.api_client.force_authenticate(user=self.user_student)
+        response = self.api_client.get(reverse("accommodation-filter") + "?lat=22.28&lon=114.13&max_distance=2")
+        self.assertEqual([acc["title"] for acc in response.data["results"]], ["Test Apartment"])
+        response = self.api_client.get("/api/accommodations/")
+        self.assertEqual([acc["title"] for acc in response.data["results"]], ["Test Apartment"])
+
+    def test_accommodation_filter_view_invalid_limit(self):
+        """Test a non-numeric or non-positive limit is a 400, not a server error."""
+        self.api_client.force_authenticate(user=self.user_student)
+        url = reverse("accommodation-filter") + "?lat=22.28&lon=114.13&limit="
+        for limit in ("abc", "-1", "0"):
+            self.assertEqual(self.api_client.get(url + limit).status_code, 400)
+        self.assertEqual(len(self.api_client.get(url + "1").data["results"]), 1)
+
+    def test_accommodation_filter_view_invalid_numbers(self):
+        """Test non-numeric bed, price and distance filters are a 400 on every path, not a server error."""
+        self.api_client.force_authenticate(user=self.user_student)
+        url = reverse("accommodation-filter")
+        for query in (
+            "?min_beds=two", "?min_bedrooms=1.5", "?min_price=abc&max_price=2000", "?min_price=0&max_price=nan",
+            "?max_distance=far&campus_label=HKU - Main Campus", "?max_distance=far&lat=22.28&lon=114.13",
+            "?max_distance=-1&campus_label=HKU - Main Campus",
+        ):
+            self.assertEqual(self.api_client.get(url + query).status_code, 400, query)
+        response = self.api_client.get(url + "?min_beds=2&min_bedrooms=1&min_price=500&max_price=1500&max_distance=4.5"
+                                       "&campus_label=HKU - Main Campus")
+        self.assertEqual([acc["title"] for acc in response.data["results"]], ["Test Apartment"])
+
+    def test_accommodation_filter_view_cache(self):
+        """Test repeated filter requests are served from cache until a write bumps the university generation."""
+        self.api_client.force_authenticate(user=self.user_student)
+        url = reverse("accommodation-filter")
+        filter_cache.reset_stats()
+        self.api_client.get(url + "?property_type=AP&max_price=1500&min_price=500")
+        with self.assertNumQueries(0):
+            response = self.api_client.get(url + "?min_price=500&property_type=AP&max_price=1500&unused=1")
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(filter_cache.stats()["hits"], 1)
+        self.assertEqual(filter_cache.stats()["hit_ratio"], 0.5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Rating.objects.create(
+                accommodation=self.accommodation, student_name="Student Two",
+                value=2, created_by=self.user_student
+            )
+        response = self.api_client.get(url + "?property_type=AP&max_price=1500&min_price=500")
+        self.assertEqual(response.data["results"][0]["rating"], 3.0)
+        self.assertEqual(filter_cache.stats()["misses"], 2)
+        out = io.StringIO()
+        call_command("filter_cache_stats", "--reset", stdout=out)
+        self.assertIn("1 hits, 2 misses", out.getvalue())
+        self.assertEqual(filter_cache.stats()["hits"], 0)
+
+        with self.settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}):
+            self.assertFalse(filter_cache.is_shared())
+            self.api_client.get(url + "?property_type=AP")
+            with self.assertNumQueries(1):
+                self.api_client.get(url + "?property_type=AP")
+
+    def test_filter_cache_key_includes_scheme(self):
+        """Test http and https requests never share an entry, since pagination links are absolute."""
+        self.api_client.force_authenticate(user=self.user_student)
+        url = reverse("accommodation-filter") + "?page_size=1"
+        Accommodation.objects.create(
+            title="Second Apartment", description="A nice place", property_type="AP",
+            price=1000.00, beds=2, bedrooms=1, address="2 Second St, HK",
+            flat_number="1A", floor_number="1", available_from=date.today(),
+            available_to=date.today() + timedelta(days=30), created_by=self.user_staff,
+            universities_offered=["HKU"], latitude=22.28, longitude=114.13, geo_address="Geo"
+        )
+        self.assertTrue(self.api_client.get(url).data["next"].startswith("http://"))
+        self.assertTrue(self.api_client.get(url, secure=True).data["next"].startswith("https://"))
+
+    def test_tests_use_their_own_cache(self):
+        """Test the suite never clears or reads the development server's cache."""
+        options = settings.CACHES["default"]
+        self.assertEqual(options["LOCATION"], os.path.join(tempfile.gettempdir(), "unihaven-test-cache"))
+        self.assertEqual(options["KEY_PREFIX"], "test")
+
+    def test_filter_cache_generation_per_university(self):
+        """Test a write only invalidates the universities the listing is offered to."""
+        hku, cuhk = filter_cache.generation("HKU"), filter_cache.generation("CUHK")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.accommodation.title = "Renamed"
+            self.accommodation.save()
+            # Nothing is invalidated until the write commits
+            self.assertEqual(filter_cache.generation("HKU"), hku)
+        self.assertGreater(filter_cache.generation("HKU"), hku)
+        self.assertEqual(filter_cache.generation("CUHK"), cuhk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.accommodation.universities_offered = ["CUHK"]
+            self.accommodation.save()
+        self.assertGreater(filter_cache.generation("CUHK"), cuhk)
+
+    def test_filter_cache_collapses_concurrent_misses(self):
+        """Test only one caller builds a missing entry while others wait for it."""
+        calls = []
+        started = threading.Event()
+
+        def build():
+            calls.append(1)
+            started.set()
+            threading.Event().wait(0.2)
+            return "value", True
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(filter_cache.get_or_build("k", build)))
+        leader.start()
+        started.wait()
+        results.append(filter_cache.get_or_build("k", build))
+        leader.join()
+        self.assertEqual(results, ["value", "value"])
+        self.assertEqual(len(calls), 1)
+
+    def test_campus_distance_rows_follow_coordinates(self):
+        """Test CampusDistance rows mirror campus_distances as coordinates and universities change."""
+        rows = dict(self.accommodation.distances.values_list("campus", "km"))
+        self.assertEqual(rows, self.accommodation.campus_distances)
+        self.assertEqual(len(rows), 5)
+        self.accommodation.universities_offered = ["CUHK"]
+        self.accommodation.save()
+        self.assertEqual(list(self.accommodation.distances.values_list("campus", flat=True)), ["CUHK - Main Campus"])
+        self.assertEqual(CampusDistance.objects.filter(campus__startswith="HKU").count(), 0)
+
+    def test_accommodation_filter_view_campus_distance_order(self):
+        """Test campus sorting and radius filtering run against CampusDistance."""
+        base_lat, base_lng = LOCATIONS["HKU - Main Campus"]
+        for i, offset in enumerate([0.03, 0.001, 0.1]):
+            Accommodation.objects.create(
+                title=f"Near {i}", description="A nice place", property_type="AP",
+                price=1000.00, beds=2, bedrooms=1, address=f"{i} Near St, HK",
+                flat_number="1A", floor_number="1", available_from=date.today(),
+                available_to=date.today() + timedelta(days=30), created_by=self.user_staff,
+                universities_offered=["HKU"], latitude=base_lat + offset, longitude=base_lng, geo_address="Geo"
+            )
+        self.api_client.force_authenticate(user=self.user_student)
+        url = reverse("accommodation-filter") + "?campus_label=HKU - Main Campus"
+        response = self.api_client.get(url + "&max_distance=4")
+        self.assertEqual([acc["title"] for acc in response.data["results"]], ["Near 1", "Test Apartment", "Near 0"])
+        response = self.api_client.get(url + "&page_size=2")
+        self.assertEqual([acc["title"] for acc in response.data["results"]], ["Near 1", "Test Apartment"])
+        response = self.api_client.get(response.data["next"])
+        self.assertEqual([acc["title"] for acc in response.data["results"]], ["Near 0", "Near 2"])
+        self.assertIsNone(response.data["next"])
+        response = self.api_client.get(response.data["previous"])
+        self.assertEqual([acc["title"] for acc in response.data["results"]], ["Near 1", "Test Apartment"])
+
+    def test_accommodation_filter_view_limit_without_origin(self):
+        """Test limit caps plain and own-campus filter results like it does with lat/lon."""
+        base_lat, base_lng = LOCATIONS["HKU - Main Campus"]
+        for i, offset in enumerate([0.03, 0.001, 0.1]):
+            Accommodation.objects.create(
+                title=f"Near {i}", description="A nice place", property_type="AP",
+                price=1000.00, beds=2, bedrooms=1, address=f"{i} Near St, HK",
+                flat_number="1A", floor_number="1", available_from=date.today(),
+                available_to=date.today() + timedelta(days=30), created_by=self.user_staff,
+                universities_offered=["HKU"], latitude=base_lat + offset, longitude=base_lng, geo_address="Geo"
+            )
+        self.api_client.force_authenticate(user=self.user_student)
+        response = self.api_client.get(reverse("accommodation-filter") + "?limit=2")
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertIsNone(response.data["next"])
+        url = reverse("accommodation-filter") + "?campus_label=HKU - Main Campus&limit=3&page_size=2"
+        response = self.api_client.get(url)
+        self.assertEqual([acc["title"] for acc in response.data["results"]], ["Near 1", "Test Apartment"])
+        response = self.api_client.get(response.data["next"])
+        self.assertEqual([acc["title"] for acc in response.data["results"]], ["Near 0"])
+        self.assertIsNone(response.data["next"])
+
+    def test_keyset_pagination_orderings(self):
+        """Test cursor pages are stable for each supported ordering and never overlap."""
+        for i in range(6):
+            Accommodation.objects.create(
+                title=f"Paged {i}", description="A nice place", property_type="AP",
+                price=900 + (i % 3) * 100, beds=2, bedrooms=1, address=f"{i} Paged St, HK",
+                flat_number="1A", floor_number="1", available_from=date.today(),
+                available_to=date.today() + timedelta(days=30), created_by=self.user_staff,
+                universities_offered=["HKU"], latitude=22.283, longitude=114.135, geo_address="Geo"
+            )
+        self.api_client.force_authenticate(user=self.user_student)
+        for ordering in ["id", "-id", "price", "-price", "created_at", "-created_at"]:
+            url = f"/api/accommodations/?page_size=3&ordering={ordering}"
+            seen = []
+            while url:
+                response = self.api_client.get(url)
+                self.assertLessEqual(len(response.data["results"]), 3)
+                seen += [acc["id"] for acc in response.data["results"]]
+                url = response.data["next"]
+            expected = sorted(
+                Accommodation.objects.values_list(ordering.lstrip("-"), "id"), reverse=ordering.startswith("-")
+            )
+            self.assertEqual(seen, [pk for key, pk in expected])
+        response = self.api_client.get("/api/accommodations/?page_size=1000")
+        self.assertEqual(len(response.data["results"]), 7)
+        response = self.api_client.get("/api/accommodations/?cursor=bogus")
+        self.assertEqual(response.status_code, 404)
+
+    def test_accommodation_universities_sync(self):
+        """Test the AccommodationUniversity rows follow universities_offered."""
+        self.accommodation.universities_offered = ["CUHK", "HKUST"]
+        self.accommodation.save()
+        self.assertEqual(
+            sorted(self.accommodation.offered_to.values_list("university", flat=True)), ["CUHK", "HKUST"]
+        )
+        self.assertFalse(Accommodation.objects.offered_to_university("HKU").exists())
 
     def test_reservation_filter_view(self):
         """Test ReservationFilterView returns user's reservations."""
@@ -550,6 +1710,43 @@ class UniHavenTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.data), 1)
 
+    def test_reservation_export_ndjson(self):
+        """Test the reservation export streams one JSON object per row with date and university filters."""
+        self.client.force_login(self.user_staff)
+        response = self.client.get(reverse("reservation-export"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([r["id"] for r in rows], [self.reservation.id])
+        self.assertEqual(rows[0]["accommodation__title"], "Test Apartment")
+        self.assertEqual(rows[0]["start_date"], date.today().isoformat())
+        tomorrow = (date.today() + timedelta(days=1)).isoformat()
+        response = self.client.get(reverse("reservation-export") + f"?from={tomorrow}")
+        self.assertEqual(b"".join(response.streaming_content), b"")
+
+    def test_export_range_uses_datetime_bounds(self):
+        """Test the date range filters on created_at bounds, inclusive of the end day, so its index applies."""
+        today = timezone.localdate().isoformat()
+        yesterday = (timezone.localdate() - timedelta(days=1)).isoformat()
+        queryset = export.filter_range(Reservation.objects.all(), today, today)
+        self.assertEqual(list(queryset), [self.reservation])
+        self.assertFalse(export.filter_range(Reservation.objects.all(), end=yesterday).exists())
+        sql = str(queryset.query)
+        self.assertIn('"created_at" >= ', sql)
+        self.assertIn('"created_at" < ', sql)
+        self.assertNotIn("cast_date", sql)
+
+    def test_rating_export_csv(self):
+        """Test the rating export streams CSV with a header row and is limited to staff."""
+        self.client.force_login(self.user_staff)
+        response = self.client.get(reverse("rating-export") + "?output=csv")
+        self.assertEqual(response["Content-Type"], "text/csv")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(",")[:5], ["id", "accommodation_id", "accommodation__title", "student_name", "value"])
+        self.assertEqual(len(lines), 2)
+        self.client.force_login(self.user_student)
+        self.assertEqual(self.client.get(reverse("rating-export")).status_code, 403)
+
     def test_reservation_cancel_view(self):
         """Test ReservationCancelView cancels a reservation."""
         self.api_client.force_authenticate(user=self.user_student)
@@ -562,80 +1759,87 @@ class UniHavenTests(TestCase):
     def test_student_accommodation_list(self):
         """Test accommodation list view for students."""
         self.client.force_login(self.user_student)
-        with patch("requests.get") as mock_get:
-            mock_get.return_value = MagicMock(
-                status_code=200,
-                json=lambda: [{"id": self.accommodation.id, "title": "Test Apartment"}]
-            )
-            response = self.client.get(reverse("accommodation_list"))
+        response = self.client.get(reverse("accommodation_list"))
         self.assertEqual(response.status_code, 200)
         self.assertIn("accommodations", response.context)
         self.assertEqual(len(response.context["accommodations"]), 1)
+        self.assertEqual(response.context["accommodations"][0].id, self.accommodation.id)
         self.assertFalse(response.context["is_cedars"])
 
-    def test_student_accommodation_list_api_error(self):
-        """Test accommodation list view handles API errors."""
-        self.client.force_login(self.user_student)
-        with patch("requests.get") as mock_get:
-            mock_get.return_value = MagicMock(status_code=500)
-            response = self.client.get(reverse("accommodation_list"))
+    def test_student_accommodation_list_scoped_to_university(self):
+        """Test accommodation list view only shows listings offered to the user's university."""
+        cuhk_student = User.objects.create_user(
+            username="student2", password="testpass123", university="CUHK", is_student=True
+        )
+        self.client.force_login(cuhk_student)
+        response = self.client.get(reverse("accommodation_list"))
         self.assertEqual(response.status_code, 200)
-        self.assertIn("accommodations", response.context)
         self.assertEqual(len(response.context["accommodations"]), 0)
 
+    def test_frontend_views_make_no_http_requests(self):
+        """Test page renders go through the service layer instead of calling the API over HTTP."""
+        self.client.force_login(self.user_student)
+        with patch("requests.Session.request") as mock_request:
+            response = self.client.get(reverse("accommodation_detail", args=[self.accommodation.id]))
+        self.assertEqual(response.status_code, 200)
+        mock_request.assert_not_called()
+
     def test_accommodation_detail(self):
         """Test accommodation detail view."""
         self.client.force_login(self.user_student)
-        with patch("requests.get") as mock_get:
-            mock_get.return_value = MagicMock(
-                status_code=200,
-                json=lambda: {"id": self.accommodation.id, "title": "Test Apartment"}
-            )
-            response = self.client.get(reverse("accommodation_detail", args=[self.accommodation.id]))
+        response = self.client.get(reverse("accommodation_detail", args=[self.accommodation.id]))
         self.assertEqual(response.status_code, 200)
         self.assertIn("accommodation", response.context)
-        self.assertEqual(response.context["accommodation"]["id"], self.accommodation.id)
+        self.assertEqual(response.context["accommodation"].id, self.accommodation.id)
 
     def test_accommodation_detail_not_found(self):
         """Test accommodation detail view handles not found errors."""
         self.client.force_login(self.user_student)
-        with patch("requests.get") as mock_get:
-            mock_get.return_value = MagicMock(status_code=404)
-            response = self.client.get(reverse("accommodation_detail", args=[999]))
+        response = self.client.get(reverse("accommodation_detail", args=[999]))
         self.assertEqual(response.status_code, 302)
         self.assertEqual(response.url, reverse("accommodation_list"))
 
     def test_create_reservation_view_get(self):
         """Test GET request for create reservation view."""
         self.client.force_login(self.user_student)
-        with patch("requests.get") as mock_get:
-            mock_get.return_value = MagicMock(
-                status_code=200,
-                json=lambda: {"id": self.accommodation.id, "title": "Test Apartment"}
-            )
-            response = self.client.get(reverse("create_reservation") + f"?accommodation={self.accommodation.id}")
+        response = self.client.get(reverse("create_reservation") + f"?accommodation={self.accommodation.id}")
         self.assertEqual(response.status_code, 200)
         self.assertIn("form", response.context)
-        self.assertIn("accommodation", response.context)
+        self.assertEqual(response.context["accommodation"], self.accommodation)
 
     def test_create_reservation_view_post(self):
         """Test POST request for create reservation view."""
         self.client.force_login(self.user_student)
         data = {
+            "accommodation": self.accommodation.id,
             "start_date": date.today().isoformat(),
             "end_date": (date.today() + timedelta(days=10)).isoformat()
         }
-        with patch("requests.get") as mock_get, patch("requests.post") as mock_post:
-            mock_get.return_value = MagicMock(
-                status_code=200,
-                json=lambda: {"id": self.accommodation.id, "title": "Test Apartment"}
-            )
-            mock_post.return_value = MagicMock(status_code=201)
-            response = self.client.post(
-                reverse("create_reservation") + f"?accommodation={self.accommodation.id}",
-                data=data
-            )
+        response = self.client.post(
+            reverse("create_reservation") + f"?accommodation={self.accommodation.id}",
+            data=data
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, reverse("accommodation_list"))
+        self.assertEqual(Reservation.objects.filter(accommodation=self.accommodation).count(), 2)
+        outbox.drain()
+        self.assertEqual(mail.outbox[-1].to, ["accommodation@hku.hk"])
+
+    def test_create_reservation_view_post_fully_booked(self):
+        """Test create reservation view reports the API's capacity check."""
+        self.client.force_login(self.user_student)
+        Accommodation.objects.filter(pk=self.accommodation.pk).update(beds=1)
+        data = {
+            "accommodation": self.accommodation.id,
+            "start_date": date.today().isoformat(),
+            "end_date": (date.today() + timedelta(days=10)).isoformat()
+        }
+        response = self.client.post(
+            reverse("create_reservation") + f"?accommodation={self.accommodation.id}",
+            data=data
+        )
         self.assertEqual(response.status_code, 200)
+        self.assertEqual(Reservation.objects.filter(accommodation=self.accommodation).count(), 1)
 
     def test_create_reservation_view_post_invalid(self):
         """Test POST request with invalid data for create reservation view."""
@@ -644,15 +1848,10 @@ class UniHavenTests(TestCase):
             "start_date": (date.today() + timedelta(days=10)).isoformat(),
             "end_date": date.today().isoformat()
         }
-        with patch("requests.get") as mock_get:
-            mock_get.return_value = MagicMock(
-                status_code=200,
-                json=lambda: {"id": self.accommodation.id, "title": "Test Apartment"}
-            )
-            response = self.client.post(
-                reverse("create_reservation") + f"?accommodation={self.accommodation.id}",
-                data=data
-            )
+        response = self.client.post(
+            reverse("create_reservation") + f"?accommodation={self.accommodation.id}",
+            data=data
+        )
         self.assertEqual(response.status_code, 200)
         self.assertIn("form", response.context)
         self.assertFalse(response.context["form"].is_valid())
@@ -660,35 +1859,29 @@ class UniHavenTests(TestCase):
     def test_cancel_reservation_view(self):
         """Test cancel reservation view."""
         self.client.force_login(self.user_student)
-        with patch("requests.delete") as mock_delete:
-            mock_delete.return_value = MagicMock(status_code=204)
-            response = self.client.get(reverse("cancel_reservation", args=[self.reservation.id]))
+        response = self.client.get(reverse("cancel_reservation", args=[self.reservation.id]))
         self.assertEqual(response.status_code, 302)
         self.assertEqual(response.url, reverse("accommodation_list"))
-        self.assertEqual(len(mail.outbox), 1)
-        self.assertEqual(mail.outbox[0].subject, "UniHaven: Reservation Cancelled")
+        self.reservation.refresh_from_db()
+        self.assertEqual(self.reservation.status, "cancelled")
+        outbox.drain()
+        self.assertEqual(mail.outbox[-1].subject, "UniHaven: Reservation Cancelled")
 
     def test_cancel_reservation_view_error(self):
         """Test cancel reservation view handles errors."""
         self.client.force_login(self.user_student)
-        with patch("requests.delete") as mock_delete:
-            mock_delete.return_value = MagicMock(status_code=400)
-            response = self.client.get(reverse("cancel_reservation", args=[self.reservation.id]))
+        response = self.client.get(reverse("cancel_reservation", args=[999]))
         self.assertEqual(response.status_code, 302)
         self.assertEqual(response.url, reverse("accommodation_list"))
+        self.assertFalse(EmailOutbox.objects.exists())
 
     def test_rate_accommodation_view_get(self):
         """Test GET request for rate accommodation view."""
         self.client.force_login(self.user_student)
-        with patch("requests.get") as mock_get:
-            mock_get.return_value = MagicMock(
-                status_code=200,
-                json=lambda: {"id": self.accommodation.id, "title": "Test Apartment"}
-            )
-            response = self.client.get(reverse("rate_accommodation") + f"?accommodation={self.accommodation.id}")
+        response = self.client.get(reverse("rate_accommodation") + f"?accommodation={self.accommodation.id}")
         self.assertEqual(response.status_code, 200)
         self.assertIn("form", response.context)
-        self.assertIn("accommodation", response.context)
+        self.assertEqual(response.context["accommodation"], self.accommodation)
 
     def test_rate_accommodation_view_post(self):
         """Test POST request for rate accommodation view."""
@@ -698,15 +1891,11 @@ class UniHavenTests(TestCase):
             "value": 5,
             "comment": "Amazing!"
         }
-        with patch("requests.get") as mock_get, patch("requests.post") as mock_post:
-            mock_get.return_value = MagicMock(
-                status_code=200,
-                json=lambda: {"id": self.accommodation.id, "title": "Test Apartment"}
-            )
-            mock_post.return_value = MagicMock(status_code=201)
-            response = self.client.post(reverse("rate_accommodation"), data=data)
+        response = self.client.post(reverse("rate_accommodation"), data=data)
         self.assertEqual(response.status_code, 302)
         self.assertEqual(response.url, reverse("accommodation_list"))
+        self.accommodation.refresh_from_db()
+        self.assertEqual((self.accommodation.rating_sum, self.accommodation.rating_count), (9, 2))
 
     def test_create_accommodation_view_get(self):
         """Test GET request for create accommodation view."""
@@ -721,15 +1910,32 @@ class UniHavenTests(TestCase):
         response = self.client.get(reverse("create_accommodation"))
         self.assertEqual(response.status_code, 302)
 
+    def test_create_accommodation_view_post(self):
+        """Test a frontend POST stores the unit, coordinates and creator's university, and rejects a missing flat."""
+        self.client.force_login(self.user_staff)
+        data = {
+            "title": "Frontend Flat", "description": "A nice place", "property_type": "AP",
+            "price": "1500.00", "beds": 2, "bedrooms": 1, "address": "77 Form St, HK",
+            "flat_number": "3B", "floor_number": "12", "latitude": "22.284000", "longitude": "114.136000",
+            "available_from": date.today(), "available_to": date.today() + timedelta(days=30),
+        }
+        response = self.client.post(reverse("create_accommodation"), data=data)
+        self.assertEqual(response.status_code, 302)
+        acc = Accommodation.objects.get(title="Frontend Flat")
+        self.assertEqual((acc.flat_number, acc.floor_number), ("3B", "12"))
+        self.assertEqual((acc.latitude, acc.longitude), (Decimal("22.284000"), Decimal("114.136000")))
+        self.assertEqual(acc.universities_offered, ["HKU"])
+        self.assertIn(acc, services.accommodations_for(self.user_staff))
+
+        response = self.client.post(reverse("create_accommodation"), data={**data, "flat_number": "", "address": "78 Form St"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("flat_number", response.context["form"].errors)
+        self.assertFalse(Accommodation.objects.filter(address="78 Form St").exists())
+
     def test_view_all_reservations(self):
         """Test view all reservations for staff."""
         self.client.force_login(self.user_staff)
-        with patch("requests.get") as mock_get:
-            mock_get.return_value = MagicMock(
-                status_code=200,
-                json=lambda: [{"id": self.reservation.id, "status": "pending"}]
-            )
-            response = self.client.get(reverse("view_reservations"))
+        response = self.client.get(reverse("view_reservations"))
         self.assertEqual(response.status_code, 200)
         self.assertIn("reservations", response.context)
         self.assertEqual(len(response.context["reservations"]), 1)
@@ -737,34 +1943,25 @@ class UniHavenTests(TestCase):
     def test_cedars_cancel_reservation(self):
         """Test staff cancelling a reservation."""
         self.client.force_login(self.user_staff)
-        with patch("requests.delete") as mock_delete:
-            mock_delete.return_value = MagicMock(status_code=204)
-            response = self.client.get(reverse("cedars_cancel_reservation", args=[self.reservation.id]))
+        response = self.client.get(reverse("cedars_cancel_reservation", args=[self.reservation.id]))
         self.assertEqual(response.status_code, 302)
         self.assertEqual(response.url, reverse("view_reservations"))
+        self.reservation.refresh_from_db()
+        self.assertEqual(self.reservation.status, "cancelled")
 
     def test_my_reservations_view(self):
         """Test student's my reservations view."""
         self.client.force_login(self.user_student)
-        with patch("requests.get") as mock_get:
-            mock_get.return_value = MagicMock(
-                status_code=200,
-                json=lambda: [{"id": self.reservation.id, "status": "completed", "end_date": date.today().isoformat()}]
-            )
-            response = self.client.get(reverse("my_reservations"))
+        Reservation.objects.filter(pk=self.reservation.pk).update(status="completed")
+        response = self.client.get(reverse("my_reservations"))
         self.assertEqual(response.status_code, 200)
         self.assertIn("reservations", response.context)
-        self.assertTrue(response.context["reservations"][0]["can_rate"])
+        self.assertTrue(response.context["reservations"][0].can_rate)
 
     def test_view_all_ratings(self):
         """Test view all ratings for staff."""
         self.client.force_login(self.user_staff)
-        with patch("requests.get") as mock_get:
-            mock_get.return_value = MagicMock(
-                status_code=200,
-                json=lambda: [{"id": self.rating.id, "value": 4}]
-            )
-            response = self.client.get(reverse("view_all_ratings"))
+        response = self.client.get(reverse("view_all_ratings"))
         self.assertEqual(response.status_code, 200)
         self.assertIn("ratings", response.context)
         self.assertEqual(len(response.context["ratings"]), 1)
@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from api.viewsets import AccommodationViewSet, ReservationViewSet, RatingViewSet
-from api.views import AccommodationFilterView, ReservationFilterView, ReservationCancelView, MeView
+from api.views import AccommodationFilterView, AccommodationAvailabilityView, AccommodationImportView, ReservationFilterView, ReservationExportView, RatingExportView, ReservationCancelView, MeView
 
 router = DefaultRouter()
 router.register(r'accommodations', AccommodationViewSet)
@@ -10,7 +10,11 @@ router.register(r'ratings', RatingViewSet)
 
 urlpatterns = [
     path("accommodations/filter/", AccommodationFilterView.as_view(), name="accommodation-filter"),
+    path("accommodations/availability/", AccommodationAvailabilityView.as_view(), name="accommodation-availability"),
+    path("accommodations/import/", AccommodationImportView.as_view(), name="accommodation-import"),
     path("reservations/filter/", ReservationFilterView.as_view(), name="reservation-filter"),
+    path("reservations/export/", ReservationExportView.as_view(), name="reservation-export"),
+    path("ratings/export/", RatingExportView.as_view(), name="rating-export"),
     path("reservations/<int:pk>/cancel/", ReservationCancelView.as_view(), name="reservation-cancel"),
     path("me/", MeView.as_view(), name="me-view"),
     path('', include(router.urls)),
@@ -2,18 +2,28 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.authentication import TokenAuthentication, SessionAuthentication
-from django.db.models import Q
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.parsers import MultiPartParser
+from django.db.models import F, Q, FilteredRelation, Value
+from django.db.models.functions import Coalesce
 from django.shortcuts import get_object_or_404
 import math
 from datetime import datetime
 
-from api.models import Reservation, Accommodation, LOCATIONS
+from api.models import Reservation, Rating, Accommodation, LOCATIONS, DISTANCE_ENGINE
+from api import availability, export, importer, services, spatial
+from api import cache as filter_cache
+from api.pagination import KeysetPagination
+from api.queries import OptimizedQuerysetMixin
+from users.principal import CachedTokenAuthentication
 from api.serializers import AccommodationSerializer, ReservationSerializer
 
+# Sort key for listings that have no coordinates yet, so they page after every geocoded one
+UNRANKED_KM = 1e9
+
 class MeView(APIView):
     permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication, SessionAuthentication]
+    authentication_classes = [CachedTokenAuthentication, SessionAuthentication]
 
     def get(self, request):
         user = request.user
@@ -22,16 +32,11 @@ class MeView(APIView):
             "role": "staff"
         })
 
-class AccommodationFilterView(APIView):
+class AccommodationFilterView(OptimizedQuerysetMixin, APIView):
     permission_classes = [IsAuthenticated]
-
-    def calculate_distance(self, lat1, lon1, lat2, lon2):
-        from math import radians, cos, sqrt
-        lat1, lon1, lat2, lon2 = map(float, [lat1, lon1, lat2, lon2])
-        x = radians(lon2 - lon1) * cos(radians((lat1 + lat2) / 2))
-        y = radians(lat2 - lat1)
-        distance = 6371 * sqrt(x * x + y * y)  # in km
-        return round(distance, 2)
+    keyset_fields = ('id', 'created_at', 'price')
+    serializer_class = AccommodationSerializer
+    select_related_fields = ('created_by',)
 
     def get_university_from_request(self, request):
         if request.user and request.user.is_authenticated:
@@ -44,11 +49,20 @@ class AccommodationFilterView(APIView):
         if not user_university:
             return Response({"error": "University context is missing."}, status=403)
 
-        accommodations = Accommodation.objects.filter(
+        key = filter_cache.filter_key(user_university, f"{request.scheme}://{request.get_host()}", request.GET)
+        data, status_code = filter_cache.get_or_build(key, lambda: self.build(request, user_university))
+        return Response(data, status=status_code)
+
+    def build(self, request, user_university):
+        """((payload, status), cacheable) for one filter request; only successful pages are cached."""
+        response = self.filter(request, user_university)
+        return (response.data, response.status_code), response.status_code == 200
+
+    def filter(self, request, user_university):
+        accommodations = self.optimize_queryset(Accommodation.objects.offered_to_university(user_university)).filter(
             is_available=True,
             reserved=False,
-            universities_offered__name=user_university
-        ).distinct()
+        )
 
         property_type = request.GET.get("property_type")
         if property_type:
@@ -68,55 +82,215 @@ class AccommodationFilterView(APIView):
                 return Response({"error": "Invalid date format. Use YYYY-MM-DD."}, status=400)
 
         min_beds = request.GET.get("min_beds")
-        if min_beds:
-            accommodations = accommodations.filter(beds__gte=int(min_beds))
-
         min_bedrooms = request.GET.get("min_bedrooms")
-        if min_bedrooms:
-            accommodations = accommodations.filter(bedrooms__gte=int(min_bedrooms))
+        try:
+            min_beds = int(min_beds) if min_beds else None
+            min_bedrooms = int(min_bedrooms) if min_bedrooms else None
+        except ValueError:
+            return Response({"error": "min_beds and min_bedrooms must be integers."}, status=400)
+        if min_beds is not None:
+            accommodations = accommodations.filter(beds__gte=min_beds)
+        if min_bedrooms is not None:
+            accommodations = accommodations.filter(bedrooms__gte=min_bedrooms)
 
         min_price = request.GET.get("min_price")
         max_price = request.GET.get("max_price")
         if min_price and max_price:
-            accommodations = accommodations.filter(
-                price__gte=float(min_price), price__lte=float(max_price)
-            )
+            try:
+                min_price, max_price = float(min_price), float(max_price)
+            except ValueError:
+                min_price = max_price = None
+            if min_price is None or not (math.isfinite(min_price) and math.isfinite(max_price)):
+                return Response({"error": "min_price and max_price must be numbers."}, status=400)
+            accommodations = accommodations.filter(price__gte=min_price, price__lte=max_price)
 
         campus_label = request.GET.get("campus_label")
         max_distance = request.GET.get("max_distance")
-        if campus_label and campus_label in LOCATIONS:
-            base_lat, base_lng = LOCATIONS[campus_label]
-            accommodations = sorted(
-                accommodations,
-                key=lambda acc: self.calculate_distance(base_lat, base_lng, float(acc.latitude), float(acc.longitude))
-                if acc.latitude and acc.longitude else float('inf')
-            )
-            if max_distance:
+        if max_distance:
+            try:
                 max_distance = float(max_distance)
-                accommodations = [
-                    acc for acc in accommodations
-                    if self.calculate_distance(base_lat, base_lng, float(acc.latitude), float(acc.longitude)) <= max_distance
-                ]
+            except ValueError:
+                max_distance = -1.0
+            if not (math.isfinite(max_distance) and max_distance >= 0):
+                return Response({"error": "max_distance must be a non-negative number."}, status=400)
+        else:
+            max_distance = None
+        limit = request.GET.get("limit")
+        if limit:
+            try:
+                limit = int(limit)
+            except ValueError:
+                limit = 0
+            if limit < 1:
+                return Response({"error": "limit must be a positive integer."}, status=400)
+        else:
+            limit = None
+        origin = None
+        if campus_label and campus_label.startswith(f"{user_university} - ") and campus_label in LOCATIONS:
+            # Every geocoded listing offered to this university has a CampusDistance row for
+            # each of its campuses, so sorting and the radius filter run as one indexed query.
+            self.keyset_fields = ('distance_km',) + self.keyset_fields
+            accommodations = accommodations.annotate(
+                campus_row=FilteredRelation('distances', condition=Q(distances__campus=campus_label)),
+                distance_km=Coalesce(F('campus_row__km'), Value(UNRANKED_KM)),
+            )
+            if max_distance is not None:
+                accommodations = accommodations.filter(distance_km__lte=max_distance)
+        elif campus_label and campus_label in LOCATIONS:
+            origin = LOCATIONS[campus_label]
+        elif request.GET.get("lat") and request.GET.get("lon"):
+            try:
+                origin = (float(request.GET["lat"]), float(request.GET["lon"]))
+            except ValueError:
+                return Response({"error": "lat and lon must be numbers."}, status=400)
+
+        if origin is not None:
+            if max_distance is not None:
+                ranked = spatial.within_radius(accommodations, *origin, max_distance, limit=limit)
+            elif limit is not None:
+                ranked = spatial.nearest(accommodations, *origin, limit)
+            else:
+                rows = accommodations.filter(latitude__isnull=False, longitude__isnull=False)
+                ranked = DISTANCE_ENGINE.rank(origin, list(rows.values_list('id', 'latitude', 'longitude')))
+            if max_distance is None and (limit is None or len(ranked) < limit):
+                # Listings still waiting on a geocode go last, as before
+                missing = accommodations.filter(Q(latitude__isnull=True) | Q(longitude__isnull=True))
+                ranked += [(pk, UNRANKED_KM) for pk in missing.values_list('id', flat=True)]
+                if limit is not None:
+                    ranked = ranked[:limit]
+            self.keyset_fields = ('distance_km',)
+            paginator = KeysetPagination()
+            page = paginator.paginate_queryset(ranked, request, self)
+            by_id = self.optimize_queryset(Accommodation.objects.all()).in_bulk([pk for pk, km in page])
+            accommodations = [by_id[pk] for pk, km in page]
+        else:
+            paginator = KeysetPagination()
+            if limit is not None:
+                # The first `limit` rows in the requested order; pages then walk only those, like ranked[:limit] above
+                field, descending = paginator.get_ordering(request, self)
+                prefix = '-' if descending else ''
+                first = accommodations.order_by(f'{prefix}{field}', f'{prefix}id').values_list('id', flat=True)[:limit]
+                accommodations = accommodations.filter(id__in=list(first))
+            accommodations = paginator.paginate_queryset(accommodations, request, self)
 
-        serializer = AccommodationSerializer(accommodations, many=True)
-        return Response(serializer.data)
+        serializer = self.serializer_class(accommodations, many=True)
+        return paginator.get_paginated_response(serializer.data)
     
-class ReservationFilterView(APIView):
+class AccommodationAvailabilityView(APIView):
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [CachedTokenAuthentication, SessionAuthentication]
+
+    def get(self, request):
+        try:
+            start = datetime.strptime(request.GET["start"], "%Y-%m-%d").date()
+            end = datetime.strptime(request.GET["end"], "%Y-%m-%d").date()
+        except (KeyError, ValueError):
+            return Response({"error": "start and end are required. Use YYYY-MM-DD."}, status=400)
+        if end <= start:
+            return Response({"error": "end must be after start."}, status=400)
+
+        listings = services.accommodations_for(request.user).order_by('id')
+        ids = request.GET.get("ids")
+        if ids:
+            try:
+                listings = listings.filter(id__in=[int(pk) for pk in ids.split(",")])
+            except ValueError:
+                return Response({"error": "ids must be a comma-separated list of integers."}, status=400)
+        paginator = KeysetPagination()
+        # Pages default to the largest size so a short `ids` list comes back whole; `next` links the rest
+        paginator.page_size = paginator.max_page_size
+        page = paginator.paginate_queryset(listings.only('id', 'beds'), request, self)
+        beds = {listing.pk: listing.beds for listing in page}
+
+        free = availability.free_beds_many(beds, start, end)
+        results = [{"id": pk, "beds": beds[pk], "free_beds": free[pk]} for pk in beds]
+        if request.GET.get("nightly"):
+            nightly = availability.nightly_free_beds_many(beds, start, end)
+            for row in results:
+                row["nights"] = {night.isoformat(): count for night, count in nightly[row["id"]]}
+        response = paginator.get_paginated_response(results)
+        return Response({"start": start, "end": end, **response.data})
+
+class AccommodationImportView(APIView):
+    """CEDARS staff upload a CSV or NDJSON file of listings in one request."""
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [CachedTokenAuthentication, SessionAuthentication]
+    parser_classes = [MultiPartParser]
+    max_reported_errors = 100
+
+    def post(self, request):
+        user = request.user
+        if not (user.is_cedars_staff or user.is_superuser):
+            return Response({'detail': 'Only CEDARS staff can import accommodations.'}, status=status.HTTP_403_FORBIDDEN)
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'Upload the listings as "file".'}, status=400)
+        fmt = request.data.get('format') or importer.detect_format(upload.name)
+        if fmt not in importer.FORMATS:
+            return Response({'error': f"format must be one of {', '.join(importer.FORMATS)}."}, status=400)
+
+        errors = []
+
+        def report(line, row_errors):
+            if len(errors) < self.max_reported_errors:
+                errors.append({'line': line, 'errors': row_errors})
+
+        summary = importer.import_file(upload, user, fmt=fmt, on_error=report)
+        return Response({**summary, 'error_report': errors}, status=status.HTTP_201_CREATED if summary['created'] else 200)
+
+class ExportView(APIView):
+    """Stream every row of `model` as NDJSON (default) or CSV. Staff only; `?output=csv&from=&to=&university=`."""
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [CachedTokenAuthentication, SessionAuthentication]
+    model = None
+    fields = ()
+    filename = ''
+
+    def get(self, request):
+        user = request.user
+        if not (user.is_cedars_staff or user.is_superuser):
+            return Response({'detail': 'Only CEDARS staff can export data.'}, status=status.HTTP_403_FORBIDDEN)
+        fmt = request.GET.get('output', 'ndjson')
+        if fmt not in export.FORMATS:
+            return Response({'error': f"output must be one of {', '.join(export.FORMATS)}."}, status=400)
+        # Staff export their own university; superusers may pick one or take everything
+        university = request.GET.get('university') if user.is_superuser else user.university
+        try:
+            rows = export.filter_range(
+                self.model.objects.all(), request.GET.get('from'), request.GET.get('to'), university
+            )
+        except ValueError:
+            return Response({'error': 'Invalid date format. Use YYYY-MM-DD.'}, status=400)
+        return export.stream(rows, self.fields, fmt, self.filename)
+
+class ReservationExportView(ExportView):
+    model = Reservation
+    fields = export.RESERVATION_FIELDS
+    filename = 'reservations'
+
+class RatingExportView(ExportView):
+    model = Rating
+    fields = export.RATING_FIELDS
+    filename = 'ratings'
+
+class ReservationFilterView(OptimizedQuerysetMixin, APIView):
     permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication, SessionAuthentication]
+    authentication_classes = [CachedTokenAuthentication, SessionAuthentication]
+    serializer_class = ReservationSerializer
+    select_related_fields = ('created_by',)
 
     def get(self, request):
         user = request.user
-        reservations = Reservation.objects.filter(created_by__university=user.university)
-        serializer = ReservationSerializer(reservations, many=True)
+        reservations = self.optimize_queryset(Reservation.objects.filter(created_by__university=user.university))
+        serializer = self.serializer_class(reservations, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 class ReservationCancelView(APIView):
     permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication, SessionAuthentication]
+    authentication_classes = [CachedTokenAuthentication, SessionAuthentication]
 
     def delete(self, request, pk):
-        reservation = get_object_or_404(Reservation, pk=pk)
+        reservation = get_object_or_404(Reservation.objects.select_related('created_by'), pk=pk)
         user = request.user
 
         if reservation.created_by.university == user.university:
@@ -1,99 +1,62 @@
 from rest_framework import viewsets, status
 from rest_framework.response import Response
-from rest_framework.exceptions import PermissionDenied
-from django.core.mail import send_mail
-from django.conf import settings
-from django.db.models import Avg
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.authentication import TokenAuthentication, SessionAuthentication
+from rest_framework.authentication import SessionAuthentication
 from api.models import Accommodation, Reservation, Rating
 from api.serializers import AccommodationSerializer, ReservationSerializer, RatingSerializer
+from api import services
+from api.conditional import ConditionalMixin
+from api.queries import OptimizedQuerysetMixin
+from users.principal import CachedTokenAuthentication
 
 
-class AccommodationViewSet(viewsets.ModelViewSet):
+class AccommodationViewSet(OptimizedQuerysetMixin, ConditionalMixin, viewsets.ModelViewSet):
     queryset = Accommodation.objects.all()
     serializer_class = AccommodationSerializer
-    authentication_classes = [TokenAuthentication, SessionAuthentication]
+    authentication_classes = [CachedTokenAuthentication, SessionAuthentication]
     permission_classes = [IsAuthenticated]
+    keyset_fields = ('id', 'created_at', 'price')
+    select_related_fields = ('created_by',)
 
     def get_queryset(self):
-        user = self.request.user
-        all_accommodations = Accommodation.objects.all()
-        return [acc for acc in all_accommodations if user.university in acc.universities_offered]
-
+        return self.optimize_queryset(services.accommodations_for(self.request.user))
 
     def perform_create(self, serializer):
-        data = serializer.validated_data
-        existing = Accommodation.objects.filter(
-            address=data.get('address'),
-            flat_number=data.get('flat_number'),
-            floor_number=data.get('floor_number'),
-            room_number=data.get('room_number')
-        )
-        if existing.exists():
-            raise PermissionDenied("Duplicate accommodation entry.")
-
-        serializer.save(created_by=self.request.user)
+        serializer.instance = services.create_accommodation(self.request.user, serializer.validated_data)
 
     def perform_destroy(self, instance):
         instance.delete()
 
-    def perform_update(self, serializer):
-        serializer.save()
-
-class ReservationViewSet(viewsets.ModelViewSet):
+class ReservationViewSet(OptimizedQuerysetMixin, viewsets.ModelViewSet):
     queryset = Reservation.objects.all()
     serializer_class = ReservationSerializer
     permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication, SessionAuthentication]
+    authentication_classes = [CachedTokenAuthentication, SessionAuthentication]
+    keyset_fields = ('id', 'created_at')
+    select_related_fields = ('created_by',)
 
     def get_queryset(self):
-        user = self.request.user
-        return Reservation.objects.filter(created_by__university=user.university)
+        return self.optimize_queryset(services.reservations_for(self.request.user))
 
     def perform_create(self, serializer):
-        user = self.request.user
-        accommodation = serializer.validated_data['accommodation']
-
-        if user.university not in accommodation.universities_offered:
-            raise PermissionDenied("You can only reserve accommodations offered to your university.")
-
-        active_reservations = Reservation.objects.filter(
-            accommodation=accommodation,
-            status__in=['pending', 'confirmed']
-        ).count()
+        serializer.instance = services.create_reservation(self.request.user, serializer.validated_data)
 
-        if active_reservations >= accommodation.beds:
-            raise PermissionDenied("This accommodation is fully booked.")
-
-        serializer.save(created_by=user)
-        self.notify_staff(accommodation, serializer.validated_data['student_name'], cancelled=False)
+    def perform_update(self, serializer):
+        serializer.instance = services.update_reservation(self.request.user, serializer.instance, serializer.validated_data)
 
     def perform_destroy(self, instance):
-        instance.status = 'cancelled'
-        instance.save()
-        self.notify_staff(instance.accommodation, instance.student_name, cancelled=True)
-
-    def notify_staff(self, accommodation, student_name, cancelled=False):
-        subject = f"Reservation {'Cancelled' if cancelled else 'Created'} - {accommodation.title}"
-        message = (
-            f"Reservation for {student_name} has been {'cancelled' if cancelled else 'created'} for {accommodation.title}\n"
-            f"University: {self.request.user.university}"
-        )
-        uni_email = f"accommodation@{self.request.user.university.lower()}.hk"
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[uni_email],
-            fail_silently=True,
-        )
+        services.cancel_reservation(self.request.user, instance)
 
-class RatingViewSet(viewsets.ModelViewSet):
+class RatingViewSet(OptimizedQuerysetMixin, viewsets.ModelViewSet):
     queryset = Rating.objects.all()
     serializer_class = RatingSerializer
     permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication, SessionAuthentication]
+    authentication_classes = [CachedTokenAuthentication, SessionAuthentication]
+    keyset_fields = ('id', 'created_at')
+    select_related_fields = ('created_by',)
+
+    def get_queryset(self):
+        return self.optimize_queryset(services.ratings_for(self.request.user))
 
     def create(self, request, *args, **kwargs):
         user = request.user
@@ -101,11 +64,6 @@ class RatingViewSet(viewsets.ModelViewSet):
 
         serializer = self.get_serializer(data=data)
         serializer.is_valid(raise_exception=True)
-        rating = serializer.save(created_by=user)
-
-        acc = rating.accommodation
-        avg = acc.ratings.aggregate(avg=Avg('value'))['avg'] or 0
-        acc.rating = round(avg, 2)
-        acc.save()
+        serializer.instance = services.create_rating(user, serializer.validated_data)
 
         return Response(serializer.data, status=status.HTTP_201_CREATED)
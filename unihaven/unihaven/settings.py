@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+import sys
+import tempfile
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -29,7 +31,18 @@ SECRET_KEY = "django-insecure-7&vn1^yp1#7tbuit7^9g(f+ph1s1x!7t5)v^ppjusciq9mtn6c
 DEBUG = True
 
 ALLOWED_HOSTS = []
-API_BASE_URL = 'http://127.0.0.1:8000/api/'
+
+# ALS geocoding runs in the background (manage.py process_geocode_queue)
+GEOCODE_MAX_ATTEMPTS = 5
+GEOCODE_RETRY_BASE_SECONDS = 30
+GEOCODE_CACHE_TTL = 30 * 24 * 3600  # seconds
+ALS_TIMEOUT = 10
+ALS_BREAKER_THRESHOLD = 5  # consecutive failures before ALS calls are skipped
+ALS_BREAKER_RESET_SECONDS = 30
+
+# Reservation inserts retry this many times when the database reports lock contention
+RESERVATION_RETRIES = 5
+RESERVATION_RETRY_SECONDS = 0.02
 
 
 
@@ -134,12 +147,31 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.TokenAuthentication",
+        "users.principal.CachedTokenAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
+    "DEFAULT_PAGINATION_CLASS": "api.pagination.KeysetPagination",
+    "PAGE_SIZE": 20,
+}
+API_MAX_PAGE_SIZE = 100
+
+# Filter responses are cached per university and invalidated by every process
+# that writes, management commands included, so the backend must be shared
+# between processes. The file cache is shared on one host; use Redis or
+# Memcached across hosts. With a process-local backend (LocMemCache,
+# DummyCache) the filter cache is disabled. `manage.py test` clears the cache
+# between tests, so it gets a directory and key prefix of its own.
+TESTING = len(sys.argv) > 1 and sys.argv[1] == "test"
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.path.join(tempfile.gettempdir(), "unihaven-test-cache" if TESTING else "unihaven-cache"),
+        "KEY_PREFIX": "test" if TESTING else "",
+    }
 }
+FILTER_CACHE_TTL = 300
 
 
 
@@ -147,4 +179,17 @@ REST_FRAMEWORK = {
 # we will test email by printing it to console
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = BASE_DIR / "emails"  # or any folder you want
-DEFAULT_FROM_EMAIL = 'noreply@unihaven.hk'
\ No newline at end of file
+DEFAULT_FROM_EMAIL = 'noreply@unihaven.hk'
+
+# Notifications are queued in EmailOutbox and sent by `manage.py send_outbox`
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_BASE_SECONDS = 60
+
+# Estimated title/description similarity at which `manage.py find_duplicates` flags a listing
+NEAR_DUPLICATE_THRESHOLD = 0.7
+
+# Session logins and API tokens resolve users through a cached principal record
+AUTHENTICATION_BACKENDS = ["users.principal.CachedModelBackend"]
+# Seconds a token or user stays cached; saves and deletes drop it sooner. Like the
+# filter cache this needs a shared CACHES backend and is skipped without one
+PRINCIPAL_CACHE_TTL = 300
\ No newline at end of file
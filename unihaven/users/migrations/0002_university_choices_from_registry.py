@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:14
+
+import api.registry
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='staffprofile',
+            name='university',
+            field=models.CharField(choices=api.registry.university_choices, default='HKU', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='studentprofile',
+            name='university',
+            field=models.CharField(choices=api.registry.university_choices, default='HKU', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='university',
+            field=models.CharField(choices=api.registry.university_choices, default='HKU', max_length=10),
+        ),
+    ]
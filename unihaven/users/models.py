@@ -4,11 +4,10 @@ from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
 import uuid
 
-UNIVERSITY_CHOICES = [
-    ('HKU', 'The University of Hong Kong'),
-    ('CUHK', 'The Chinese University of Hong Kong'),
-    ('HKUST', 'The Hong Kong University of Science and Technology'),
-]
+from api.registry import university_choices
+
+# Read from api/data/universities.json through the registry
+UNIVERSITY_CHOICES = university_choices
 
 class User(AbstractUser):
     UID = models.CharField(max_length=10, blank=True)
@@ -49,26 +48,32 @@ class User(AbstractUser):
         return self.is_cedars_staff
 
     def can_make_reservations(self):
-        return self.is_student and hasattr(self, 'student_profile')
+        return self.is_student and self.get_user_role() == 'student'
 
     def can_view_dashboard(self):
         return self.is_cedars_staff
 
     def get_user_role(self):
-        if hasattr(self, 'student_profile'):
-            return 'student'
-        elif hasattr(self, 'staff_profile'):
-            return 'staff'
-        elif hasattr(self, 'admin_profile'):
-            return 'admin'
-        return 'unknown'
+        # Users resolved through users.principal already carry their role
+        role = getattr(self, '_principal_role', None)
+        if role is not None:
+            return role
+        roles = self.profile_roles()
+        return roles[0] if roles else 'unknown'
+
+    def profile_roles(self):
+        from users.principal import profile_roles
+        return profile_roles(self.pk) if self.pk else []
+
+    def get_session_auth_hash(self):
+        # Cached principals carry the HMAC instead of the password; a changed password is loaded and rehashed
+        cached = getattr(self, '_session_auth_hash', None)
+        if cached and 'password' in self.get_deferred_fields():
+            return cached
+        return super().get_session_auth_hash()
 
     def clean(self):
-        role_count = sum([
-            hasattr(self, 'student_profile'),
-            hasattr(self, 'staff_profile'),
-            hasattr(self, 'admin_profile')
-        ])
+        role_count = len(self.profile_roles())
         if role_count > 1:
             raise ValidationError("A user can only have one profile role (student, staff, admin).")
 
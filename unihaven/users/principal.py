@@ -0,0 +1,138 @@
+"""Cached authenticated principals.
+
+Resolving who is calling normally costs a token lookup joined to User (or a
+User fetch for session requests) plus up to three profile queries to work out
+the role. Here the token is mapped to a user id, and the user id to a compact
+record (identity, university, role flags, role), both in the Django cache for
+PRINCIPAL_CACHE_TTL seconds. A hit rebuilds the User with only those columns
+loaded, so anything else is fetched lazily and save() only writes what was
+loaded.
+
+Entries are dropped when a token is deleted, a user is saved or deleted, or a
+profile changes (see users/signals.py); the TTL bounds staleness after bulk
+updates that skip signals. Revoking a token or deactivating a user has to
+reach every worker at once, so with a process-local cache backend nothing is
+cached and every request reads the database. CachedTokenAuthentication serves the API and
+CachedModelBackend serves session logins for the HTML frontend.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Exists, OuterRef
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from api.cache import is_shared
+from users.models import AdminProfile, StaffProfile, StudentProfile, User
+
+PRINCIPAL_CACHE_TTL = getattr(settings, 'PRINCIPAL_CACHE_TTL', 300)
+PRINCIPAL_FIELDS = (
+    'id', 'username', 'email', 'first_name', 'last_name', 'UID', 'university',
+    'is_student', 'is_cedars_staff', 'is_staff', 'is_superuser', 'is_active',
+)
+# from_db() expects loaded values in concrete field order
+LOADED_FIELDS = [f.attname for f in User._meta.concrete_fields if f.attname in PRINCIPAL_FIELDS]
+PROFILES = (('student', StudentProfile), ('staff', StaffProfile), ('admin', AdminProfile))
+
+
+def token_key(key):
+    return f"principal:token:{key}"
+
+
+def user_key(user_id):
+    return f"principal:user:{user_id}"
+
+
+def with_roles(queryset):
+    """Annotate has_<role> for every profile type, so roles cost one query instead of one per hasattr()."""
+    return queryset.annotate(**{
+        f"has_{role}": Exists(model.objects.filter(user=OuterRef('pk'))) for role, model in PROFILES
+    })
+
+
+def role_from(flags):
+    return next((role for role, model in PROFILES if flags.get(f"has_{role}")), 'unknown')
+
+
+def profile_roles(user_id):
+    """[role] for every profile the user has, in one query."""
+    flags = with_roles(User.objects.filter(pk=user_id)).values(*(f"has_{role}" for role, model in PROFILES)).first()
+    return [role for role, model in PROFILES if flags and flags[f"has_{role}"]]
+
+
+def load(user_id):
+    """The cacheable record for a user, or None if there is no such user."""
+    row = with_roles(User.objects.filter(pk=user_id)).values(
+        *LOADED_FIELDS, 'password', *(f"has_{role}" for role, model in PROFILES)
+    ).first()
+    if row is None:
+        return None
+    record = {name: row[name] for name in LOADED_FIELDS}
+    record['role'] = role_from(row)
+    # Session checks only need the password's HMAC, so the hash itself is never cached
+    record['session_hash'] = User(password=row['password']).get_session_auth_hash()
+    return record
+
+
+def build(record):
+    user = User.from_db(DEFAULT_DB_ALIAS, LOADED_FIELDS, [record[name] for name in LOADED_FIELDS])
+    user._principal_role = record['role']
+    user._session_auth_hash = record['session_hash']
+    return user
+
+
+def get_user(user_id):
+    """User with the principal columns loaded, from the cache when possible; None if it does not exist."""
+    shared = is_shared()
+    record = cache.get(user_key(user_id)) if shared else None
+    if record is None:
+        record = load(user_id)
+        if record is None:
+            return None
+        if shared:
+            cache.set(user_key(user_id), record, PRINCIPAL_CACHE_TTL)
+    return build(record)
+
+
+def get_user_for_token(key):
+    shared = is_shared()
+    user_id = cache.get(token_key(key)) if shared else None
+    if user_id is None:
+        user_id = Token.objects.filter(key=key).values_list('user_id', flat=True).first()
+        if user_id is None:
+            return None
+        if shared:
+            cache.set(token_key(key), user_id, PRINCIPAL_CACHE_TTL)
+    return get_user(user_id)
+
+
+def forget_token(key):
+    cache.delete(token_key(key))
+
+
+def forget_user(user_id):
+    cache.delete(user_key(user_id))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication that resolves the token and user from the principal cache."""
+
+    def authenticate_credentials(self, key):
+        user = get_user_for_token(key)
+        if user is None:
+            raise exceptions.AuthenticationFailed('Invalid token.')
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        # DRF hands the token back as request.auth; only its key is known without a query
+        token = Token(key=key, user_id=user.pk)
+        token._state.adding = False
+        return user, token
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend whose per-request get_user() for session logins reads the principal cache."""
+
+    def get_user(self, user_id):
+        user = get_user(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
@@ -1,7 +1,8 @@
 # signals.py
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import User, StudentProfile, StaffProfile
+from .models import User, StudentProfile, StaffProfile, AdminProfile
+from . import principal
 from rest_framework.authtoken.models import Token
 from django.conf import settings
 
@@ -24,4 +25,23 @@ def create_user_profile(sender, instance, created, **kwargs):
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_auth_token(sender, instance=None, created=False, **kwargs):
     if created:
-        Token.objects.get_or_create(user=instance)
\ No newline at end of file
+        Token.objects.get_or_create(user=instance)
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_principal(sender, instance, **kwargs):
+    principal.forget_user(instance.pk)
+
+@receiver(post_save, sender=StudentProfile)
+@receiver(post_delete, sender=StudentProfile)
+@receiver(post_save, sender=StaffProfile)
+@receiver(post_delete, sender=StaffProfile)
+@receiver(post_save, sender=AdminProfile)
+@receiver(post_delete, sender=AdminProfile)
+def forget_principal_role(sender, instance, **kwargs):
+    principal.forget_user(instance.user_id)
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def forget_token(sender, instance, **kwargs):
+    principal.forget_token(instance.key)